@@ -0,0 +1,316 @@
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException
+from pydantic import BaseModel
+from starlette.concurrency import run_in_threadpool
+
+from app.core.admission import admission
+from app.core.diagnostics import HeapGrouping, heap_tracer, process_memory, python_heap, require_diagnostics_access
+from app.core.quotas import quota_registry
+from app.services.archive import delete_archive, describe_archive, list_archives
+from app.services.datasets import delete_dataset, describe_dataset, list_datasets
+from app.services.dedup import dedup_indexes
+from app.services.browser_pool import browser_pool
+from app.services.concurrency import adaptive_concurrency
+from app.services.crawler import browser_sessions
+from app.services.resilience import circuit_breakers
+from app.services.render_routing import RenderMode, render_router
+
+router = APIRouter(
+    prefix="/admin",
+    tags=["admin"],
+    responses={404: {"description": "Not found"}},
+)
+
+class RenderRoutingOverride(BaseModel):
+    pattern: str  # Domain or path prefix, e.g. "example.com" or "example.com/blog"
+    mode: RenderMode
+
+class HeapTracingOptions(BaseModel):
+    frames: Optional[int] = None     # Stack depth per allocation, defaults to DIAGNOSTICS_TRACE_FRAMES
+    seconds: Optional[float] = None  # Stop after this long, at most DIAGNOSTICS_TRACE_MAX_SECONDS
+
+class HeapSnapshotOptions(BaseModel):
+    label: Optional[str] = None
+    limit: int = 25  # Largest allocation sites returned with the snapshot
+
+@router.get("/render-routing")
+async def get_render_routing():
+    """
+    Inspect the learned static-vs-browser routing table and any overrides
+    """
+    return {
+        "status": "success",
+        "entries": render_router.snapshot()
+    }
+
+@router.put("/render-routing")
+async def set_render_routing_override(override: RenderRoutingOverride):
+    """
+    Pin a domain or path prefix to the static or browser path.
+    Setting mode to "auto" removes the override and goes back to learning.
+    """
+    render_router.set_override(override.pattern, override.mode)
+    await run_in_threadpool(render_router.flush)
+    return {
+        "status": "success",
+        "pattern": override.pattern,
+        "mode": override.mode
+    }
+
+@router.delete("/render-routing/{pattern:path}")
+async def delete_render_routing_entry(pattern: str):
+    """
+    Forget everything learned for a prefix, including its override
+    """
+    if not render_router.forget(pattern):
+        raise HTTPException(status_code=404, detail=f"No routing entry for '{pattern}'")
+    await run_in_threadpool(render_router.flush)
+    return {"status": "success", "pattern": pattern}
+
+@router.get("/admission")
+async def get_admission():
+    """
+    Browser session budget: active and queued sessions, queue wait times,
+    rejections by reason and the memory check
+    """
+    return {
+        "status": "success",
+        "admission": admission.snapshot()
+    }
+
+@router.get("/concurrency")
+async def get_concurrency():
+    """
+    Adaptive crawl concurrency: the global AIMD limit and one per target domain
+    """
+    return {
+        "status": "success",
+        "concurrency": adaptive_concurrency.snapshot()
+    }
+
+@router.get("/circuit-breakers")
+async def get_circuit_breakers():
+    """
+    Per-domain circuit breakers that are open, probing, or have recent failures
+    """
+    return {
+        "status": "success",
+        "breakers": circuit_breakers.snapshot()
+    }
+
+@router.delete("/circuit-breakers/{domain}")
+async def reset_circuit_breaker(domain: str):
+    """
+    Close a domain's breaker and forget its failures
+    """
+    if not circuit_breakers.reset(domain.lower()):
+        raise HTTPException(status_code=404, detail=f"No circuit breaker for '{domain}'")
+    return {"status": "success", "domain": domain}
+
+@router.get("/quotas")
+async def get_quotas():
+    """
+    Usage and remaining quota of every client seen recently
+    """
+    return {
+        "status": "success",
+        "clients": quota_registry.snapshot()
+    }
+
+@router.get("/quotas/{client:path}")
+async def get_client_quota(client: str):
+    """
+    Usage and remaining quota of one client, e.g. "team-a", "key:3f2a9c01d4e5" or "ip:10.0.0.7"
+    """
+    quota = quota_registry.lookup(client)
+    if quota is None:
+        raise HTTPException(status_code=404, detail=f"No usage recorded for '{client}'")
+    return {"status": "success", **quota.snapshot()}
+
+@router.get("/archives")
+async def get_archives():
+    """
+    Recorded HAR archives available for replay
+    """
+    return {
+        "status": "success",
+        "archives": await run_in_threadpool(list_archives)
+    }
+
+@router.get("/archives/{name}")
+async def get_archive(name: str):
+    """
+    Entry count, size and recorded HTML pages of one archive
+    """
+    try:
+        return {"status": "success", **await run_in_threadpool(describe_archive, name)}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.delete("/archives/{name}")
+async def remove_archive(name: str):
+    """
+    Delete an archive
+    """
+    try:
+        deleted = delete_archive(name)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not deleted:
+        raise HTTPException(status_code=404, detail=f"Archive '{name}' not found")
+    return {"status": "success", "name": name}
+
+@router.get("/datasets")
+async def get_datasets():
+    """
+    Parquet datasets written by crawl and extraction requests
+    """
+    return {
+        "status": "success",
+        "datasets": await run_in_threadpool(list_datasets)
+    }
+
+@router.get("/datasets/{name}")
+async def get_dataset(name: str):
+    """
+    Schema, partitions and files of one dataset, with their row counts
+    """
+    try:
+        return {"status": "success", **await run_in_threadpool(describe_dataset, name)}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.delete("/datasets/{name}")
+async def remove_dataset(name: str):
+    """
+    Delete a dataset and all of its files
+    """
+    try:
+        deleted = await run_in_threadpool(delete_dataset, name)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not deleted:
+        raise HTTPException(status_code=404, detail=f"Dataset '{name}' not found")
+    return {"status": "success", "name": name}
+
+@router.get("/dedup")
+async def get_dedup_indexes():
+    """
+    Named near-duplicate indexes: page counts, duplicates found and the
+    URL parameters and paths learned to only produce duplicates
+    """
+    return {
+        "status": "success",
+        "indexes": dedup_indexes.snapshot()
+    }
+
+@router.delete("/dedup/{name}")
+async def remove_dedup_index(name: str):
+    """
+    Forget a near-duplicate index and its learned URL patterns
+    """
+    if not dedup_indexes.delete(name):
+        raise HTTPException(status_code=404, detail=f"Dedup index '{name}' not found")
+    return {"status": "success", "name": name}
+
+@router.get("/memory", dependencies=[Depends(require_diagnostics_access)])
+async def get_memory(object_types: int = 0):
+    """
+    Memory of the service: RSS of the process and of each browser it
+    launched, the crawl sessions holding browsers with their contexts and
+    pages, garbage collector counters and the heap tracing state.
+    Set object_types=N to also count the N most common live Python object
+    types, which walks the whole heap.
+    """
+    processes = await run_in_threadpool(process_memory)
+    sessions = browser_sessions()
+    memory = {
+        "status": "success",
+        "process": processes,
+        "sessions": sessions,
+        "python": await run_in_threadpool(python_heap, min(max(object_types, 0), 200)),
+        "tracing": heap_tracer.status(),
+    }
+    if processes.get("psutil"):
+        # Browsers still running without a session to close them have leaked
+        owned = sum(1 for session in sessions if session["browser"] is not None and session["remote"] is None)
+        memory["unowned_browsers"] = max(len(processes["browsers"]) - owned, 0)
+    return memory
+
+@router.put("/memory/tracing", dependencies=[Depends(require_diagnostics_access)])
+async def start_heap_tracing(options: Optional[HeapTracingOptions] = None):
+    """
+    Start tracing Python allocations, or move the stop time of a running trace.
+    Tracing slows allocation-heavy code down and takes memory per traced block.
+    """
+    options = options or HeapTracingOptions()
+    heap_tracer.start(options.frames, options.seconds)
+    return {"status": "success", "tracing": heap_tracer.status()}
+
+@router.delete("/memory/tracing", dependencies=[Depends(require_diagnostics_access)])
+async def stop_heap_tracing():
+    """
+    Stop tracing; snapshots already taken are kept
+    """
+    if not heap_tracer.tracing:
+        raise HTTPException(status_code=404, detail="Heap tracing is not running")
+    heap_tracer.stop()
+    return {"status": "success", "tracing": heap_tracer.status()}
+
+@router.post("/memory/snapshots", dependencies=[Depends(require_diagnostics_access)])
+async def take_heap_snapshot(options: Optional[HeapSnapshotOptions] = None):
+    """
+    Snapshot the traced heap and return its largest allocation sites.
+    Compare two snapshots with GET /memory/snapshots/{id}?base={older id}.
+    """
+    options = options or HeapSnapshotOptions()
+    snapshot = await heap_tracer.take(options.label)
+    return {
+        "status": "success",
+        **snapshot.summary(),
+        "top": heap_tracer.top(snapshot, limit=min(max(options.limit, 1), 500)),
+    }
+
+@router.get("/memory/snapshots/{snapshot_id}", dependencies=[Depends(require_diagnostics_access)])
+async def get_heap_snapshot(snapshot_id: int, group_by: HeapGrouping = HeapGrouping.LINENO,
+                            limit: int = 25, base: Optional[int] = None):
+    """
+    Largest allocation sites of a snapshot, or with base set, the sites
+    that grew or shrank the most since that earlier snapshot
+    """
+    snapshot = heap_tracer.get(snapshot_id)
+    if snapshot is None:
+        raise HTTPException(status_code=404, detail=f"No heap snapshot {snapshot_id}")
+    limit = min(max(limit, 1), 500)
+    if base is None:
+        top = await run_in_threadpool(heap_tracer.top, snapshot, group_by, limit)
+        return {"status": "success", **snapshot.summary(), "top": top}
+    base_snapshot = heap_tracer.get(base)
+    if base_snapshot is None:
+        raise HTTPException(status_code=404, detail=f"No heap snapshot {base}")
+    return {
+        "status": "success",
+        **snapshot.summary(),
+        "base": base_snapshot.summary(),
+        "diff": await run_in_threadpool(heap_tracer.compare, snapshot, base_snapshot, group_by, limit),
+    }
+
+@router.delete("/memory/snapshots/{snapshot_id}", dependencies=[Depends(require_diagnostics_access)])
+async def delete_heap_snapshot(snapshot_id: int):
+    """
+    Drop a heap snapshot
+    """
+    if not heap_tracer.delete(snapshot_id):
+        raise HTTPException(status_code=404, detail=f"No heap snapshot {snapshot_id}")
+    return {"status": "success", "id": snapshot_id}
+
+@router.get("/browsers")
+async def get_browsers():
+    """
+    Remote browsers: health, active sessions and the result of the last check
+    """
+    return {
+        "status": "success",
+        "browsers": browser_pool.snapshot()
+    }
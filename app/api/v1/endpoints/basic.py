@@ -1,6 +1,10 @@
-from fastapi import APIRouter, HTTPException
-from crawl4ai import AsyncWebCrawler
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from app.core.metrics import track_timings
+from app.core.serialization import render_response
 from app.models.requests import BaseCrawlRequest
+from app.services.chunking import open_chunker
+from app.services.crawler import CrawlSession, build_archive, build_crawler_options
 
 # Add a description for the router
 router = APIRouter(
@@ -10,32 +14,34 @@ router = APIRouter(
 )
 
 @router.post("/")  # Changed from "/basic" to "/"
-async def basic_crawl(request: BaseCrawlRequest):
+async def basic_crawl(request: BaseCrawlRequest, http_request: Request):
     """
     Basic crawling endpoint with configurable settings
     """
+    track_timings(request.include_timings)
+    chunker = open_chunker(request.chunking)
     try:
         # Only include non-None options
-        crawler_options = {
-            "headless": request.headless,
-            "viewport_width": request.viewport_width,
-            "viewport_height": request.viewport_height
-        }
-        
-        # Add optional parameters only if they are not None
-        if request.user_agent is not None:
-            crawler_options["user_agent"] = request.user_agent
-        if request.proxy_server is not None:
-            crawler_options["proxy_server"] = request.proxy_server
+        crawler_options = build_crawler_options(request)
 
-        async with AsyncWebCrawler(**crawler_options) as crawler:
+        # Pages are routed to an HTTP-only fetch when their prefix is known not to need a browser
+        async with CrawlSession(crawler_options, priority=request.priority,
+                                archive=build_archive(request)) as crawler:
             result = await crawler.arun(url=str(request.url))
             
-            return {
+            content = {
                 "url": str(request.url),
                 "markdown": result.markdown,
                 "status": "success"
             }
+            if chunker is not None:
+                markdown = str(result.markdown or "")
+                if request.chunking.stream:
+                    return StreamingResponse(chunker.ndjson(content, markdown), media_type="application/x-ndjson")
+                content = await chunker.add_to(content, markdown)
+            return await render_response(http_request, content)
             
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e)) 
\ No newline at end of file
@@ -0,0 +1,161 @@
+import os
+from typing import Iterator, Optional
+
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
+
+from app.core.compression import available_encodings
+from app.core.config import settings
+from app.core.quotas import charge_pages
+from app.services.bulk import (
+    RESULT_FIELDS, InputFormat, JobState, OutputCompression, bulk_jobs
+)
+
+# Uploads go to /crawl/bulk; jobs are managed under /bulk so polling them is not metered as crawling
+router = APIRouter()
+jobs_router = APIRouter(prefix="/bulk", tags=["bulk"])
+
+# Read size of results downloads; the reads run in the threadpool
+DOWNLOAD_CHUNK_BYTES = 256 * 1024
+# Upload bytes gathered before each write to disk, which runs in the threadpool
+UPLOAD_WRITE_BYTES = 1024 * 1024
+JSONL_MEDIA_TYPES = ("application/x-ndjson", "application/jsonl", "application/json-lines", "application/jsonlines")
+
+
+def _input_format(content_type: str) -> InputFormat:
+    media_type = content_type.split(";")[0].strip().lower()
+    return InputFormat.JSONL if media_type in JSONL_MEDIA_TYPES else InputFormat.CSV
+
+
+def _job_links(job_id: str):
+    base = f"{settings.API_V1_STR}/bulk/{job_id}"
+    return {"status_url": base, "results_url": f"{base}/results"}
+
+
+@router.post("/bulk", status_code=202)
+async def create_bulk_job(
+    http_request: Request,
+    input_format: Optional[InputFormat] = Query(None, alias="format"),
+    column: str = "url",
+    compression: OutputCompression = OutputCompression.GZIP,
+    fields: str = ",".join(RESULT_FIELDS),
+    max_field_bytes: Optional[int] = None,
+    max_attempts: Optional[int] = None,
+):
+    """
+    Crawl every URL of an uploaded file in the background.
+    The request body is the file itself: CSV (with a "url" column or URLs
+    in the first column; a plain list of URLs works too) or JSONL. The
+    format follows Content-Type unless "format" is given. The file is
+    written to disk as it arrives and read back one URL at a time, so lists
+    of any length are accepted without holding them in memory.
+    Results are appended to a JSONL file, gzip-compressed by default, that
+    can be downloaded from results_url while the job runs.
+    """
+    selected = tuple(name.strip() for name in fields.split(",") if name.strip())
+    unknown = [name for name in selected if name not in RESULT_FIELDS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields {unknown}; choose from {list(RESULT_FIELDS)}")
+    if compression != OutputCompression.NONE and compression.value not in available_encodings():
+        raise HTTPException(status_code=400, detail=f"{compression.value} output is not available on this server")
+
+    await bulk_jobs.expire()
+    job = bulk_jobs.new_job(
+        input_format=input_format or _input_format(http_request.headers.get("content-type", "")),
+        column=column, compression=compression, fields=selected,
+        max_field_bytes=max_field_bytes, max_attempts=max_attempts,
+    )
+    lines = 0
+    try:
+        f = await run_in_threadpool(open, job.input_path, "wb")
+        try:
+            pending = bytearray()
+            async for chunk in http_request.stream():
+                job.upload_bytes += len(chunk)
+                if job.upload_bytes > settings.BULK_MAX_UPLOAD_BYTES:
+                    raise HTTPException(status_code=413, detail=f"Upload larger than {settings.BULK_MAX_UPLOAD_BYTES} bytes")
+                pending += chunk
+                lines += chunk.count(b"\n")
+                if len(pending) >= UPLOAD_WRITE_BYTES:
+                    await run_in_threadpool(f.write, bytes(pending))
+                    pending.clear()
+            if pending:
+                await run_in_threadpool(f.write, bytes(pending))
+        finally:
+            await run_in_threadpool(f.close)
+    except BaseException:
+        await bulk_jobs.delete(job.id)
+        raise
+    if job.upload_bytes == 0:
+        await bulk_jobs.delete(job.id)
+        raise HTTPException(status_code=400, detail="Empty upload")
+
+    # The quota check admitted the upload as one page; charge about one more per line
+    charge_pages(http_request, lines - 1)
+    await run_in_threadpool(job.save)
+    bulk_jobs.start(job)
+    return {"status": "accepted", "job": job.status(), **_job_links(job.id)}
+
+
+@jobs_router.get("")
+async def list_bulk_jobs():
+    """
+    Bulk jobs kept on this server, newest first
+    """
+    return {"status": "success", "jobs": await run_in_threadpool(bulk_jobs.snapshot)}
+
+
+@jobs_router.get("/{job_id}")
+async def get_bulk_job(job_id: str):
+    """
+    Progress of a bulk job: URLs read, invalid, succeeded and failed so far
+    """
+    job = bulk_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"No bulk job '{job_id}'")
+    return {"status": "success", "job": job.status(), **_job_links(job.id)}
+
+
+def _read_prefix(path: str, size: int) -> Iterator[bytes]:
+    with open(path, "rb") as f:
+        while size > 0:
+            chunk = f.read(min(size, DOWNLOAD_CHUNK_BYTES))
+            if not chunk:
+                break
+            size -= len(chunk)
+            yield chunk
+
+
+@jobs_router.get("/{job_id}/results")
+async def download_bulk_results(job_id: str):
+    """
+    The results file. While the job runs it holds the pages finished so
+    far; X-Job-State tells whether more are coming.
+    """
+    job = bulk_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"No bulk job '{job_id}'")
+    if job.state == JobState.QUEUED:
+        raise HTTPException(status_code=409, detail="The job has not started yet")
+    # The file keeps growing while the job runs; send the bytes written so far and no more
+    size = os.path.getsize(job.output_path)
+    filename = f"{job.id}-{os.path.basename(job.output_path)}"
+    return StreamingResponse(
+        _read_prefix(job.output_path, size), media_type=job.output_media_type,
+        headers={
+            "Content-Length": str(size),
+            "Content-Disposition": f'attachment; filename="{filename}"',
+            "X-Job-State": job.state.value,
+        },
+    )
+
+
+@jobs_router.delete("/{job_id}")
+async def delete_bulk_job(job_id: str):
+    """
+    Cancel a bulk job if it is still running and delete its files
+    """
+    if not await bulk_jobs.delete(job_id):
+        raise HTTPException(status_code=404, detail=f"No bulk job '{job_id}'")
+    return {"status": "success", "id": job_id}
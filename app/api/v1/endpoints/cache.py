@@ -1,7 +1,12 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, HttpUrl
 from enum import Enum
 from typing import Optional
+from app.core.admission import Priority
+from app.core.config import settings
+from app.core.metrics import current_timings, track_timings
+from app.core.serialization import render_response
 
 router = APIRouter()
 
@@ -18,9 +23,13 @@ class CrawlRequest(BaseModel):
     headless: bool = True
     viewport_width: int = 1280
     viewport_height: int = 800
+    max_field_bytes: Optional[int] = None  # Lower the server's per-page html/markdown caps
+    stream_markdown: bool = False  # Return only the markdown, streamed as text/markdown
+    priority: Priority = Priority.INTERACTIVE
+    include_timings: bool = False  # Return a Server-Timing header and a "timings" breakdown
 
 @router.post("/cached")
-async def cached_crawl(request: CrawlRequest):
+async def cached_crawl(request: CrawlRequest, http_request: Request):
     """
     Crawl a webpage with the new caching system (Crawl4AI 0.5.0+).
     Cache modes:
@@ -29,9 +38,15 @@ async def cached_crawl(request: CrawlRequest):
     - READ_ONLY: Only read from cache
     - WRITE_ONLY: Only write to cache
     - BYPASS: Skip cache for this operation
+
+    With stream_markdown the markdown body is streamed in chunks and the
+    rest of the page is dropped as soon as the crawl finishes.
     """
+    track_timings(request.include_timings)
     try:
-        from crawl4ai import AsyncWebCrawler, CacheMode as Crawl4AICacheMode
+        from crawl4ai import CacheMode as Crawl4AICacheMode
+        from app.services.crawler import CrawlSession, build_crawler_options
+        from app.services.page_limits import cap_page_fields, field_limits, iter_text_chunks
 
         # Map our API cache mode to Crawl4AI cache mode
         cache_mode_mapping = {
@@ -43,20 +58,11 @@ async def cached_crawl(request: CrawlRequest):
         }
 
         # Create crawler with configuration
-        crawler_options = {
-            "headless": request.headless,
-            "viewport_width": request.viewport_width,
-            "viewport_height": request.viewport_height
-        }
-
-        # Add optional parameters if they exist
-        if hasattr(request, 'user_agent') and request.user_agent is not None:
-            crawler_options["user_agent"] = request.user_agent
-        if hasattr(request, 'proxy_server') and request.proxy_server is not None:
-            crawler_options["proxy_server"] = request.proxy_server
+        crawler_options = build_crawler_options(request)
 
         # Use async context manager to ensure proper browser initialization and cleanup
-        async with AsyncWebCrawler(**crawler_options) as crawler:
+        # Cache-reading modes skip the size check themselves, since a cached page is never downloaded
+        async with CrawlSession(crawler_options, priority=request.priority, size_check=True) as crawler:
             # Perform crawl with cache mode
             result = await crawler.arun(
                 url=str(request.url),
@@ -67,6 +73,26 @@ async def cached_crawl(request: CrawlRequest):
                 error_msg = getattr(result, 'error_message', 'Unknown error occurred')
                 raise HTTPException(status_code=500, detail=error_msg)
 
+            limits = field_limits(request.max_field_bytes)
+
+            if request.stream_markdown:
+                # Keep only the markdown; html and cleaned_html go out of scope with the result
+                page = {"markdown": str(getattr(result, 'markdown', None) or "")}
+                cache_hit = getattr(result, 'cache_hit', None)
+                del result
+                truncated = cap_page_fields(page, limits)
+                headers = {"X-Cache-Hit": str(bool(cache_hit)).lower()}
+                if truncated:
+                    headers["X-Truncated"] = ",".join(truncated)
+                timings = current_timings()
+                if timings is not None:
+                    headers["Server-Timing"] = timings.server_timing()
+                return StreamingResponse(
+                    iter_text_chunks(page.pop("markdown"), settings.MARKDOWN_STREAM_CHUNK_CHARS),
+                    media_type="text/markdown; charset=utf-8",
+                    headers=headers
+                )
+
             # Build response with available attributes
             response = {
                 "status": "success",
@@ -88,6 +114,10 @@ async def cached_crawl(request: CrawlRequest):
             if hasattr(result, 'links') and result.links:  # Only add if not empty
                 response["data"]["links"] = result.links
 
+            truncated = cap_page_fields(response["data"], limits)
+            if truncated:
+                response["truncated"] = truncated
+
             # Check if we got any actual data
             if not any(response["data"].values()):
                 raise HTTPException(
@@ -95,7 +125,9 @@ async def cached_crawl(request: CrawlRequest):
                     detail="Crawl completed but no content was retrieved. This might be due to page loading issues or content blocking."
                 )
 
-            return response
+            return await render_response(http_request, response)
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e)) 
\ No newline at end of file
@@ -1,9 +1,13 @@
-from fastapi import APIRouter, HTTPException
-from crawl4ai import AsyncWebCrawler
-from crawl4ai.extraction_strategy import JsonCssExtractionStrategy
+from fastapi import APIRouter, HTTPException, Request
 from pydantic import BaseModel, Field
 from typing import List, Dict, Optional, Any
-import json
+from app.core.admission import Priority
+from app.core.metrics import track_timings
+from app.core.serialization import render_response
+from app.models.requests import ArchiveOptions, DatasetOptions
+from app.services.crawler import CrawlSession, build_archive, build_crawler_options
+from app.services.datasets import extraction_schema, open_dataset
+from app.services.extraction import ExtractionEngine, UnsupportedSchemaError, extract_items_async, get_extractor
 
 router = APIRouter(
     prefix="/extraction",
@@ -23,6 +27,25 @@ class ExtractionSchema(BaseModel):
     base_selector: str
     fields: List[ExtractionField]
 
+    def to_strategy_schema(self) -> Dict[str, Any]:
+        """
+        Convert to the dictionary format used by JsonCssExtractionStrategy
+        """
+        return {
+            "name": self.name,
+            "baseSelector": self.base_selector,
+            "fields": [
+                {
+                    "name": field.name,
+                    "selector": field.selector,
+                    "type": field.type,
+                    "isCollection": field.is_collection,
+                    **({"attribute": field.attribute} if field.attribute else {})
+                }
+                for field in self.fields
+            ]
+        }
+
 class ExtractionRequest(BaseModel):
     url: str
     schema: ExtractionSchema
@@ -30,85 +53,70 @@ class ExtractionRequest(BaseModel):
     viewport_width: int = 1280
     viewport_height: int = 800
     wait_time: Optional[int] = 2
+    engine: Optional[ExtractionEngine] = None  # Defaults to the EXTRACTION_ENGINE setting
+    priority: Priority = Priority.INTERACTIVE
+    include_timings: bool = False  # Return a Server-Timing header and a "timings" breakdown
+    archive: Optional[ArchiveOptions] = None  # Record the page's traffic, or re-extract from a recording
+    dataset: Optional[DatasetOptions] = None  # Also append the items to a Parquet dataset, one row per item
 
 @router.post("/structured")
-async def structured_extraction(request: ExtractionRequest):
+async def structured_extraction(request: ExtractionRequest, http_request: Request):
     """
-    Extract structured data using CSS selectors without LLM
+    Extract structured data using CSS selectors without LLM.
+    Send "Accept: application/vnd.apache.arrow.stream" to receive the items
+    as an Arrow IPC stream with one column per schema field.
+    The page is fetched first and the schema is applied to its HTML by the
+    requested engine (crawl4ai by default; "lxml" and "auto" opt in to the
+    faster lxml engine).
+    Set "dataset" to also append the items to a Parquet dataset on the
+    server, with one column per schema field.
     """
+    track_timings(request.include_timings)
     try:
         # Convert schema to dictionary format
-        schema_dict = {
-            "name": request.schema.name,
-            "baseSelector": request.schema.base_selector,
-            "fields": [
-                {
-                    "name": field.name,
-                    "selector": field.selector,
-                    "type": field.type,
-                    "isCollection": field.is_collection,
-                    **({"attribute": field.attribute} if field.attribute else {})
-                }
-                for field in request.schema.fields
-            ]
-        }
+        schema_dict = request.schema.to_strategy_schema()
 
-        # Create extraction strategy
-        extraction_strategy = JsonCssExtractionStrategy(
-            schema=schema_dict,
-            verbose=True
-        )
+        # Fail before navigating if the requested engine cannot run this schema
+        try:
+            get_extractor(schema_dict, request.engine)
+        except UnsupportedSchemaError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        dataset = await open_dataset(request.dataset, lambda: extraction_schema(schema_dict["fields"]),
+                               {"source": "extraction/structured", "schema": request.schema.name})
 
         # Basic crawler options
-        crawler_options = {
-            "headless": request.headless,
-            "viewport_width": request.viewport_width,
-            "viewport_height": request.viewport_height
-        }
+        crawler_options = build_crawler_options(request)
 
-        # Add optional parameters if they exist
-        if hasattr(request, 'user_agent') and request.user_agent is not None:
-            crawler_options["user_agent"] = request.user_agent
-        if hasattr(request, 'proxy_server') and request.proxy_server is not None:
-            crawler_options["proxy_server"] = request.proxy_server
-
-        async with AsyncWebCrawler(**crawler_options) as crawler:
+        # Extraction waits for the base selector to render, so it always uses the browser
+        async with CrawlSession(crawler_options, route=False, priority=request.priority,
+                                archive=build_archive(request)) as crawler:
             result = await crawler.arun(
                 url=str(request.url),
-                extraction_strategy=extraction_strategy,
                 wait_for=request.schema.base_selector,
                 wait_time=request.wait_time or 2
             )
-            
-            if not result.success:
-                raise HTTPException(status_code=500, detail=result.error_message)
 
+        if not result.success:
+            raise HTTPException(status_code=500, detail=result.error_message)
+
+        items = await extract_items_async(schema_dict, str(request.url), result.html or "", request.engine)
+
+        content = {
+            "url": str(request.url),
+            "data": items,
+            "status": "success",
+            "total_items": len(items)
+        }
+        if dataset is not None:
             try:
-                # Parse the extracted content
-                extracted_data = json.loads(result.extracted_content) if result.extracted_content else None
-                
-                # Return the items directly if they exist
-                items = []
-                if extracted_data and isinstance(extracted_data, list):
-                    items = extracted_data
-                elif extracted_data and isinstance(extracted_data, dict) and "items" in extracted_data:
-                    items = extracted_data["items"]
-                
-                return {
-                    "url": str(request.url),
-                    "data": items,
-                    "status": "success",
-                    "total_items": len(items)
-                }
-                
-            except json.JSONDecodeError as e:
-                return {
-                    "url": str(request.url),
-                    "data": None,
-                    "status": "error",
-                    "error": f"JSON decode error: {str(e)}",
-                    "raw_content": result.extracted_content
-                }
-            
+                await dataset.write_many([{**item, "url": str(request.url)} for item in items])
+            finally:
+                await dataset.close()
+            content["dataset"] = dataset.summary()
+        return await render_response(http_request, content,
+                                     rows=items, columns=[field.name for field in request.schema.fields])
+
+    except HTTPException:
+        raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e)) 
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
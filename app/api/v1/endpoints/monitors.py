@@ -0,0 +1,111 @@
+import re
+from typing import List, Optional
+
+from fastapi import APIRouter, HTTPException, Query, Request
+from pydantic import BaseModel, Field, HttpUrl
+from starlette.concurrency import run_in_threadpool
+
+from app.api.v1.endpoints.extraction import ExtractionSchema
+from app.core.config import settings
+from app.core.quotas import charge_pages
+from app.services.extraction import ExtractionEngine, UnsupportedSchemaError, get_extractor
+from app.services.monitor import monitor_scheduler
+
+router = APIRouter(prefix="/monitors", tags=["monitors"])
+
+class MonitorRequest(BaseModel):
+    urls: List[HttpUrl]
+    # Bounds of each URL's check interval in seconds; default to the MONITOR_* settings
+    min_interval: Optional[float] = Field(None, gt=0)
+    max_interval: Optional[float] = Field(None, gt=0)
+    initial_interval: Optional[float] = Field(None, gt=0)
+    schema: Optional[ExtractionSchema] = None  # Compare extracted items instead of the markdown
+    engine: Optional[ExtractionEngine] = None
+    ignore_patterns: List[str] = Field(default_factory=list)  # Regexes removed from the markdown before comparing
+    emit_initial: bool = True  # Emit each URL's first successful check as a "new" change
+
+@router.put("/{name}")
+async def put_monitor(name: str, request: MonitorRequest):
+    """
+    Create a monitor or replace its URLs and options. URLs that stay keep
+    their schedule and last fingerprint; new URLs are checked right away.
+    """
+    for pattern in request.ignore_patterns:
+        try:
+            re.compile(pattern)
+        except re.error as e:
+            raise HTTPException(status_code=400, detail=f"Invalid ignore pattern {pattern!r}: {e}")
+    schema = request.schema.to_strategy_schema() if request.schema is not None else None
+    if schema is not None:
+        try:
+            get_extractor(schema, request.engine)
+        except UnsupportedSchemaError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    try:
+        monitor = await monitor_scheduler.put(
+            name, [str(url) for url in request.urls],
+            min_interval=request.min_interval or settings.MONITOR_MIN_INTERVAL,
+            max_interval=request.max_interval or settings.MONITOR_MAX_INTERVAL,
+            initial_interval=request.initial_interval or settings.MONITOR_INITIAL_INTERVAL,
+            schema=schema, engine=request.engine, ignore_patterns=request.ignore_patterns,
+            emit_initial=request.emit_initial,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"status": "success", "monitor": monitor.status()}
+
+@router.get("")
+async def list_monitors():
+    """
+    All monitors, with the scheduler's state and check outcome counts
+    """
+    return {
+        "status": "success",
+        "scheduler": monitor_scheduler.scheduler_status(),
+        "monitors": await monitor_scheduler.snapshot(),
+    }
+
+@router.get("/{name}")
+async def get_monitor(name: str, limit: int = Query(100, ge=0)):
+    """
+    A monitor's options and the schedule of its URLs, soonest due first
+    """
+    monitor = await monitor_scheduler.get(name)
+    states = sorted(monitor.urls.values(), key=lambda state: state.next_check_at)[:limit]
+    return {"status": "success", "monitor": monitor.status(), "urls": [state.snapshot() for state in states]}
+
+@router.get("/{name}/changes")
+async def get_changes(name: str, after: int = Query(0, ge=0), limit: int = Query(100, ge=1, le=1000)):
+    """
+    Changed pages in the order they were detected. Pass the returned
+    "next_after" as "after" to receive only changes not seen yet.
+    """
+    monitor = await monitor_scheduler.get(name)
+    changes = await run_in_threadpool(monitor.read_changes, after, limit)
+    return {
+        "status": "success",
+        "changes": changes,
+        "next_after": changes[-1]["seq"] if changes else after,
+    }
+
+@router.post("/{name}/check")
+async def check_monitor(name: str, http_request: Request, force: bool = False):
+    """
+    Check the monitor's due URLs now, or all of them with "force", up to
+    MONITOR_MAX_URLS_PER_ROUND, and return how many changed. With client
+    quotas, the call is charged one page per URL checked.
+    """
+    monitor = await monitor_scheduler.get(name)
+    counts = await monitor_scheduler.check(monitor, force=force)
+    # Admitted as one page; charge the rest now that the count is known
+    charge_pages(http_request, sum(counts.values()) - 1)
+    return {"status": "success", "checked": sum(counts.values()), "outcomes": counts,
+            "next_check_at": monitor.next_check_at()}
+
+@router.delete("/{name}")
+async def delete_monitor(name: str):
+    """
+    Stop watching a monitor's URLs and delete its change feed
+    """
+    await monitor_scheduler.delete(name)
+    return {"status": "success", "name": name}
@@ -1,112 +1,311 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, HttpUrl
 from enum import Enum
 from typing import List, Optional
 import asyncio
+from contextlib import aclosing
+from functools import partial
+from app.core.admission import OverloadedError, Priority, admission
+from app.core.config import settings
+from app.core.metrics import current_timings, page_timings, track_timings
+from app.core.quotas import charge_pages
+from app.core.serialization import (
+    MSGPACK_MEDIA_TYPE, dumps, negotiate_format, offered_formats, packb, render_response
+)
+from app.services.concurrency import adaptive_concurrency
+from app.models.requests import ArchiveOptions, DatasetOptions, DedupOptions
+from app.services.archive import ArchiveMode, require_archive
+from app.services.crawler import CrawlSession, build_archive, build_crawler_options
+from app.services.datasets import DatasetWriter, crawl_result_row, crawl_result_schema, open_dataset
+from app.services.dedup import DedupSession, dedup_indexes
+from app.services.resilience import fetch_with_retries
+from app.services.page_limits import cap_page_fields, field_limits
 
 router = APIRouter()
 
 class CrawlMode(str, Enum):
     SEQUENTIAL = "sequential"  # Crawl URLs one by one with session reuse
     PARALLEL = "parallel"      # Crawl URLs in parallel with browser reuse
+    ADAPTIVE = "adaptive"      # Parallel, with AIMD concurrency limits per domain and overall
 
 class MultiCrawlRequest(BaseModel):
     urls: List[HttpUrl]
     mode: CrawlMode = CrawlMode.SEQUENTIAL
-    max_concurrent: Optional[int] = 3  # For parallel mode
+    max_concurrent: Optional[int] = 3  # For parallel mode; adaptive mode picks its own limit
     headless: bool = True
     viewport_width: int = 1280
     viewport_height: int = 800
     session_reuse: bool = True  # Whether to reuse session across URLs
+    max_field_bytes: Optional[int] = None  # Lower the server's per-page html/markdown caps
+    stream: bool = False  # Emit results as NDJSON, one line per URL, instead of one JSON body
+    max_attempts: Optional[int] = None  # Per URL, including retries of transient failures; defaults to RETRY_MAX_ATTEMPTS
+    include_timings: bool = False  # Per-URL "timings", plus request totals and a Server-Timing header
+    archive: Optional[ArchiveOptions] = None  # One archive for all URLs of the crawl
+    dataset: Optional[DatasetOptions] = None  # Write pages to a Parquet dataset; entries then leave out "data"
+    dedup: Optional[DedupOptions] = None  # Flag or suppress near-duplicate pages
+
+def _result_entry(url, result, limits):
+    """
+    Turn a crawl result into a response entry, capping oversized fields
+    """
+    entry = {
+        "url": str(url),
+        "success": result.success if hasattr(result, 'success') else True,
+        "status_code": getattr(result, "status_code", None),
+        "data": {
+            "html": result.html if hasattr(result, 'html') else None,
+            "markdown": result.markdown if hasattr(result, 'markdown') else None,
+            "cleaned_html": result.cleaned_html if hasattr(result, 'cleaned_html') else None,
+            "links": result.links if hasattr(result, 'links') else None
+        }
+    }
+    truncated = cap_page_fields(entry["data"], limits)
+    if truncated:
+        entry["truncated"] = truncated
+    return entry
+
+def _outcome_entry(url, outcome, limits, timings=None):
+    """
+    Response entry for a URL fetched through the retry policy
+    """
+    if isinstance(outcome.error, OverloadedError):
+        # No browser for this request at all: fail it as a whole
+        raise outcome.error
+    if outcome.error is not None:
+        entry = {"url": str(url), "success": False, "error": str(outcome.error)}
+    else:
+        entry = _result_entry(url, outcome.result, limits)
+    if outcome.attempts != 1:
+        entry["attempts"] = outcome.attempts
+    if timings is not None:
+        entry["timings"] = timings.as_dict()
+    return entry
+
+async def _fetch(url, attempt, request: MultiCrawlRequest):
+    """
+    Fetch one URL through the retry policy, timing its stages on their own
+    when the request asked for timings
+    """
+    with page_timings(request.include_timings) as timings:
+        outcome = await fetch_with_retries(str(url), attempt, request.max_attempts)
+    return outcome, timings
+
+async def _page_entry(url, attempt, limits, request: MultiCrawlRequest, dedup: Optional[DedupSession]):
+    """
+    Response entry for one URL: skipped when its URL is known to duplicate
+    a page already crawled, otherwise fetched and checked for duplicates
+    """
+    if dedup is not None:
+        original = dedup.skip(str(url))
+        if original is not None:
+            return dedup.skipped_entry(str(url), original)
+    outcome, timings = await _fetch(url, attempt, request)
+    entry = _outcome_entry(url, outcome, limits, timings)
+    if dedup is not None and entry["success"] and "data" in entry:
+        await dedup.check(entry, str(getattr(outcome.result, "markdown", None) or ""))
+    return entry
+
+async def _crawl_results(request: MultiCrawlRequest, crawler, dedup: Optional[DedupSession] = None):
+    """
+    Yield one response entry per URL, in request order. Entries are built as
+    soon as each page finishes so the crawl result objects can be released.
+    """
+    limits = field_limits(request.max_field_bytes)
+
+    if request.mode == CrawlMode.ADAPTIVE:
+        async with aclosing(_adaptive_results(request, crawler, limits, dedup)) as entries:
+            async for entry in entries:
+                yield entry
+    elif request.mode == CrawlMode.SEQUENTIAL:
+        # Sequential crawling with session reuse
+        session_id = "shared_session" if request.session_reuse else None
+        for url in request.urls:
+            yield await _page_entry(url, partial(crawler.arun, url=str(url), session_id=session_id),
+                                    limits, request, dedup)
+    else:  # Parallel mode
+        # Process URLs in batches
+        for i in range(0, len(request.urls), request.max_concurrent):
+            batch = request.urls[i:i + request.max_concurrent]
+            tasks = []
+
+            for j, url in enumerate(batch):
+                # Create unique session ID for each URL unless session reuse is enabled
+                session_id = "shared_session" if request.session_reuse else f"session_{i + j}"
+                task = _page_entry(url, partial(crawler.arun, url=str(url), session_id=session_id),
+                                   limits, request, dedup)
+                tasks.append(task)
+
+            # Wait for batch to complete; failures come back as entries, not exceptions
+            batch_entries = await asyncio.gather(*tasks)
+
+            # Process batch results
+            for entry in batch_entries:
+                yield entry
+            del batch_entries
+
+async def _adaptive_crawl(crawler, url, limits, request: MultiCrawlRequest, dedup: Optional[DedupSession]):
+    return await _page_entry(url, partial(adaptive_concurrency.crawl, crawler, str(url)), limits, request, dedup)
+
+async def _adaptive_results(request: MultiCrawlRequest, crawler, limits, dedup: Optional[DedupSession]):
+    """
+    Crawl as many pages at once as the global and per-domain AIMD limits
+    allow, yielding entries in request order. Pages are started at most
+    ADAPTIVE_MAX_CONCURRENCY ahead of the next entry to yield, which bounds
+    how many finished pages wait in memory.
+    """
+    urls = request.urls
+    window = max(settings.ADAPTIVE_MAX_CONCURRENCY, 1)
+    tasks = {}
+    started = 0
+    try:
+        for i in range(len(urls)):
+            while started < len(urls) and started < i + window:
+                tasks[started] = asyncio.create_task(
+                    _adaptive_crawl(crawler, urls[started], limits, request, dedup)
+                )
+                started += 1
+            yield await tasks.pop(i)
+    finally:
+        for task in tasks.values():
+            task.cancel()
+
+def _summary(request: MultiCrawlRequest, successful: int, failed: int, dedup: Optional[DedupSession]):
+    summary = {
+        "total_urls": len(request.urls),
+        "successful": successful,
+        "failed": failed
+    }
+    if request.mode == CrawlMode.ADAPTIVE:
+        summary["concurrency"] = adaptive_concurrency.limits(request.urls)
+    if dedup is not None:
+        summary["dedup"] = dedup.summary()
+    return summary
+
+def _dedup_session(request: MultiCrawlRequest) -> Optional[DedupSession]:
+    return dedup_indexes.session(request.dedup) if request.dedup is not None else None
+
+def _crawler_options(request: MultiCrawlRequest):
+    crawler_options = build_crawler_options(request)
+    crawler_options["extra_args"] = ["--disable-gpu", "--disable-dev-shm-usage", "--no-sandbox"]
+    return crawler_options
+
+async def _open_dataset(request: MultiCrawlRequest) -> Optional[DatasetWriter]:
+    return await open_dataset(request.dataset, crawl_result_schema, {"source": "crawl/multi"})
+
+async def _to_dataset(dataset: Optional[DatasetWriter], entry):
+    """
+    Append an entry's page to the dataset, leaving only its status in the
+    response so the page is not held twice
+    """
+    if dataset is not None:
+        await dataset.write(crawl_result_row(entry))
+        entry.pop("data", None)
+    return entry
+
+def _ndjson_line(entry):
+    return dumps(entry) + b"\n"
+
+async def _stream_results(request: MultiCrawlRequest, encode, dataset: Optional[DatasetWriter],
+                          dedup: Optional[DedupSession]):
+    """
+    Stream results one encoded entry per URL. Only one page is held in
+    memory at a time; the last entry carries the summary.
+    """
+    successful = failed = 0
+    try:
+        async with CrawlSession(_crawler_options(request), priority=Priority.BULK, size_check=True,
+                                archive=build_archive(request)) as crawler:
+            try:
+                async with aclosing(_crawl_results(request, crawler, dedup)) as entries:
+                    async for entry in entries:
+                        if entry["success"]:
+                            successful += 1
+                        else:
+                            failed += 1
+                        yield encode(await _to_dataset(dataset, entry))
+            except Exception as e:
+                yield encode({"status": "error", "error": str(e)})
+                return
+    finally:
+        if dataset is not None:
+            await dataset.close()
+    final = {
+        "status": "success",
+        "mode": request.mode.value,
+        "summary": _summary(request, successful, failed, dedup)
+    }
+    if dataset is not None:
+        final["dataset"] = dataset.summary()
+    timings = current_timings()
+    if timings is not None:
+        final["timings"] = timings.as_dict()
+    yield encode(final)
 
 @router.post("/multi")
-async def multi_crawl(request: MultiCrawlRequest):
+async def multi_crawl(request: MultiCrawlRequest, http_request: Request):
     """
     Crawl multiple URLs either sequentially or in parallel.
     Uses browser reuse for better performance and resource management.
+    Runs in the bulk priority class, behind single-page calls.
+    In adaptive mode concurrency follows the AIMD limits and the summary
+    reports the global and per-domain limits in effect at the end.
+    Set "stream" to receive results as NDJSON while the crawl progresses,
+    or as a sequence of MessagePack objects when Accept asks for MessagePack.
+    Set "include_timings" for a stage breakdown on every URL entry.
+    Set "dataset" to append the pages to a Parquet dataset on the server
+    instead of returning them; entries then carry only each URL's status.
+    Set "dedup" to mark near-duplicate pages with "duplicate_of", or drop
+    their data, and skip URLs learned to only produce duplicates.
     """
-    try:
-        from crawl4ai import AsyncWebCrawler
+    # The quota check admitted this request as one page; charge the rest
+    charge_pages(http_request, len(request.urls) - 1)
+    track_timings(request.include_timings)
+    dataset = await _open_dataset(request)
+    dedup = _dedup_session(request)
+
+    if request.stream:
+        # Once streaming has started a 503 can no longer be sent, so shed load up front
+        if settings.ADMISSION_ENABLED:
+            admission.check(Priority.BULK)
+        if request.archive is not None and request.archive.mode == ArchiveMode.REPLAY:
+            require_archive(request.archive.name)
+        media_type = negotiate_format(http_request.headers.get("accept", ""), offered_formats())
+        if media_type == MSGPACK_MEDIA_TYPE:
+            return StreamingResponse(_stream_results(request, packb, dataset, dedup), media_type=MSGPACK_MEDIA_TYPE)
+        return StreamingResponse(_stream_results(request, _ndjson_line, dataset, dedup), media_type="application/x-ndjson")
 
+    try:
         results = []
-        # Use async context manager for automatic cleanup
-        async with AsyncWebCrawler(
-            headless=request.headless,
-            viewport_width=request.viewport_width,
-            viewport_height=request.viewport_height,
-            extra_args=["--disable-gpu", "--disable-dev-shm-usage", "--no-sandbox"]
-        ) as crawler:
-            
-            if request.mode == CrawlMode.SEQUENTIAL:
-                # Sequential crawling with session reuse
-                session_id = "shared_session" if request.session_reuse else None
-                for url in request.urls:
-                    result = await crawler.arun(
-                        url=str(url),
-                        session_id=session_id
-                    )
-                    results.append({
-                        "url": str(url),
-                        "success": result.success if hasattr(result, 'success') else True,
-                        "data": {
-                            "html": result.html if hasattr(result, 'html') else None,
-                            "markdown": result.markdown if hasattr(result, 'markdown') else None,
-                            "cleaned_html": result.cleaned_html if hasattr(result, 'cleaned_html') else None,
-                            "links": result.links if hasattr(result, 'links') else None
-                        }
-                    })
-            else:  # Parallel mode
-                # Process URLs in batches
-                for i in range(0, len(request.urls), request.max_concurrent):
-                    batch = request.urls[i:i + request.max_concurrent]
-                    tasks = []
-                    
-                    for j, url in enumerate(batch):
-                        # Create unique session ID for each URL unless session reuse is enabled
-                        session_id = "shared_session" if request.session_reuse else f"session_{i + j}"
-                        task = crawler.arun(
-                            url=str(url),
-                            session_id=session_id
-                        )
-                        tasks.append(task)
-                    
-                    # Wait for batch to complete
-                    batch_results = await asyncio.gather(*tasks, return_exceptions=True)
-                    
-                    # Process batch results
-                    for url, result in zip(batch, batch_results):
-                        if isinstance(result, Exception):
-                            results.append({
-                                "url": str(url),
-                                "success": False,
-                                "error": str(result)
-                            })
-                        else:
-                            results.append({
-                                "url": str(url),
-                                "success": result.success if hasattr(result, 'success') else True,
-                                "data": {
-                                    "html": result.html if hasattr(result, 'html') else None,
-                                    "markdown": result.markdown if hasattr(result, 'markdown') else None,
-                                    "cleaned_html": result.cleaned_html if hasattr(result, 'cleaned_html') else None,
-                                    "links": result.links if hasattr(result, 'links') else None
-                                }
-                            })
+        # Use async context manager for automatic cleanup; the browser is only
+        # launched once a URL actually needs rendering
+        async with CrawlSession(_crawler_options(request), priority=Priority.BULK, size_check=True,
+                                archive=build_archive(request)) as crawler:
+            # Close the generator right away on cancellation so pending pages stop too
+            async with aclosing(_crawl_results(request, crawler, dedup)) as entries:
+                async for entry in entries:
+                    results.append(await _to_dataset(dataset, entry))
+        if dataset is not None:
+            await dataset.close()
 
         # Prepare summary
         successful = sum(1 for r in results if r["success"])
         failed = len(results) - successful
 
-        return {
+        content = {
             "status": "success",
             "mode": request.mode,
-            "summary": {
-                "total_urls": len(request.urls),
-                "successful": successful,
-                "failed": failed
-            },
+            "summary": _summary(request, successful, failed, dedup),
             "results": results
         }
+        if dataset is not None:
+            content["dataset"] = dataset.summary()
+        return await render_response(http_request, content)
 
+    except HTTPException:
+        raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e)) 
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        if dataset is not None:
+            await dataset.close()
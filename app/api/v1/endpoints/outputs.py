@@ -0,0 +1,111 @@
+from fastapi import APIRouter, HTTPException, Request
+from pydantic import Field
+from enum import Enum
+from typing import List, Optional
+import asyncio
+from app.api.v1.endpoints.extraction import ExtractionSchema
+from app.core.metrics import track_timings
+from app.core.serialization import render_response
+from app.models.requests import ContentCrawlRequest
+from app.services.chunking import open_chunker
+from app.services.crawler import CrawlSession, build_archive, build_content_options, build_crawler_options
+from app.services.extraction import ExtractionEngine, UnsupportedSchemaError, extract_items_async, get_extractor
+from app.services.page_limits import cap_page_fields, field_limits
+
+router = APIRouter(
+    prefix="/outputs",  # This makes the endpoint /crawl/outputs
+    tags=["outputs"],
+    responses={404: {"description": "Not found"}},
+)
+
+class OutputKind(str, Enum):
+    MARKDOWN = "markdown"          # Markdown after content filtering
+    CLEANED_HTML = "cleaned_html"  # HTML after content filtering
+    HTML = "html"                  # Raw page HTML
+    LINKS = "links"                # Internal and external links
+    MEDIA = "media"                # Images, videos and audio
+    METADATA = "metadata"          # Title, description and other page metadata
+
+class MultiOutputCrawlRequest(ContentCrawlRequest):
+    outputs: List[OutputKind] = Field(default_factory=lambda: [OutputKind.MARKDOWN, OutputKind.LINKS, OutputKind.MEDIA])
+    extractions: List[ExtractionSchema] = Field(default_factory=list)  # Applied to the same page snapshot
+    wait_for: Optional[str] = None  # Defaults to the first extraction's base selector
+    max_field_bytes: Optional[int] = None
+    engine: Optional[ExtractionEngine] = None  # Extraction engine, defaults to the EXTRACTION_ENGINE setting
+
+@router.post("/")
+async def multi_output_crawl(request: MultiOutputCrawlRequest, http_request: Request):
+    """
+    Fetch a page once and run several processors on the same snapshot:
+    content-filtered markdown, links, media and any number of extraction
+    schemas. Each processor's output is returned under its own key, so one
+    navigation replaces separate content, extraction and cached calls.
+    """
+    track_timings(request.include_timings)
+    chunker = open_chunker(request.chunking)
+    if chunker is not None and request.chunking.stream:
+        raise HTTPException(status_code=400, detail="Streamed chunks are only available from /crawl/basic and /crawl/content")
+    if chunker is not None and OutputKind.MARKDOWN not in request.outputs:
+        raise HTTPException(status_code=400, detail='Chunking splits the markdown output; add "markdown" to outputs')
+    names = [schema.name for schema in request.extractions]
+    if len(names) != len(set(names)):
+        raise HTTPException(status_code=400, detail="Extraction schema names must be unique")
+    for schema in request.extractions:
+        try:
+            get_extractor(schema.to_strategy_schema(), request.engine)
+        except UnsupportedSchemaError as e:
+            raise HTTPException(status_code=400, detail=f"{schema.name}: {e}")
+
+    try:
+        crawler_options = build_crawler_options(request)
+        content_options = build_content_options(request)
+
+        wait_for = request.wait_for
+        if wait_for is None and request.extractions:
+            wait_for = request.extractions[0].base_selector
+        if wait_for is not None:
+            content_options["wait_for"] = wait_for
+
+        # Waiting for an element and extracting from it both need the rendered page
+        async with CrawlSession(crawler_options, route=wait_for is None and not request.extractions,
+                                priority=request.priority, archive=build_archive(request)) as crawler:
+            result = await crawler.arun(url=str(request.url), **content_options)
+
+        if not getattr(result, 'success', True):
+            raise HTTPException(status_code=500, detail=getattr(result, 'error_message', 'Unknown error occurred'))
+
+        url = str(request.url)
+        outputs = {}
+        for kind in request.outputs:
+            outputs[kind.value] = getattr(result, kind.value, None)
+
+        # Every schema runs against the same raw HTML; parsing happens in the threadpool
+        if request.extractions:
+            html = getattr(result, 'html', None) or ""
+            extracted = await asyncio.gather(*[
+                extract_items_async(schema.to_strategy_schema(), url, html, request.engine)
+                for schema in request.extractions
+            ])
+            outputs["extractions"] = {
+                schema.name: items for schema, items in zip(request.extractions, extracted)
+            }
+        del result
+        # Chunks are cut from the whole markdown, before field limits apply
+        if chunker is not None and isinstance(outputs.get("markdown"), str):
+            await chunker.add_to(outputs, outputs["markdown"])
+
+        response = {
+            "url": url,
+            "status": "success",
+            "outputs": outputs
+        }
+        truncated = cap_page_fields(outputs, field_limits(request.max_field_bytes))
+        if truncated:
+            response["truncated"] = truncated
+
+        return await render_response(http_request, response)
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
@@ -1,5 +1,5 @@
 from fastapi import APIRouter
-from app.api.v1.endpoints import extraction, docs, cache, multi, human_docs, basic, content
+from app.api.v1.endpoints import extraction, docs, cache, multi, human_docs, basic, content, admin, outputs, bulk, monitors
 
 router = APIRouter()
 router.include_router(basic.router, prefix="/crawl", tags=["crawl"])
@@ -8,4 +8,9 @@ router.include_router(extraction.router, prefix="/crawl", tags=["crawl"])
 router.include_router(docs.router, tags=["documentation"])
 router.include_router(cache.router, prefix="/crawl", tags=["crawl"])
 router.include_router(multi.router, prefix="/crawl", tags=["crawl"])
-router.include_router(human_docs.router, tags=["documentation"]) 
\ No newline at end of file
+router.include_router(outputs.router, prefix="/crawl", tags=["crawl"])
+router.include_router(bulk.router, prefix="/crawl", tags=["crawl"])
+router.include_router(bulk.jobs_router)
+router.include_router(monitors.router)
+router.include_router(human_docs.router, tags=["documentation"])
+router.include_router(admin.router)
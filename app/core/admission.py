@@ -0,0 +1,287 @@
+import asyncio
+import math
+import os
+import time
+from collections import Counter, deque
+from enum import Enum
+from typing import Deque, Dict, Optional
+
+from fastapi import HTTPException
+
+from app.core.config import settings
+
+try:
+    import psutil
+except ImportError:  # Without psutil only the concurrency limit applies
+    psutil = None
+
+# Assumed browser session length until real ones have been observed
+DEFAULT_HOLD_SECONDS = 5.0
+MAX_RETRY_AFTER_SECONDS = 120
+
+
+class Priority(str, Enum):
+    INTERACTIVE = "interactive"  # Single-page calls a client is waiting on
+    BULK = "bulk"                # Multi-URL jobs and background work
+
+
+class OverloadedError(HTTPException):
+    """
+    No browser capacity: the queue is full, the wait timed out or memory is short.
+    """
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(
+            status_code=503,
+            detail=f"Server overloaded ({reason}), retry in {retry_after}s",
+            headers={"Retry-After": str(retry_after)},
+        )
+        self.reason = reason
+
+
+class _PriorityClass:
+    """
+    Queue and counters of one priority class.
+    """
+
+    def __init__(self, weight: float):
+        self.weight = weight
+        self.waiters: Deque[asyncio.Future] = deque()
+        self.active = 0
+        # Stride scheduling: the backlogged class with the lowest pass is served next
+        self.pass_value = 0.0
+        self.hold_ewma: Optional[float] = None
+        self.wait_times: Deque[float] = deque(maxlen=1000)
+        self.admitted_total = 0
+        self.rejected_total: Counter = Counter()
+
+    def head(self) -> Optional[asyncio.Future]:
+        while self.waiters and self.waiters[0].done():
+            self.waiters.popleft()
+        return self.waiters[0] if self.waiters else None
+
+
+class AdmissionController:
+    """
+    Process-wide budget for browser sessions.
+
+    At most `max_active` sessions hold a browser at once, and a new one is
+    only admitted while memory stays within budget. Requests beyond that
+    wait in a bounded FIFO queue per priority class; when the queue is full
+    or the wait runs out they are rejected with a Retry-After derived from
+    recent session lengths.
+
+    Freed slots go to the waiting classes in proportion to their weights
+    (stride scheduling), and bulk sessions never take the last
+    `interactive_reserved` slots, so single-page calls find a browser
+    without queueing behind long multi-URL jobs.
+    """
+
+    def __init__(self, max_active: int, max_queue: int, queue_timeout: float,
+                 weights: Optional[Dict[Priority, float]] = None, interactive_reserved: int = 0,
+                 memory_limit_mb: int = 0, min_available_mb: int = 0, poll_interval: float = 0.5):
+        self.max_active = max_active
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.interactive_reserved = min(interactive_reserved, max_active)
+        self.memory_limit = memory_limit_mb * 1024 * 1024
+        self.min_available = min_available_mb * 1024 * 1024
+        self.poll_interval = poll_interval
+
+        weights = weights or {}
+        self.classes: Dict[Priority, _PriorityClass] = {
+            priority: _PriorityClass(max(weights.get(priority, 1.0), 0.01)) for priority in Priority
+        }
+        self.active = 0
+        self._virtual_time = 0.0
+        self._memory_checked_at = 0.0
+        self._memory_ok = True
+        self._memory_rss = None
+
+    # Memory
+
+    def _process_tree_rss(self) -> int:
+        # The service plus the browsers it launched
+        proc = psutil.Process(os.getpid())
+        rss = proc.memory_info().rss
+        for child in proc.children(recursive=True):
+            try:
+                rss += child.memory_info().rss
+            except psutil.Error:
+                pass
+        return rss
+
+    def memory_ok(self) -> bool:
+        if psutil is None or not (self.memory_limit or self.min_available):
+            return True
+        now = time.monotonic()
+        # Walking the process tree costs ~1 ms; reuse the answer for a poll interval
+        if now - self._memory_checked_at >= self.poll_interval:
+            self._memory_checked_at = now
+            ok = True
+            if self.memory_limit:
+                self._memory_rss = self._process_tree_rss()
+                ok = self._memory_rss < self.memory_limit
+            if ok and self.min_available:
+                ok = psutil.virtual_memory().available > self.min_available
+            self._memory_ok = ok
+        return self._memory_ok
+
+    # Slots
+
+    def _slot_limit(self, priority: Priority) -> int:
+        if priority == Priority.INTERACTIVE:
+            return self.max_active
+        return self.max_active - self.interactive_reserved
+
+    def retry_after(self, priority: Priority) -> int:
+        cls = self.classes[priority]
+        hold = cls.hold_ewma or DEFAULT_HOLD_SECONDS
+        estimate = hold * (len(cls.waiters) + 1) / max(self._slot_limit(priority), 1)
+        return min(MAX_RETRY_AFTER_SECONDS, max(1, math.ceil(estimate)))
+
+    def _reject(self, priority: Priority, reason: str):
+        self.classes[priority].rejected_total[reason] += 1
+        raise OverloadedError(reason, self.retry_after(priority))
+
+    def _has_capacity(self, priority: Priority) -> bool:
+        cls = self.classes[priority]
+        return (
+            self.active < self.max_active
+            and (priority == Priority.INTERACTIVE or cls.active < self._slot_limit(priority))
+            and self.memory_ok()
+        )
+
+    def _grant(self, priority: Priority):
+        self.active += 1
+        self.classes[priority].active += 1
+
+    def _dispatch(self):
+        while True:
+            ready = [
+                priority for priority, cls in self.classes.items()
+                if cls.head() is not None and self._has_capacity(priority)
+            ]
+            if not ready:
+                return
+            priority = min(ready, key=lambda p: self.classes[p].pass_value)
+            cls = self.classes[priority]
+            self._virtual_time = cls.pass_value
+            cls.pass_value += 1.0 / cls.weight
+            self._grant(priority)
+            cls.waiters.popleft().set_result(None)
+
+    def check(self, priority: Priority):
+        """
+        Reject right away when a new request could not even be queued.
+        Used before starting responses that cannot report a 503 later.
+        """
+        if len(self.classes[priority].waiters) >= self.max_queue and not self._has_capacity(priority):
+            self._reject(priority, "queue_full")
+
+    async def acquire(self, priority: Priority = Priority.INTERACTIVE) -> float:
+        """
+        Wait for a slot. Returns the admission time to pass to release().
+        """
+        cls = self.classes[priority]
+        start = time.monotonic()
+        if cls.head() is None and self._has_capacity(priority):
+            self._grant(priority)
+        else:
+            if len(cls.waiters) >= self.max_queue:
+                self._reject(priority, "queue_full")
+            if not cls.waiters:
+                # A class that was idle rejoins at the current virtual time, without banked credit
+                cls.pass_value = max(cls.pass_value, self._virtual_time)
+            waiter = asyncio.get_running_loop().create_future()
+            cls.waiters.append(waiter)
+            deadline = start + self.queue_timeout
+            try:
+                while not waiter.done():
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    # Wake up periodically: memory can free up without any release
+                    await asyncio.wait({waiter}, timeout=min(remaining, self.poll_interval))
+                    self._dispatch()
+            except BaseException:
+                self._abandon(priority, waiter)
+                raise
+            if not waiter.done():
+                self._abandon(priority, waiter)
+                self._reject(priority, "memory" if not self.memory_ok() else "queue_timeout")
+
+        admitted = time.monotonic()
+        cls.wait_times.append(admitted - start)
+        cls.admitted_total += 1
+        return admitted
+
+    def _abandon(self, priority: Priority, waiter: asyncio.Future):
+        if waiter.done() and not waiter.cancelled():
+            # The slot was granted just as we gave up; pass it on
+            self.release(priority)
+        else:
+            waiter.cancel()
+            try:
+                self.classes[priority].waiters.remove(waiter)
+            except ValueError:
+                pass
+
+    def release(self, priority: Priority = Priority.INTERACTIVE, admitted_at: Optional[float] = None):
+        cls = self.classes[priority]
+        self.active -= 1
+        cls.active -= 1
+        if admitted_at is not None:
+            held = time.monotonic() - admitted_at
+            cls.hold_ewma = held if cls.hold_ewma is None else 0.8 * cls.hold_ewma + 0.2 * held
+        self._dispatch()
+
+    def snapshot(self) -> Dict:
+        def percentile(waits, p):
+            return round(waits[min(len(waits) - 1, int(p * len(waits)))] * 1000, 1) if waits else None
+
+        classes = {}
+        for priority, cls in self.classes.items():
+            waits = sorted(cls.wait_times)
+            classes[priority.value] = {
+                "weight": cls.weight,
+                "slot_limit": self._slot_limit(priority),
+                "active": cls.active,
+                "queued": len(cls.waiters),
+                "admitted_total": cls.admitted_total,
+                "rejected_total": dict(cls.rejected_total),
+                "wait_ms": {"p50": percentile(waits, 0.5), "p95": percentile(waits, 0.95),
+                            "p99": percentile(waits, 0.99), "max": percentile(waits, 1.0)},
+                "avg_session_s": round(cls.hold_ewma, 2) if cls.hold_ewma is not None else None,
+            }
+
+        return {
+            "active": self.active,
+            "max_active": self.max_active,
+            "interactive_reserved": self.interactive_reserved,
+            "queued": sum(len(cls.waiters) for cls in self.classes.values()),
+            "max_queue": self.max_queue,
+            "queue_timeout_s": self.queue_timeout,
+            "classes": classes,
+            "memory": {
+                "ok": self._memory_ok,
+                "process_tree_rss_mb": round(self._memory_rss / 1024 / 1024, 1) if self._memory_rss else None,
+                "limit_mb": self.memory_limit // (1024 * 1024) or None,
+                "min_available_mb": self.min_available // (1024 * 1024) or None,
+                "psutil": psutil is not None,
+            },
+        }
+
+
+admission = AdmissionController(
+    max_active=settings.ADMISSION_MAX_BROWSERS,
+    max_queue=settings.ADMISSION_MAX_QUEUE,
+    queue_timeout=settings.ADMISSION_QUEUE_TIMEOUT,
+    weights={
+        Priority.INTERACTIVE: settings.ADMISSION_INTERACTIVE_WEIGHT,
+        Priority.BULK: settings.ADMISSION_BULK_WEIGHT,
+    },
+    interactive_reserved=settings.ADMISSION_INTERACTIVE_RESERVED,
+    memory_limit_mb=settings.ADMISSION_MEMORY_LIMIT_MB,
+    min_available_mb=settings.ADMISSION_MIN_AVAILABLE_MB,
+)
@@ -0,0 +1,193 @@
+import zlib
+from typing import Callable, Dict, List, Optional
+
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.core.config import settings
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Bodies of these types are already compressed
+INCOMPRESSIBLE_PREFIXES = ("image/", "video/", "audio/", "application/zip", "application/gzip",
+                           "application/x-gzip", "application/zstd")
+
+
+class _Gzip:
+    def __init__(self):
+        self._obj = zlib.compressobj(settings.COMPRESSION_GZIP_LEVEL, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._obj.compress(data) + self._obj.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._obj.flush(zlib.Z_FINISH)
+
+
+class _Brotli:
+    def __init__(self):
+        self._obj = brotli.Compressor(quality=settings.COMPRESSION_BROTLI_QUALITY)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._obj.process(data) + self._obj.flush()
+
+    def finish(self) -> bytes:
+        return self._obj.finish()
+
+
+class _Zstd:
+    def __init__(self):
+        self._obj = zstandard.ZstdCompressor(level=settings.COMPRESSION_ZSTD_LEVEL).compressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        return self._obj.compress(data) + self._obj.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self) -> bytes:
+        return self._obj.flush(zstandard.COMPRESSOBJ_FLUSH_FINISH)
+
+
+def available_encodings() -> Dict[str, Callable]:
+    encoders = {"gzip": _Gzip}
+    if brotli is not None:
+        encoders["br"] = _Brotli
+    if zstandard is not None:
+        encoders["zstd"] = _Zstd
+    return encoders
+
+
+def negotiate_encoding(accept_encoding: str, preference: List[str]) -> Optional[str]:
+    """
+    Pick a content coding from an Accept-Encoding header. The client's
+    q-values decide first; ties go to the server's preference order.
+    """
+    weights = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        weights[name] = q
+
+    best, best_q = None, 0.0
+    for encoding in preference:
+        q = weights.get(encoding, weights.get("*", 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+class CompressionMiddleware:
+    """
+    Compress responses with zstd, brotli or gzip as negotiated through
+    Accept-Encoding.
+
+    Complete bodies below COMPRESSION_MIN_SIZE are sent as-is. Streaming
+    bodies (NDJSON, chunked markdown) are compressed chunk by chunk and
+    flushed after each chunk so clients see lines as they are produced.
+    Chunks of COMPRESSION_THREADPOOL_MIN_SIZE or more are compressed in the
+    threadpool; zlib, brotli and zstandard release the GIL while working.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        self.encoders = available_encodings()
+        self.preference = [e.strip() for e in settings.COMPRESSION_ENCODINGS.split(",")
+                           if e.strip() in self.encoders]
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or not settings.COMPRESSION_ENABLED:
+            await self.app(scope, receive, send)
+            return
+        encoding = negotiate_encoding(Headers(scope=scope).get("accept-encoding", ""), self.preference)
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        responder = _CompressionResponder(send, encoding, self.encoders[encoding])
+        await self.app(scope, receive, responder.send)
+
+
+class _CompressionResponder:
+    def __init__(self, send: Send, encoding: str, encoder_factory: Callable):
+        self._send = send
+        self.encoding = encoding
+        self.encoder_factory = encoder_factory
+        self.start_message: Optional[Message] = None
+        self.encoder = None
+        self.passthrough = False
+
+    async def _compress(self, data: bytes) -> bytes:
+        if len(data) >= settings.COMPRESSION_THREADPOOL_MIN_SIZE:
+            return await run_in_threadpool(self.encoder.compress, data)
+        return self.encoder.compress(data)
+
+    async def _finish(self, data: bytes) -> bytes:
+        body = await self._compress(data) if data else b""
+        return body + self.encoder.finish()
+
+    async def send(self, message: Message):
+        message_type = message["type"]
+        if message_type == "http.response.start":
+            headers = Headers(raw=message["headers"])
+            content_type = headers.get("content-type", "")
+            self.passthrough = (
+                "content-encoding" in headers
+                or content_type.startswith(INCOMPRESSIBLE_PREFIXES)
+            )
+            if self.passthrough:
+                await self._send(message)
+            else:
+                # Held back until we know whether the body is worth compressing
+                self.start_message = message
+            return
+
+        if message_type != "http.response.body" or self.passthrough:
+            await self._send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        if self.start_message is not None:
+            start, self.start_message = self.start_message, None
+            if not more_body and len(body) < settings.COMPRESSION_MIN_SIZE:
+                self.passthrough = True
+                await self._send(start)
+                await self._send(message)
+                return
+
+            headers = MutableHeaders(raw=start["headers"])
+            headers["Content-Encoding"] = self.encoding
+            headers.add_vary_header("Accept-Encoding")
+            self.encoder = self.encoder_factory()
+            if not more_body:
+                body = await self._finish(body)
+                headers["Content-Length"] = str(len(body))
+                await self._send(start)
+                await self._send({"type": "http.response.body", "body": body})
+                return
+            # Streaming: length is unknown once compressed
+            del headers["Content-Length"]
+            await self._send(start)
+
+        if more_body:
+            chunk = await self._compress(body) if body else b""
+            if chunk:
+                await self._send({"type": "http.response.body", "body": chunk, "more_body": True})
+        else:
+            await self._send({"type": "http.response.body", "body": await self._finish(body)})
@@ -1,3 +1,4 @@
+import os
 from pydantic import BaseModel
 
 class Settings(BaseModel):
@@ -5,4 +6,185 @@ class Settings(BaseModel):
     PROJECT_NAME: str = "Crawl4AI Service"
     VERSION: str = "1.0.0"
 
-settings = Settings() 
\ No newline at end of file
+    # Local state (learned tables, archives, ...) lives under this directory
+    DATA_DIR: str = "data"
+
+    # Render routing: learn per domain / path prefix whether HTTP-only
+    # fetching gives the same result as a full browser render
+    RENDER_ROUTING_ENABLED: bool = True
+    RENDER_ROUTING_FILE: str = "render_routing.json"
+    RENDER_ROUTING_MIN_SAMPLES: int = 3      # Sampled pages before a prefix is decided
+    RENDER_ROUTING_WINDOW: int = 10          # Most recent samples kept per prefix
+    RENDER_ROUTING_MATCH_RATIO: float = 0.9  # Fraction of samples that must match to go static
+    RENDER_ROUTING_TEXT_RATIO: float = 0.9   # Static text length must reach this share of the browser's
+    RENDER_ROUTING_RESAMPLE_RATE: float = 0.05  # Share of static-routed pages re-verified in a browser
+    RENDER_ROUTING_SAVE_INTERVAL: float = 10.0  # Seconds between writes of newly sampled pages to the file
+
+    # Per-page memory bounds (0 disables a cap). Oversized fields are truncated with a marker.
+    MAX_HTML_BYTES: int = 5_000_000
+    MAX_CLEANED_HTML_BYTES: int = 5_000_000
+    MAX_MARKDOWN_BYTES: int = 2_000_000
+    # /crawl/multi and bulk jobs refuse pages advertising a larger Content-Length before
+    # rendering them; the HEAD probe is skipped for proxied, cached and static fetches
+    MAX_DOWNLOAD_BYTES: int = 25_000_000
+    DOWNLOAD_PROBE_TIMEOUT: float = 3.0
+    MARKDOWN_STREAM_CHUNK_CHARS: int = 64 * 1024
+
+    # Crawl responses larger than this are JSON-encoded in pieces, yielding to
+    # the event loop after every piece of at least JSON_COOPERATIVE_CHUNK_BYTES
+    JSON_COOPERATIVE_THRESHOLD_BYTES: int = 1_000_000
+    JSON_COOPERATIVE_CHUNK_BYTES: int = 256 * 1024
+
+    # Response compression negotiated through Accept-Encoding
+    COMPRESSION_ENABLED: bool = True
+    COMPRESSION_ENCODINGS: str = "zstd,br,gzip"  # Server preference when the client has no preference
+    COMPRESSION_MIN_SIZE: int = 1024             # Smaller complete bodies are sent uncompressed
+    COMPRESSION_GZIP_LEVEL: int = 6
+    COMPRESSION_BROTLI_QUALITY: int = 4
+    COMPRESSION_ZSTD_LEVEL: int = 3
+    COMPRESSION_THREADPOOL_MIN_SIZE: int = 64 * 1024  # Chunks this large are compressed off the event loop
+    # Pages and records this large are chunked, fingerprinted or written to disk
+    # in the threadpool; smaller ones cost less than the hop to a thread
+    THREADPOOL_MIN_SIZE: int = 64 * 1024
+
+    # CSS extraction engine: "crawl4ai" (BeautifulSoup), "lxml" (compiled XPath),
+    # or "auto" to use lxml whenever it supports the schema. lxml is opt-in:
+    # its parser can recover malformed HTML differently from BeautifulSoup
+    EXTRACTION_ENGINE: str = "crawl4ai"
+
+    # Admission control: a process-wide budget for browser sessions. Requests
+    # beyond it queue; a full queue or a timed-out wait is answered with 503
+    ADMISSION_ENABLED: bool = True
+    ADMISSION_MAX_BROWSERS: int = 4
+    ADMISSION_MAX_QUEUE: int = 32
+    ADMISSION_QUEUE_TIMEOUT: float = 30.0
+    ADMISSION_MEMORY_LIMIT_MB: int = 0    # RSS of the service plus its browsers (0 disables, needs psutil)
+    ADMISSION_MIN_AVAILABLE_MB: int = 0   # Free system memory to keep (0 disables, needs psutil)
+    # Priority classes share the budget by weight; bulk work never takes the reserved slots
+    ADMISSION_INTERACTIVE_WEIGHT: float = 4.0
+    ADMISSION_BULK_WEIGHT: float = 1.0
+    ADMISSION_INTERACTIVE_RESERVED: int = 1
+
+    # Adaptive (AIMD) page concurrency for /crawl/multi in "adaptive" mode:
+    # +1 per window of healthy pages, x ADAPTIVE_BACKOFF on timeouts, 429/503,
+    # slow pages or memory pressure. Global across requests and per domain.
+    ADAPTIVE_INITIAL_CONCURRENCY: int = 4
+    ADAPTIVE_MIN_CONCURRENCY: int = 1
+    ADAPTIVE_MAX_CONCURRENCY: int = 32
+    ADAPTIVE_DOMAIN_INITIAL_CONCURRENCY: int = 2
+    ADAPTIVE_DOMAIN_MAX_CONCURRENCY: int = 8
+    ADAPTIVE_BACKOFF: float = 0.5
+    ADAPTIVE_LATENCY_TOLERANCE: float = 2.0  # Pages slower than this multiple of the baseline count as congestion
+    ADAPTIVE_MAX_ERROR_RATE: float = 0.25    # Above this recent error rate the limit stops growing
+
+    # Request deadlines (seconds), from X-Request-Timeout or ?timeout=; 0 means none
+    REQUEST_TIMEOUT_DEFAULT: float = 0.0
+    REQUEST_TIMEOUT_MAX: float = 900.0
+    DEADLINE_GRACE: float = 1.0  # Backstop cancellation this long after the deadline
+
+    # Retries of transient page failures in /crawl/multi (full-jitter exponential backoff)
+    RETRY_MAX_ATTEMPTS: int = 3
+    RETRY_BASE_DELAY: float = 0.5
+    RETRY_MAX_DELAY: float = 10.0
+    # Per-domain circuit breakers: open after this many consecutive domain failures
+    BREAKER_FAILURE_THRESHOLD: int = 5
+    BREAKER_COOLDOWN: float = 30.0       # Fast-fail period before a probe is let through
+    BREAKER_MAX_COOLDOWN: float = 300.0  # Cooldown doubles after each failed probe, up to this
+
+    # Per-client quotas on /crawl endpoints, by X-API-Key or client address.
+    # Tokens are pages: a request takes one, /crawl/multi one per URL.
+    # Off by default: behind a proxy every keyless client shares the proxy's
+    # address unless QUOTA_TRUST_FORWARDED_FOR is set.
+    QUOTAS_ENABLED: bool = False
+    QUOTA_RATE: float = 5.0          # Tokens refilled per second (0 disables the rate limit)
+    QUOTA_BURST: float = 50.0
+    QUOTA_MAX_CONCURRENT: int = 8    # In-flight requests per client (0 disables)
+    QUOTA_CLIENTS_FILE: str = "quotas.json"  # Per-key client names and limits, under DATA_DIR
+    QUOTA_REQUIRE_API_KEY: bool = False
+    QUOTA_TRUST_FORWARDED_FOR: bool = False  # Identify keyless clients by X-Forwarded-For behind a proxy
+
+    # Prometheus metrics, scraped from /metrics
+    METRICS_ENABLED: bool = True
+
+    # HAR archives for record/replay crawls, under DATA_DIR
+    ARCHIVE_DIR: str = "archives"
+    ARCHIVE_MAX_ENTRY_BYTES: int = 10_000_000  # Larger responses are passed through but not recorded
+
+    # Memory diagnostics under /admin/memory. Off unless enabled, and then only
+    # for requests with X-Admin-Key: DIAGNOSTICS_API_KEY (unset keeps them off).
+    # Heap tracing is off until started there and stops on its own after
+    # DIAGNOSTICS_TRACE_MAX_SECONDS (0: never)
+    DIAGNOSTICS_ENABLED: bool = False
+    DIAGNOSTICS_API_KEY: str = ""
+    DIAGNOSTICS_TRACE_FRAMES: int = 1        # Default stack depth recorded per allocation
+    DIAGNOSTICS_TRACE_MAX_SECONDS: float = 3600.0
+    DIAGNOSTICS_MAX_SNAPSHOTS: int = 8       # Older heap snapshots are dropped
+
+    # Health probes: /health/live and /health/ready. A canary page is rendered in a
+    # new browser every HEALTH_CANARY_INTERVAL seconds (0 disables the canary)
+    HEALTH_CANARY_INTERVAL: float = 30.0
+    HEALTH_CANARY_TIMEOUT: float = 20.0
+    HEALTH_CANARY_FAILURES: int = 2            # Consecutive canary failures before unready
+    HEALTH_READY_MIN_FREE_SLOTS: int = 0       # Unready with fewer free browser slots than this
+    HEALTH_READY_MAX_QUEUED: int = 0           # Unready with more requests waiting for a browser
+    HEALTH_LIVE_MAX_FAILING_SECONDS: float = 600.0  # Not live once the canary has failed this long (0: never)
+
+    # Remote browsers: comma-separated CDP endpoints (e.g. "http://browsers-0:9222,http://browsers-1:9222").
+    # When set, sessions connect to the least busy healthy one instead of launching Chromium here
+    BROWSER_CDP_ENDPOINTS: str = ""
+    BROWSER_CDP_CHECK_INTERVAL: float = 10.0  # Seconds between /json/version checks (0 disables them)
+    BROWSER_CDP_CHECK_TIMEOUT: float = 3.0
+    BROWSER_CDP_MAX_FAILURES: int = 2         # Failed connections in a row before a browser leaves rotation
+
+    # Bulk jobs: URL files uploaded to /crawl/bulk and crawled in the background, under DATA_DIR
+    BULK_DIR: str = "bulk"
+    BULK_MAX_UPLOAD_BYTES: int = 1_000_000_000
+    BULK_MAX_RUNNING_JOBS: int = 2      # Later jobs wait in "queued"
+    BULK_RETENTION_HOURS: float = 72.0  # Finished jobs and their files are deleted after this (0 keeps them)
+    BULK_PROGRESS_INTERVAL: float = 5.0  # Running jobs rewrite job.json this often, for other workers to read
+    BULK_STALE_SECONDS: float = 60.0     # An unfinished job not saved for this long is reported as interrupted
+
+    # Parquet datasets that crawl and extraction results can be written to, under DATA_DIR
+    DATASET_DIR: str = "datasets"
+    DATASET_ROW_GROUP_ROWS: int = 10_000          # Rows per row group, per partition; requests can lower it
+    DATASET_ROW_GROUP_BYTES: int = 64 * 1024 * 1024  # Text buffered per partition before a row group is written
+    DATASET_MAX_BUFFER_BYTES: int = 256 * 1024 * 1024  # Text buffered across a request's partitions before the largest is written
+    DATASET_COMPRESSION: str = "zstd"             # Any Parquet codec pyarrow supports: zstd, snappy, gzip, none
+
+    # Change monitors: watched URLs rechecked on adaptive schedules, under DATA_DIR
+    MONITOR_DIR: str = "monitors"
+    # Background checks; off by default because every worker would check the same
+    # monitors. Enable it in exactly one worker (or in a single-worker deployment)
+    MONITOR_SCHEDULER_ENABLED: bool = False
+    MONITOR_TICK_SECONDS: float = 15.0
+    MONITOR_MAX_URLS_PER_ROUND: int = 500   # Due URLs checked per monitor and tick
+    MONITOR_MIN_INTERVAL: float = 300.0     # Defaults of the per-monitor interval bounds (seconds)
+    MONITOR_MAX_INTERVAL: float = 7 * 86400.0
+    MONITOR_INITIAL_INTERVAL: float = 3600.0
+    MONITOR_CHANGE_FRACTION: float = 0.5    # Check interval as a fraction of the estimated time between changes
+    MONITOR_MAX_GROWTH: float = 2.0         # Largest step up of an interval after an unchanged check
+    MONITOR_HISTORY_DECAY: float = 0.9      # Weight of past checks in the change rate estimate
+    MONITOR_CONDITIONAL_TIMEOUT: float = 10.0  # Conditional HEAD before rendering a page that sent ETag/Last-Modified
+    MONITOR_MAX_CHANGES_BYTES: int = 256 * 1024 * 1024  # Change feed size before its oldest half is dropped
+
+    # Near-duplicate detection (MinHash LSH over markdown word shingles)
+    DEDUP_THRESHOLD: float = 0.9        # Estimated Jaccard similarity from which a page is a duplicate
+    DEDUP_SHINGLE_WORDS: int = 5
+    DEDUP_NUM_PERM: int = 128           # Signature values per page
+    DEDUP_BANDS: int = 16               # LSH bands; DEDUP_NUM_PERM / DEDUP_BANDS values each
+    DEDUP_MAX_PAGES: int = 50_000       # Pages per index before the oldest are evicted (about 1 KB each)
+    DEDUP_MAX_INDEXES: int = 16         # Named indexes kept in memory, least recently used dropped
+    DEDUP_PATTERN_MIN_HITS: int = 3     # Duplicates a query parameter or path segment must cause before it is learned
+    DEDUP_PATTERN_MIN_PRECISION: float = 0.9  # Share of the URLs carrying it that must have been duplicates
+
+    # Markdown chunking for LLM ingestion; default budget per chunk in each unit
+    CHUNK_MAX_TOKENS: int = 512   # Estimated tokens
+    CHUNK_MAX_CHARS: int = 2000
+
+
+def _load_settings() -> Settings:
+    # Any setting can be overridden through an environment variable of the same name
+    overrides = {name: os.environ[name] for name in Settings.model_fields if name in os.environ}
+    return Settings(**overrides)
+
+settings = _load_settings()
@@ -0,0 +1,191 @@
+import asyncio
+import time
+from contextvars import ContextVar
+from typing import Awaitable, Optional, TypeVar
+from urllib.parse import parse_qs
+
+from fastapi import HTTPException
+from starlette.datastructures import Headers
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.core.config import settings
+from app.core.serialization import dumps
+
+T = TypeVar("T")
+
+DEADLINE_HEADER = "x-request-timeout"
+DEADLINE_PARAM = "timeout"
+
+
+class DeadlineExceeded(HTTPException):
+    """
+    The request's time budget ran out before the work finished.
+    """
+
+    def __init__(self):
+        super().__init__(status_code=504, detail="Request deadline exceeded")
+
+
+class Deadline:
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        return self.expires_at - time.monotonic()
+
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+
+_current_deadline: ContextVar[Optional[Deadline]] = ContextVar("deadline", default=None)
+
+
+def current_deadline() -> Optional[Deadline]:
+    """
+    Deadline of the request being served, or None when it has none.
+    Tasks and threadpool calls started by the request inherit it.
+    """
+    return _current_deadline.get()
+
+
+def remaining_time(default: Optional[float] = None) -> Optional[float]:
+    """
+    Seconds left for the current request, capped by `default` when given.
+    Raises DeadlineExceeded once the deadline has passed.
+    """
+    deadline = current_deadline()
+    if deadline is None:
+        return default
+    remaining = deadline.remaining()
+    if remaining <= 0:
+        raise DeadlineExceeded()
+    return remaining if default is None else min(default, remaining)
+
+
+async def within_deadline(awaitable: Awaitable[T]) -> T:
+    """
+    Await `awaitable`, cancelling it when the current request's deadline passes.
+    """
+    remaining = remaining_time()
+    if remaining is None:
+        return await awaitable
+    try:
+        return await asyncio.wait_for(awaitable, remaining)
+    except asyncio.TimeoutError:
+        raise DeadlineExceeded()
+
+
+def _requested_timeout(scope: Scope) -> Optional[float]:
+    value = Headers(scope=scope).get(DEADLINE_HEADER)
+    if value is None:
+        values = parse_qs(scope.get("query_string", b"").decode("latin-1")).get(DEADLINE_PARAM)
+        value = values[0] if values else None
+    try:
+        seconds = float(value) if value is not None else settings.REQUEST_TIMEOUT_DEFAULT
+    except ValueError:
+        seconds = settings.REQUEST_TIMEOUT_DEFAULT
+    if seconds <= 0:
+        return None
+    if settings.REQUEST_TIMEOUT_MAX > 0:
+        seconds = min(seconds, settings.REQUEST_TIMEOUT_MAX)
+    return seconds
+
+
+class DeadlineMiddleware:
+    """
+    Give each request a deadline and stop its work when nobody will read
+    the answer.
+
+    The deadline comes from the X-Request-Timeout header or the `timeout`
+    query parameter (seconds), falling back to REQUEST_TIMEOUT_DEFAULT.
+    Crawls read it through current_deadline() and size their page timeouts
+    from it; as a backstop the request is cancelled DEADLINE_GRACE seconds
+    after it passes and answered with 504 if nothing was sent yet.
+
+    Once the request body has been read, the middleware listens for the
+    client disconnecting. If that happens before the response is complete,
+    the request is cancelled, which closes its browser pages and frees its
+    admission slot.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        seconds = _requested_timeout(scope)
+        deadline = Deadline(seconds) if seconds is not None else None
+        body_read = asyncio.Event()
+        disconnected = asyncio.Event()
+        state = {"started": False, "complete": False}
+
+        async def wrapped_receive() -> Message:
+            if body_read.is_set():
+                # The watcher owns the connection now; report what it sees
+                await disconnected.wait()
+                return {"type": "http.disconnect"}
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                disconnected.set()
+            elif message["type"] == "http.request" and not message.get("more_body", False):
+                body_read.set()
+            return message
+
+        async def wrapped_send(message: Message):
+            if message["type"] == "http.response.start":
+                state["started"] = True
+            elif message["type"] == "http.response.body" and not message.get("more_body", False):
+                state["complete"] = True
+            await send(message)
+
+        async def watch_disconnect():
+            await body_read.wait()
+            while True:
+                message = await receive()
+                if message["type"] == "http.disconnect":
+                    disconnected.set()
+                    return
+
+        token = _current_deadline.set(deadline)
+        try:
+            app_task = asyncio.create_task(self.app(scope, wrapped_receive, wrapped_send))
+        finally:
+            _current_deadline.reset(token)
+        watcher = asyncio.create_task(watch_disconnect())
+        disconnect_wait = asyncio.create_task(disconnected.wait())
+        timeout = deadline.seconds + settings.DEADLINE_GRACE if deadline is not None else None
+
+        try:
+            done, _ = await asyncio.wait({app_task, disconnect_wait}, timeout=timeout,
+                                         return_when=asyncio.FIRST_COMPLETED)
+            if app_task in done:
+                app_task.result()
+                return
+            if disconnect_wait in done and state["complete"]:
+                # The response went out; let the app finish (background tasks)
+                await app_task
+                return
+            app_task.cancel()
+            try:
+                await app_task
+            except asyncio.CancelledError:
+                pass
+            if disconnect_wait not in done and not state["started"]:
+                await self._send_timeout(send)
+        finally:
+            for task in (watcher, disconnect_wait, app_task):
+                if not task.done():
+                    task.cancel()
+
+    async def _send_timeout(self, send: Send):
+        body = dumps({"detail": DeadlineExceeded().detail})
+        await send({
+            "type": "http.response.start",
+            "status": 504,
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+        })
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,346 @@
+import asyncio
+import gc
+import os
+import secrets
+import sys
+import time
+import tracemalloc
+from collections import Counter, OrderedDict
+from enum import Enum
+from typing import Any, Dict, List, Optional, Tuple
+
+from fastapi import HTTPException, Request
+from starlette.concurrency import run_in_threadpool
+
+from app.core.config import settings
+
+try:
+    import psutil
+except ImportError:  # Without psutil process memory is not reported
+    psutil = None
+
+# Most frames tracemalloc may keep per allocation; each one costs memory on every traced block
+MAX_TRACE_FRAMES = 25
+# Allocations of the tracer itself and of the import machinery are noise
+SNAPSHOT_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+)
+# Executable names of Chromium builds Playwright launches
+BROWSER_PROCESS_NAMES = ("chrome", "chromium", "headless_shell", "chrome-headless-shell")
+
+# Header carrying DIAGNOSTICS_API_KEY
+DIAGNOSTICS_KEY_HEADER = "x-admin-key"
+
+# (file, line) frames, oldest first; the allocation site is the last one
+FrameKey = Tuple[Tuple[str, int], ...]
+
+
+class HeapGrouping(str, Enum):
+    LINENO = "lineno"        # Allocation site
+    FILENAME = "filename"    # Module of the allocation site
+    TRACEBACK = "traceback"  # Call stack, as deep as the frames being traced
+
+
+class TracingNotStarted(HTTPException):
+    def __init__(self):
+        super().__init__(status_code=409, detail="Heap tracing is not running; start it first")
+
+
+class DiagnosticsUnavailable(HTTPException):
+    def __init__(self):
+        super().__init__(status_code=404, detail="Memory diagnostics are not enabled on this server")
+
+
+class DiagnosticsUnauthorized(HTTPException):
+    def __init__(self):
+        super().__init__(status_code=401, detail=f"Memory diagnostics need a valid {DIAGNOSTICS_KEY_HEADER} header")
+
+
+def require_diagnostics_access(request: Request):
+    """
+    Route dependency of the memory diagnostics: they can walk the whole
+    heap or slow every allocation down, so they are off unless
+    DIAGNOSTICS_ENABLED is set, and then need DIAGNOSTICS_API_KEY.
+    """
+    if not settings.DIAGNOSTICS_ENABLED or not settings.DIAGNOSTICS_API_KEY:
+        raise DiagnosticsUnavailable()
+    key = request.headers.get(DIAGNOSTICS_KEY_HEADER) or ""
+    if not secrets.compare_digest(key.encode(), settings.DIAGNOSTICS_API_KEY.encode()):
+        raise DiagnosticsUnauthorized()
+
+
+def _short_path(filename: str) -> str:
+    # Paths relative to the import root they were found under read better in reports
+    for root in sorted((p for p in sys.path if p), key=len, reverse=True):
+        if filename.startswith(root + os.sep):
+            return filename[len(root) + 1:]
+    return filename
+
+
+def _mb(size: int) -> float:
+    return round(size / 1024 / 1024, 1)
+
+
+class HeapSnapshot:
+    """
+    Allocation statistics of the Python heap at one point in time, kept
+    aggregated by traceback rather than as raw traces so a few snapshots
+    stay cheap to hold.
+    """
+
+    __slots__ = ("id", "label", "taken_at", "frames", "stats")
+
+    def __init__(self, id: int, label: Optional[str], frames: int, stats: Dict[FrameKey, Tuple[int, int]]):
+        self.id = id
+        self.label = label
+        self.taken_at = time.time()
+        self.frames = frames
+        self.stats = stats
+
+    def grouped(self, group_by: HeapGrouping) -> Dict[Any, List[int]]:
+        grouped: Dict[Any, List[int]] = {}
+        for key, (size, count) in self.stats.items():
+            if group_by == HeapGrouping.LINENO:
+                key = key[-1:]
+            elif group_by == HeapGrouping.FILENAME:
+                key = key[-1][0]
+            totals = grouped.setdefault(key, [0, 0])
+            totals[0] += size
+            totals[1] += count
+        return grouped
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "label": self.label,
+            "taken_at": self.taken_at,
+            "frames": self.frames,
+            "traced_mb": _mb(sum(size for size, _ in self.stats.values())),
+            "blocks": sum(count for _, count in self.stats.values()),
+        }
+
+
+def _location(key, group_by: HeapGrouping):
+    if group_by == HeapGrouping.FILENAME:
+        return _short_path(key)
+    frames = [f"{_short_path(filename)}:{lineno}" for filename, lineno in key]
+    # Most recent call first, as in the grouped output of tracemalloc itself
+    return frames[0] if group_by == HeapGrouping.LINENO else frames[::-1]
+
+
+def _take_stats() -> Dict[FrameKey, Tuple[int, int]]:
+    snapshot = tracemalloc.take_snapshot().filter_traces(SNAPSHOT_FILTERS)
+    return {
+        tuple((frame.filename, frame.lineno) for frame in stat.traceback): (stat.size, stat.count)
+        for stat in snapshot.statistics("traceback")
+    }
+
+
+class HeapTracer:
+    """
+    On-demand tracemalloc tracing with a few retained snapshots.
+
+    Tracing is off until started, since every traced allocation costs CPU
+    and memory, and it stops by itself after a bounded time so a forgotten
+    session does not tax a production process for good. Snapshots are
+    reduced to per-traceback totals as they are taken, which makes them
+    small enough to keep and compare later: a leak shows up as the
+    locations that keep growing between two snapshots.
+    """
+
+    def __init__(self, max_snapshots: int, default_frames: int, max_seconds: float):
+        self.max_snapshots = max(max_snapshots, 1)
+        self.default_frames = default_frames
+        self.max_seconds = max_seconds
+        self.snapshots: "OrderedDict[int, HeapSnapshot]" = OrderedDict()
+        self._next_id = 1
+        self._started_at: Optional[float] = None
+        self._stops_at: Optional[float] = None
+        self._stop_handle: Optional[asyncio.TimerHandle] = None
+        self._lock = asyncio.Lock()
+
+    @property
+    def tracing(self) -> bool:
+        return tracemalloc.is_tracing()
+
+    def start(self, frames: Optional[int] = None, seconds: Optional[float] = None):
+        if not self.tracing:
+            frames = min(max(frames or self.default_frames, 1), MAX_TRACE_FRAMES)
+            tracemalloc.start(frames)
+            self._started_at = time.time()
+        # Starting again only moves the stop time; it never exceeds the configured maximum
+        seconds = seconds or self.max_seconds
+        if self.max_seconds:
+            seconds = min(seconds, self.max_seconds)
+        if self._stop_handle is not None:
+            self._stop_handle.cancel()
+            self._stop_handle = None
+        self._stops_at = None
+        if seconds:
+            self._stop_handle = asyncio.get_running_loop().call_later(seconds, self.stop)
+            self._stops_at = time.time() + seconds
+
+    def stop(self):
+        # Snapshots are kept: they are aggregated and no longer need the tracer
+        if self._stop_handle is not None:
+            self._stop_handle.cancel()
+            self._stop_handle = None
+        tracemalloc.stop()
+        self._started_at = self._stops_at = None
+
+    async def take(self, label: Optional[str] = None) -> HeapSnapshot:
+        if not self.tracing:
+            raise TracingNotStarted()
+        async with self._lock:
+            # Walking every traced block takes a while on a large heap; keep the loop serving
+            try:
+                stats = await run_in_threadpool(_take_stats)
+            except RuntimeError:
+                # Tracing stopped (e.g. its time ran out) while the snapshot was being taken
+                raise TracingNotStarted()
+            snapshot = HeapSnapshot(self._next_id, label, tracemalloc.get_traceback_limit(), stats)
+            self._next_id += 1
+            self.snapshots[snapshot.id] = snapshot
+            while len(self.snapshots) > self.max_snapshots:
+                self.snapshots.popitem(last=False)
+        return snapshot
+
+    def get(self, snapshot_id: int) -> Optional[HeapSnapshot]:
+        return self.snapshots.get(snapshot_id)
+
+    def delete(self, snapshot_id: int) -> bool:
+        return self.snapshots.pop(snapshot_id, None) is not None
+
+    @staticmethod
+    def top(snapshot: HeapSnapshot, group_by: HeapGrouping = HeapGrouping.LINENO, limit: int = 25) -> List[Dict[str, Any]]:
+        grouped = snapshot.grouped(group_by)
+        largest = sorted(grouped.items(), key=lambda item: item[1][0], reverse=True)[:limit]
+        return [
+            {"location": _location(key, group_by), "size_kb": round(size / 1024, 1),
+             "count": count, "avg_bytes": size // count if count else 0}
+            for key, (size, count) in largest
+        ]
+
+    @staticmethod
+    def compare(snapshot: HeapSnapshot, base: HeapSnapshot, group_by: HeapGrouping = HeapGrouping.LINENO,
+                limit: int = 25) -> List[Dict[str, Any]]:
+        current, previous = snapshot.grouped(group_by), base.grouped(group_by)
+        diffs = []
+        for key in current.keys() | previous.keys():
+            size, count = current.get(key, (0, 0))
+            old_size, old_count = previous.get(key, (0, 0))
+            if size != old_size or count != old_count:
+                diffs.append((key, size, size - old_size, count, count - old_count))
+        diffs.sort(key=lambda d: abs(d[2]), reverse=True)
+        return [
+            {"location": _location(key, group_by), "size_kb": round(size / 1024, 1),
+             "size_diff_kb": round(size_diff / 1024, 1), "count": count, "count_diff": count_diff}
+            for key, size, size_diff, count, count_diff in diffs[:limit]
+        ]
+
+    def status(self) -> Dict[str, Any]:
+        status: Dict[str, Any] = {"tracing": self.tracing, "snapshots": [s.summary() for s in self.snapshots.values()]}
+        if self.tracing:
+            traced, peak = tracemalloc.get_traced_memory()
+            status.update({
+                "frames": tracemalloc.get_traceback_limit(),
+                "started_at": self._started_at,
+                "stops_at": self._stops_at,
+                "traced_mb": _mb(traced),
+                "peak_mb": _mb(peak),
+                "overhead_mb": _mb(tracemalloc.get_tracemalloc_memory()),
+            })
+        return status
+
+
+heap_tracer = HeapTracer(
+    max_snapshots=settings.DIAGNOSTICS_MAX_SNAPSHOTS,
+    default_frames=settings.DIAGNOSTICS_TRACE_FRAMES,
+    max_seconds=settings.DIAGNOSTICS_TRACE_MAX_SECONDS,
+)
+
+
+def python_heap(object_types: int = 0) -> Dict[str, Any]:
+    """
+    Garbage collector counters and, when `object_types` is set, the most
+    common live object types. Counting types walks every tracked object,
+    so it is only done on request.
+    """
+    heap: Dict[str, Any] = {
+        "gc_counts": list(gc.get_count()),
+        "gc_collections": [generation["collections"] for generation in gc.get_stats()],
+        "gc_uncollectable": len(gc.garbage),
+        "tracked_objects": None,
+    }
+    if object_types:
+        objects = gc.get_objects()
+        heap["tracked_objects"] = len(objects)
+        counts = Counter(f"{type(o).__module__}.{type(o).__qualname__}" for o in objects)
+        del objects
+        heap["object_types"] = [{"type": name, "count": count} for name, count in counts.most_common(object_types)]
+    return heap
+
+
+def _is_browser_process(proc) -> bool:
+    name = proc.name().lower()
+    return any(browser in name for browser in BROWSER_PROCESS_NAMES)
+
+
+def _process_type(proc) -> str:
+    # Chromium tags every helper process with --type=renderer, gpu-process, utility, ...
+    try:
+        for arg in proc.cmdline():
+            if arg.startswith("--type="):
+                return arg[len("--type="):]
+    except psutil.Error:
+        pass
+    return "browser"
+
+
+def process_memory() -> Dict[str, Any]:
+    """
+    RSS of the service and of every process it started, with Chromium
+    processes grouped under the browser they belong to. RSS counts shared
+    pages in every process, so the sums overstate the real footprint.
+    """
+    if psutil is None:
+        return {"psutil": False}
+    proc = psutil.Process(os.getpid())
+    service_rss = proc.memory_info().rss
+    browsers: Dict[int, Dict[str, Any]] = {}
+    others = []
+    parents: Dict[int, int] = {}
+    total = service_rss
+    now = time.time()
+    for child in proc.children(recursive=True):
+        try:
+            rss = child.memory_info().rss
+            is_browser = _is_browser_process(child)
+            ppid = child.ppid()
+            kind = _process_type(child) if is_browser else None
+            started = child.create_time()
+            name = child.name()
+        except psutil.Error:
+            continue  # Exited while we looked
+        total += rss
+        if not is_browser:
+            others.append({"pid": child.pid, "name": name, "rss_mb": _mb(rss)})
+            continue
+        # children() lists parents before their descendants
+        root = parents.get(ppid, child.pid)
+        parents[child.pid] = root
+        browser = browsers.setdefault(root, {
+            "pid": root, "age_s": round(now - started), "rss_mb": 0.0, "processes": Counter(),
+        })
+        browser["rss_mb"] = round(browser["rss_mb"] + rss / 1024 / 1024, 1)
+        browser["processes"][kind] += 1
+    return {
+        "psutil": True,
+        "service_rss_mb": _mb(service_rss),
+        "total_rss_mb": _mb(total),
+        "browsers": [{**b, "processes": dict(b["processes"])} for b in browsers.values()],
+        "other_processes": others,
+    }
@@ -0,0 +1,280 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, Optional
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.core.config import settings
+
+try:
+    from prometheus_client import CONTENT_TYPE_LATEST, Counter, Histogram, generate_latest
+    from prometheus_client.core import REGISTRY, CounterMetricFamily, GaugeMetricFamily
+except ImportError:  # Metrics become no-ops and /metrics reports them unavailable
+    REGISTRY = None
+
+# Page work spans milliseconds (serialization) to minutes (slow navigations)
+STAGE_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+if REGISTRY is not None:
+    REQUEST_DURATION = Histogram(
+        "crawl_request_duration_seconds", "Time to serve a request, until the last body byte is sent",
+        ["endpoint"], buckets=STAGE_BUCKETS,
+    )
+    REQUESTS = Counter("crawl_requests_total", "Requests served", ["endpoint", "status"])
+    STAGE_DURATION = Histogram(
+        "crawl_stage_duration_seconds", "Time spent in one stage of serving a request",
+        ["endpoint", "stage"], buckets=STAGE_BUCKETS,
+    )
+    PAGES = Counter("crawl_pages_total", "Page fetch attempts by result", ["endpoint", "result"])
+    CACHE_LOOKUPS = Counter("crawl_cache_lookups_total", "Crawls that consulted the cache", ["endpoint", "hit"])
+    BYTES_IN = Counter("crawl_request_bytes_total", "Request body bytes received", ["endpoint"])
+    BYTES_OUT = Counter("crawl_response_bytes_total", "Response body bytes sent, after compression", ["endpoint"])
+
+# Scope of the request being served; its "route" is set once routing has matched
+_current_scope: ContextVar[Optional[Scope]] = ContextVar("metrics_scope", default=None)
+
+
+def route_template(scope: Scope) -> str:
+    """
+    Path template of the route a request matched, e.g. "/api/v1/crawl/multi",
+    so labels stay bounded whatever the URLs look like.
+    """
+    # Newer FastAPI keeps included routes unprefixed and records the full path here
+    context = scope.get("fastapi", {}).get("effective_route_context")
+    path = getattr(context, "path", None) or getattr(scope.get("route"), "path", None)
+    return path or "unmatched"
+
+
+def current_endpoint() -> str:
+    scope = _current_scope.get()
+    return route_template(scope) if scope is not None else "none"
+
+
+class Timings:
+    """
+    Stage durations of one request, or of one page of a multi-URL crawl,
+    returned to the client on request. A page's stages also count towards
+    its request, so request-level figures of a parallel crawl are summed
+    over pages and may exceed the wall-clock total.
+    """
+
+    __slots__ = ("stages", "parent", "started")
+
+    def __init__(self, parent: Optional["Timings"] = None):
+        self.stages: Dict[str, float] = {}
+        self.parent = parent
+        self.started = time.perf_counter()
+
+    def add(self, stage: str, seconds: float):
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+        if self.parent is not None:
+            self.parent.add(stage, seconds)
+
+    def as_dict(self) -> Dict[str, float]:
+        timings = {f"{stage}_ms": round(seconds * 1000, 2) for stage, seconds in self.stages.items()}
+        timings["total_ms"] = round((time.perf_counter() - self.started) * 1000, 2)
+        return timings
+
+    def server_timing(self) -> str:
+        # Server-Timing header value, durations in milliseconds
+        entries = [f"{stage};dur={seconds * 1000:.2f}" for stage, seconds in self.stages.items()]
+        entries.append(f"total;dur={(time.perf_counter() - self.started) * 1000:.2f}")
+        return ", ".join(entries)
+
+
+_current_timings: ContextVar[Optional[Timings]] = ContextVar("timings", default=None)
+
+
+def current_timings() -> Optional[Timings]:
+    return _current_timings.get()
+
+
+def track_timings(enabled: bool) -> Optional[Timings]:
+    """
+    Start recording stage timings for the rest of the request when `enabled`.
+    render_response() then adds a Server-Timing header and, for JSON-like
+    bodies, a "timings" object.
+    """
+    if not enabled:
+        return None
+    timings = Timings()
+    _current_timings.set(timings)
+    return timings
+
+
+@contextmanager
+def page_timings(enabled: bool) -> Iterator[Optional[Timings]]:
+    """
+    Record the stages of the enclosed block, one page of a larger request,
+    separately as well as into the request's timings.
+    """
+    if not enabled:
+        yield None
+        return
+    timings = Timings(parent=current_timings())
+    token = _current_timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _current_timings.reset(token)
+
+
+def observe_stage(stage: str, seconds: float):
+    if REGISTRY is not None and settings.METRICS_ENABLED:
+        STAGE_DURATION.labels(current_endpoint(), stage).observe(seconds)
+    timings = _current_timings.get()
+    if timings is not None:
+        timings.add(stage, seconds)
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """
+    Time a block as one stage of the current request.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(name, time.perf_counter() - start)
+
+
+def record_page(result=None, error: Optional[BaseException] = None):
+    """
+    Count a fetched page by outcome, and its cache lookup when it made one.
+    """
+    if REGISTRY is None or not settings.METRICS_ENABLED:
+        return
+    endpoint = current_endpoint()
+    success = error is None and getattr(result, "success", True)
+    PAGES.labels(endpoint, "success" if success else "failure").inc()
+    cache_hit = getattr(result, "cache_hit", None) if result is not None else None
+    if cache_hit is not None:
+        CACHE_LOOKUPS.labels(endpoint, "true" if cache_hit else "false").inc()
+
+
+class _ServiceCollector:
+    """
+    Gauges read from the live admission, concurrency, breaker and quota
+    state at scrape time, so serving requests pays nothing for them.
+    """
+
+    def describe(self):
+        # Keeps registration from calling collect() while the app is still importing
+        return []
+
+    def collect(self):
+        from app.core.admission import admission
+        from app.core.quotas import quota_registry
+        from app.services.concurrency import adaptive_concurrency
+        from app.services.browser_pool import browser_pool
+        from app.services.health import health_monitor
+        from app.services.monitor import monitor_scheduler
+        from app.services.resilience import BreakerState, circuit_breakers
+
+        active = GaugeMetricFamily("crawl_browsers_active", "Browser sessions holding an admission slot", labels=["priority"])
+        queued = GaugeMetricFamily("crawl_admission_queued", "Requests waiting for a browser slot", labels=["priority"])
+        rejected = CounterMetricFamily("crawl_admission_rejected", "Requests refused by admission control", labels=["priority", "reason"])
+        for priority, cls in admission.classes.items():
+            active.add_metric([priority.value], cls.active)
+            queued.add_metric([priority.value], len(cls.waiters))
+            for reason, count in cls.rejected_total.items():
+                rejected.add_metric([priority.value, reason], count)
+        yield active
+        yield queued
+        yield rejected
+        yield GaugeMetricFamily("crawl_browsers_max", "Browser session budget", value=admission.max_active)
+
+        limiter = adaptive_concurrency.global_limiter
+        yield GaugeMetricFamily("crawl_adaptive_limit", "Global adaptive page concurrency limit", value=limiter.limit)
+        yield GaugeMetricFamily("crawl_adaptive_in_flight", "Pages in flight under the adaptive limit", value=limiter.in_flight)
+
+        breakers = GaugeMetricFamily("crawl_circuit_breakers", "Per-domain circuit breakers by state", labels=["state"])
+        states = {state: 0 for state in BreakerState}
+        for entry in circuit_breakers.snapshot().values():
+            states[entry["state"]] += 1
+        for state, count in states.items():
+            breakers.add_metric([state.value], count)
+        yield breakers
+
+        yield GaugeMetricFamily("crawl_quota_clients", "Clients with tracked quotas", value=len(quota_registry.snapshot()))
+
+        if browser_pool.enabled:
+            remote = GaugeMetricFamily("crawl_remote_browser_sessions", "Sessions using each remote browser", labels=["endpoint"])
+            healthy = GaugeMetricFamily("crawl_remote_browser_healthy", "1 while a remote browser is in rotation", labels=["endpoint"])
+            for endpoint in browser_pool.endpoints:
+                remote.add_metric([endpoint.url], endpoint.active)
+                healthy.add_metric([endpoint.url], int(endpoint.healthy))
+            yield remote
+            yield healthy
+
+        ready, _ = health_monitor.readiness()
+        yield GaugeMetricFamily("crawl_ready", "1 while the readiness probe passes", value=int(ready))
+        yield CounterMetricFamily("crawl_canary_failures", "Browser canary checks that failed",
+                                  value=health_monitor.failures_total)
+
+        checks = CounterMetricFamily("crawl_monitor_checks", "Change monitor checks by outcome", labels=["outcome"])
+        for outcome, count in monitor_scheduler.outcomes_total.items():
+            checks.add_metric([outcome.value], count)
+        yield checks
+
+
+if REGISTRY is not None:
+    REGISTRY.register(_ServiceCollector())
+
+
+def render_metrics() -> Optional[bytes]:
+    return generate_latest(REGISTRY) if REGISTRY is not None else None
+
+
+METRICS_CONTENT_TYPE = CONTENT_TYPE_LATEST if REGISTRY is not None else "text/plain"
+
+
+class MetricsMiddleware:
+    """
+    Record duration, status and body bytes of every request, labelled by
+    route template, and make the request's scope available to stage() so
+    stage timings carry the endpoint label too.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or REGISTRY is None or not settings.METRICS_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        counts: Dict[str, int] = {"in": 0, "out": 0, "status": 0}
+
+        async def counting_receive() -> Message:
+            message = await receive()
+            if message["type"] == "http.request":
+                counts["in"] += len(message.get("body", b""))
+            return message
+
+        async def counting_send(message: Message):
+            if message["type"] == "http.response.start":
+                counts["status"] = message["status"]
+            elif message["type"] == "http.response.body":
+                counts["out"] += len(message.get("body", b""))
+            await send(message)
+
+        token = _current_scope.set(scope)
+        try:
+            await self.app(scope, counting_receive, counting_send)
+        except Exception:
+            # Answered with 500 by the server error handler further out
+            counts["status"] = counts["status"] or 500
+            raise
+        finally:
+            _current_scope.reset(token)
+            endpoint = route_template(scope)
+            REQUEST_DURATION.labels(endpoint).observe(time.perf_counter() - start)
+            # "none" when the client went away or the deadline hit before any answer
+            status = f"{counts['status'] // 100}xx" if counts["status"] else "none"
+            REQUESTS.labels(endpoint, status).inc()
+            BYTES_IN.labels(endpoint).inc(counts["in"])
+            BYTES_OUT.labels(endpoint).inc(counts["out"])
@@ -0,0 +1,250 @@
+import hashlib
+import json
+import math
+import os
+import time
+from typing import Dict, Optional
+
+from starlette.datastructures import Headers
+from starlette.requests import Request
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from app.core.config import settings
+from app.core.serialization import dumps
+
+API_KEY_HEADER = "x-api-key"
+# Idle clients with a full bucket are forgotten once this many are tracked
+MAX_TRACKED_CLIENTS = 10000
+
+
+class ClientQuota:
+    """
+    Token bucket plus concurrency cap for one client.
+
+    The bucket refills at `rate` tokens per second up to `burst`. A request
+    is admitted while at least one token is left and then charged its full
+    cost, which may leave the balance negative down to `-burst`: a large
+    multi-URL job is never refused for its size, but the client's next
+    requests wait until the debt has been refilled. Capping the debt keeps
+    one huge job from locking a client (or every keyless client behind one
+    address) out for hours.
+    """
+
+    __slots__ = ("client", "rate", "burst", "max_concurrent", "tokens", "updated_at",
+                 "in_flight", "requests_total", "pages_total", "rejected_rate",
+                 "rejected_concurrency", "last_seen")
+
+    def __init__(self, client: str, rate: float, burst: float, max_concurrent: int):
+        self.client = client
+        self.rate = rate
+        self.burst = burst
+        self.max_concurrent = max_concurrent
+        self.tokens = burst
+        self.updated_at = time.monotonic()
+        self.in_flight = 0
+        self.requests_total = 0
+        self.pages_total = 0
+        self.rejected_rate = 0
+        self.rejected_concurrency = 0
+        self.last_seen = time.time()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def try_acquire(self) -> Optional[str]:
+        """
+        Take a concurrency slot and one token. Returns the reason for a refusal, or None.
+        """
+        now = time.monotonic()
+        self._refill(now)
+        self.last_seen = time.time()
+        if self.max_concurrent and self.in_flight >= self.max_concurrent:
+            self.rejected_concurrency += 1
+            return "concurrency"
+        if self.rate and self.tokens < 1:
+            self.rejected_rate += 1
+            return "rate"
+        self.tokens -= 1
+        self.in_flight += 1
+        self.requests_total += 1
+        self.pages_total += 1
+        return None
+
+    def charge(self, pages: int):
+        # Extra pages of an admitted request (e.g. the rest of a multi crawl)
+        self.tokens = max(-self.burst, self.tokens - pages)
+        self.pages_total += pages
+
+    def release(self):
+        self.in_flight -= 1
+
+    def retry_after(self, reason: str) -> int:
+        if reason == "rate" and self.rate:
+            return max(1, math.ceil((1 - self.tokens) / self.rate))
+        return 1
+
+    def idle(self) -> bool:
+        self._refill(time.monotonic())
+        return self.in_flight == 0 and self.tokens >= self.burst
+
+    def snapshot(self) -> Dict:
+        self._refill(time.monotonic())
+        return {
+            "client": self.client,
+            "rate_per_s": self.rate,
+            "burst": self.burst,
+            "tokens": round(self.tokens, 2),
+            "max_concurrent": self.max_concurrent,
+            "in_flight": self.in_flight,
+            "requests_total": self.requests_total,
+            "pages_total": self.pages_total,
+            "rejected": {"rate": self.rejected_rate, "concurrency": self.rejected_concurrency},
+            "last_seen": self.last_seen,
+        }
+
+
+class QuotaRegistry:
+    """
+    Per-client quotas, keyed by API key or, without one, by client address.
+
+    Keys listed in the clients file (DATA_DIR/QUOTA_CLIENTS_FILE) map to a
+    client name and may override the default limits:
+
+        {"keys": {"<api key>": {"client": "team-a", "rate": 20, "burst": 200, "max_concurrent": 16}}}
+
+    Unlisted keys are identified by a hash prefix and get the defaults.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._keys: Dict[str, Dict] = {}
+        self._clients: Dict[str, ClientQuota] = {}
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        self._keys = data.get("keys", {})
+
+    def identify(self, scope: Scope) -> Optional[str]:
+        """
+        Client id for a request, or None when an API key is required and missing or unknown.
+        """
+        headers = Headers(scope=scope)
+        api_key = headers.get(API_KEY_HEADER)
+        if api_key:
+            entry = self._keys.get(api_key)
+            if entry is not None:
+                return entry.get("client") or self._key_id(api_key)
+            if settings.QUOTA_REQUIRE_API_KEY and self._keys:
+                return None
+            return self._key_id(api_key)
+        if settings.QUOTA_REQUIRE_API_KEY:
+            return None
+        address = None
+        if settings.QUOTA_TRUST_FORWARDED_FOR:
+            forwarded = headers.get("x-forwarded-for")
+            if forwarded:
+                address = forwarded.split(",")[0].strip()
+        if address is None:
+            client = scope.get("client")
+            address = client[0] if client else "unknown"
+        return f"ip:{address}"
+
+    @staticmethod
+    def _key_id(api_key: str) -> str:
+        return "key:" + hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:12]
+
+    def get(self, client: str, api_key: Optional[str] = None) -> ClientQuota:
+        quota = self._clients.get(client)
+        if quota is None:
+            limits = self._keys.get(api_key, {}) if api_key else {}
+            quota = ClientQuota(
+                client,
+                float(limits.get("rate", settings.QUOTA_RATE)),
+                float(limits.get("burst", settings.QUOTA_BURST)),
+                int(limits.get("max_concurrent", settings.QUOTA_MAX_CONCURRENT)),
+            )
+            if len(self._clients) >= MAX_TRACKED_CLIENTS:
+                self._prune()
+            self._clients[client] = quota
+        return quota
+
+    def _prune(self):
+        for client, quota in list(self._clients.items()):
+            if quota.idle():
+                del self._clients[client]
+
+    def lookup(self, client: str) -> Optional[ClientQuota]:
+        return self._clients.get(client)
+
+    def snapshot(self) -> Dict[str, Dict]:
+        return {client: quota.snapshot() for client, quota in sorted(self._clients.items())}
+
+
+quota_registry = QuotaRegistry(os.path.join(settings.DATA_DIR, settings.QUOTA_CLIENTS_FILE))
+
+
+def charge_pages(request: Request, pages: int):
+    """
+    Charge an admitted request for `pages` more pages than the one it was
+    admitted with. No-op when quotas are off or the path is not metered.
+    """
+    quota = request.scope.get("state", {}).get("quota")
+    if quota is not None and pages > 0:
+        quota.charge(pages)
+
+
+class QuotaMiddleware:
+    """
+    Enforce per-client quotas on crawl endpoints before any work starts.
+
+    Each request takes one token and one concurrency slot from its client's
+    quota, held until the response has been sent, streaming included.
+    Refusals are answered with 429 and Retry-After; a missing or unknown API
+    key with 401 when QUOTA_REQUIRE_API_KEY is set. The check is a few dict
+    lookups and arithmetic, well under a millisecond.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        self.prefix = settings.API_V1_STR + "/crawl"
+        # On-demand monitor checks crawl pages just like /crawl requests
+        self.monitor_prefix = settings.API_V1_STR + "/monitors/"
+
+    def _metered(self, path: str) -> bool:
+        return path.startswith(self.prefix) or (path.startswith(self.monitor_prefix) and path.endswith("/check"))
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or not settings.QUOTAS_ENABLED or not self._metered(scope["path"]):
+            await self.app(scope, receive, send)
+            return
+
+        client = quota_registry.identify(scope)
+        if client is None:
+            await self._reject(send, 401, "Missing or unknown API key", {})
+            return
+        quota = quota_registry.get(client, Headers(scope=scope).get(API_KEY_HEADER))
+        reason = quota.try_acquire()
+        if reason is not None:
+            retry_after = quota.retry_after(reason)
+            detail = ("Too many concurrent requests" if reason == "concurrency" else "Rate limit exceeded")
+            await self._reject(send, 429, f"{detail} for client {client}", {"retry-after": str(retry_after)})
+            return
+
+        scope.setdefault("state", {})["quota"] = quota
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            quota.release()
+
+    async def _reject(self, send: Send, status: int, detail: str, headers: Dict[str, str]):
+        body = dumps({"detail": detail})
+        raw_headers = [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]
+        raw_headers += [(k.encode(), v.encode()) for k, v in headers.items()]
+        await send({"type": "http.response.start", "status": status, "headers": raw_headers})
+        await send({"type": "http.response.body", "body": body})
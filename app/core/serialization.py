@@ -0,0 +1,299 @@
+import asyncio
+import json
+from enum import Enum
+from typing import Any, Dict, List, Optional, Sequence
+
+from fastapi import Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, Response
+
+from app.core.config import settings
+from app.core.metrics import current_timings, stage
+
+try:
+    import orjson
+except ImportError:  # Fall back to the stdlib encoder
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+except ImportError:
+    pyarrow = None
+
+JSON_MEDIA_TYPE = "application/json"
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+ARROW_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+
+# Aliases clients use for MessagePack
+MSGPACK_ALIASES = ("application/msgpack", "application/x-msgpack", "application/vnd.msgpack")
+
+
+def _default(obj: Any) -> Any:
+    # Pydantic models, URLs, sets and the like
+    return jsonable_encoder(obj)
+
+
+def dumps(content: Any) -> bytes:
+    """
+    Encode a response body. Crawl results are mostly large strings, which
+    orjson copies straight into the output buffer.
+    """
+    if orjson is not None:
+        return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(
+        content, default=_default, ensure_ascii=False, allow_nan=False, separators=(",", ":")
+    ).encode("utf-8")
+
+
+def estimate_size(content: Any, limit: int) -> int:
+    """
+    Rough encoded size of a body, counting string lengths only and stopping
+    as soon as `limit` is reached.
+    """
+    size = 0
+    stack = [content]
+    while stack and size < limit:
+        item = stack.pop()
+        if isinstance(item, str):
+            size += len(item)
+        elif isinstance(item, dict):
+            stack.extend(item.values())
+        elif isinstance(item, (list, tuple)):
+            stack.extend(item)
+    return size
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    JSONResponse rendered with orjson when available.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+async def dumps_cooperative(content: Any, chunk_bytes: int) -> bytes:
+    """
+    Encode a large body piece by piece into one buffer, yielding to the
+    event loop after every `chunk_bytes` written. The encoders hold the GIL
+    for the whole call, so handing one big dumps() to a thread would still
+    stall the loop; splitting the body keeps each stall to about one page.
+    Only containers at least `chunk_bytes` large are split.
+    """
+    out = bytearray()
+    pending = 0
+
+    async def write(piece: bytes):
+        nonlocal pending
+        out.extend(piece)
+        pending += len(piece)
+        if pending >= chunk_bytes:
+            pending = 0
+            await asyncio.sleep(0)
+
+    async def encode(value: Any):
+        if isinstance(value, dict) and all(isinstance(k, str) for k in value) \
+                and estimate_size(value, chunk_bytes) >= chunk_bytes:
+            await write(b"{")
+            for i, (key, item) in enumerate(value.items()):
+                await write((b"," if i else b"") + dumps(key) + b":")
+                await encode(item)
+            await write(b"}")
+        elif isinstance(value, list) and estimate_size(value, chunk_bytes) >= chunk_bytes:
+            await write(b"[")
+            for i, item in enumerate(value):
+                if i:
+                    await write(b",")
+                await encode(item)
+            await write(b"]")
+        else:
+            await write(dumps(value))
+
+    await encode(content)
+    return bytes(out)
+
+
+async def json_response(content: Any, status_code: int = 200,
+                        headers: Optional[Dict[str, str]] = None) -> Response:
+    """
+    Build a JSON response without FastAPI's jsonable_encoder pass. Bodies
+    above JSON_COOPERATIVE_THRESHOLD_BYTES are encoded cooperatively so a
+    multi-megabyte crawl result doesn't stall the event loop.
+    """
+    threshold = settings.JSON_COOPERATIVE_THRESHOLD_BYTES
+    if estimate_size(content, threshold) >= threshold:
+        body = await dumps_cooperative(content, settings.JSON_COOPERATIVE_CHUNK_BYTES)
+    else:
+        body = dumps(content)
+    return Response(content=body, status_code=status_code, headers=headers, media_type="application/json")
+
+
+def _msgpack_default(obj: Any) -> Any:
+    if isinstance(obj, Enum):
+        return obj.value
+    return jsonable_encoder(obj)
+
+
+def packb(content: Any) -> bytes:
+    """
+    Encode a response body as MessagePack.
+    """
+    return msgpack.packb(content, default=_msgpack_default, use_bin_type=True)
+
+
+async def packb_cooperative(content: Any, chunk_bytes: int) -> bytes:
+    """
+    MessagePack counterpart of dumps_cooperative: large maps and arrays are
+    written header first, then item by item, yielding between pieces.
+    """
+    packer = msgpack.Packer(default=_msgpack_default, use_bin_type=True)
+    out = bytearray()
+    pending = 0
+
+    async def write(piece: bytes):
+        nonlocal pending
+        out.extend(piece)
+        pending += len(piece)
+        if pending >= chunk_bytes:
+            pending = 0
+            await asyncio.sleep(0)
+
+    async def encode(value: Any):
+        if isinstance(value, dict) and estimate_size(value, chunk_bytes) >= chunk_bytes:
+            await write(packer.pack_map_header(len(value)))
+            for key, item in value.items():
+                await write(packer.pack(key))
+                await encode(item)
+        elif isinstance(value, list) and estimate_size(value, chunk_bytes) >= chunk_bytes:
+            await write(packer.pack_array_header(len(value)))
+            for item in value:
+                await encode(item)
+        else:
+            await write(packer.pack(value))
+
+    await encode(content)
+    return bytes(out)
+
+
+def offered_formats(tabular: bool = False) -> List[str]:
+    """
+    Response media types this server can produce, JSON first.
+    """
+    formats = [JSON_MEDIA_TYPE]
+    if msgpack is not None:
+        formats.append(MSGPACK_MEDIA_TYPE)
+    if tabular and pyarrow is not None:
+        formats.append(ARROW_MEDIA_TYPE)
+    return formats
+
+
+def negotiate_format(accept: str, offered: Sequence[str]) -> str:
+    """
+    Choose a response media type from an Accept header. JSON wins ties and
+    is the fallback when nothing offered is acceptable.
+    """
+    best, best_q = JSON_MEDIA_TYPE, 0.0
+    for item in accept.split(","):
+        media_type, _, params = item.strip().partition(";")
+        media_type = media_type.strip().lower()
+        if media_type in MSGPACK_ALIASES:
+            media_type = MSGPACK_MEDIA_TYPE
+        if media_type not in offered:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if q > best_q or (q == best_q and media_type == JSON_MEDIA_TYPE):
+            best, best_q = media_type, q
+    return best
+
+
+def arrow_table(rows: List[Dict[str, Any]], columns: Sequence[str], metadata: Optional[Dict[str, str]] = None):
+    """
+    Build an Arrow table with one column per schema field. Plain text-like
+    fields become string columns; anything else (collections, nested
+    fields) is left to Arrow's type inference. A column whose values Arrow
+    cannot give one type (e.g. a list on one page, text on another) is sent
+    as strings, with every non-string value JSON-encoded.
+    """
+    arrays = []
+    for name in columns:
+        values = [row.get(name) if isinstance(row, dict) else None for row in rows]
+        if all(v is None or isinstance(v, str) for v in values):
+            arrays.append(pyarrow.array(values, type=pyarrow.string()))
+            continue
+        try:
+            arrays.append(pyarrow.array(values))
+        except (pyarrow.ArrowException, OverflowError):
+            values = [v if v is None or isinstance(v, str) else json.dumps(v, ensure_ascii=False, default=str)
+                      for v in values]
+            arrays.append(pyarrow.array(values, type=pyarrow.string()))
+    table = pyarrow.Table.from_arrays(arrays, names=list(columns))
+    if metadata:
+        table = table.replace_schema_metadata({k: str(v) for k, v in metadata.items()})
+    return table
+
+
+def arrow_ipc(table) -> bytes:
+    sink = pyarrow.BufferOutputStream()
+    with pyarrow.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+async def render_response(http_request: Request, content: Any, status_code: int = 200,
+                          headers: Optional[Dict[str, str]] = None,
+                          rows: Optional[List[Dict[str, Any]]] = None,
+                          columns: Optional[Sequence[str]] = None) -> Response:
+    """
+    Encode a crawl response in the format the client asked for through
+    Accept: JSON (default), MessagePack, or, when the endpoint passes
+    tabular `rows` and `columns`, an Arrow IPC stream with one column per
+    field. When the request tracks timings, they are added as a "timings"
+    object and, serialization included, as a Server-Timing header.
+    """
+    timings = current_timings()
+    if timings is not None and isinstance(content, dict):
+        content = {**content, "timings": timings.as_dict()}
+    with stage("serialization"):
+        response = await _encode_response(http_request, content, status_code, headers, rows, columns)
+    if timings is not None:
+        response.headers["Server-Timing"] = timings.server_timing()
+    return response
+
+
+async def _encode_response(http_request: Request, content: Any, status_code: int,
+                           headers: Optional[Dict[str, str]], rows: Optional[List[Dict[str, Any]]],
+                           columns: Optional[Sequence[str]]) -> Response:
+    tabular = rows is not None and columns is not None
+    media_type = negotiate_format(http_request.headers.get("accept", ""), offered_formats(tabular))
+    headers = dict(headers or {})
+    headers["Vary"] = "Accept"
+    threshold = settings.JSON_COOPERATIVE_THRESHOLD_BYTES
+
+    if media_type == MSGPACK_MEDIA_TYPE:
+        if estimate_size(content, threshold) >= threshold:
+            body = await packb_cooperative(content, settings.JSON_COOPERATIVE_CHUNK_BYTES)
+        else:
+            body = packb(content)
+        return Response(content=body, status_code=status_code, headers=headers, media_type=media_type)
+
+    if media_type == ARROW_MEDIA_TYPE:
+        # Everything other than the rows travels as schema metadata
+        metadata = {k: v for k, v in content.items() if isinstance(v, (str, int, float, bool))} \
+            if isinstance(content, dict) else None
+        body = arrow_ipc(arrow_table(rows, columns, metadata))
+        return Response(content=body, status_code=status_code, headers=headers, media_type=media_type)
+
+    return await json_response(content, status_code=status_code, headers=headers)
@@ -1,15 +1,74 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import Response
+from app.core.compression import CompressionMiddleware
 from app.core.config import settings
+from app.core.deadline import DeadlineMiddleware
+from app.core.metrics import METRICS_CONTENT_TYPE, MetricsMiddleware, render_metrics
+from app.core.quotas import QuotaMiddleware
+from app.core.serialization import FastJSONResponse
 from app.api.v1.router import router as api_v1_router
+from app.services.browser_pool import browser_pool
+from app.services.health import health_monitor
+from app.services.monitor import monitor_scheduler
+from app.services.page_limits import download_probe
+from app.services.render_routing import render_router
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    browser_pool.start()
+    health_monitor.start()
+    monitor_scheduler.start()
+    try:
+        yield
+    finally:
+        await monitor_scheduler.stop()
+        await health_monitor.stop()
+        await browser_pool.stop()
+        await download_probe.close()
+        render_router.flush()
 
 app = FastAPI(
     title=settings.PROJECT_NAME,
     description="A web crawling service powered by Crawl4AI",
     version=settings.VERSION,
+    default_response_class=FastJSONResponse,
+    lifespan=lifespan,
 )
 
+app.add_middleware(QuotaMiddleware)
+app.add_middleware(CompressionMiddleware)
+app.add_middleware(DeadlineMiddleware)
+app.add_middleware(MetricsMiddleware)
+
 app.include_router(api_v1_router, prefix=settings.API_V1_STR)
 
 @app.get("/")
 async def root():
-    return {"message": "Welcome to Crawl4AI Service"} 
\ No newline at end of file
+    return {"message": "Welcome to Crawl4AI Service"} 
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    body = render_metrics() if settings.METRICS_ENABLED else None
+    if body is None:
+        raise HTTPException(status_code=404, detail="Metrics are not available")
+    return Response(content=body, media_type=METRICS_CONTENT_TYPE)
+
+@app.get("/health/live", tags=["health"])
+async def liveness():
+    """
+    Liveness probe: fails only once browsers have been unusable for
+    HEALTH_LIVE_MAX_FAILING_SECONDS, when restarting the process is the fix
+    """
+    alive, details = health_monitor.liveness()
+    return FastJSONResponse({"status": "alive" if alive else "dead", **details}, status_code=200 if alive else 503)
+
+@app.get("/health/ready", tags=["health"])
+async def readiness():
+    """
+    Readiness probe: fails while the browser canary is failing, requests
+    queue for a browser slot or memory is short, so traffic goes elsewhere
+    """
+    ready, details = health_monitor.readiness()
+    return FastJSONResponse({"status": "ready" if ready else "unready", **details}, status_code=200 if ready else 503)
@@ -1,5 +1,36 @@
 from pydantic import BaseModel, HttpUrl, Field
 from typing import Optional, List, Set, Dict, Any
+from app.core.admission import Priority
+from app.services.archive import ARCHIVE_NAME_PATTERN, ArchiveMode
+from app.services.chunking import ChunkUnit
+from app.services.datasets import DATASET_NAME_PATTERN, DatasetPartition
+from app.services.dedup import DedupMode
+
+class ArchiveOptions(BaseModel):
+    # HAR archive under DATA_DIR/ARCHIVE_DIR to record the browser's traffic into or replay it from
+    name: str = Field(pattern=ARCHIVE_NAME_PATTERN)
+    mode: ArchiveMode
+
+class DatasetOptions(BaseModel):
+    # Parquet dataset under DATA_DIR/DATASET_DIR to append the results to
+    name: str = Field(pattern=DATASET_NAME_PATTERN)
+    partition_by: List[DatasetPartition] = Field(default_factory=lambda: [DatasetPartition.DATE])
+    row_group_rows: Optional[int] = Field(None, ge=1)  # Defaults to DATASET_ROW_GROUP_ROWS
+
+class DedupOptions(BaseModel):
+    mode: DedupMode = DedupMode.FLAG
+    threshold: Optional[float] = Field(None, gt=0, le=1)  # Defaults to DEDUP_THRESHOLD
+    # Share an index, and its learned URL patterns, with other requests naming it; otherwise per request
+    index: Optional[str] = Field(None, pattern=r"^[A-Za-z0-9_.-]{1,100}$")
+    skip_learned_patterns: bool = True  # Don't crawl URLs that only differ from an indexed page by learned patterns
+
+class ChunkingOptions(BaseModel):
+    unit: ChunkUnit = ChunkUnit.TOKENS
+    max_size: Optional[int] = Field(None, ge=16)  # Per chunk, in `unit`; defaults to CHUNK_MAX_TOKENS or CHUNK_MAX_CHARS
+    overlap: int = Field(0, ge=0)  # Repeated from the end of the previous chunk when a section is cut
+    split_heading_level: int = Field(6, ge=1, le=6)  # Headings this deep or shallower always start a chunk
+    include_markdown: bool = False  # Also return the whole markdown
+    stream: bool = False  # Emit NDJSON, one line per chunk, instead of one JSON body
 
 class BaseCrawlRequest(BaseModel):
     url: HttpUrl
@@ -9,6 +40,11 @@ class BaseCrawlRequest(BaseModel):
     viewport_height: Optional[int] = 800
     user_agent: Optional[str] = None
     proxy_server: Optional[str] = None
+    # Scheduling class for the browser slot; background callers can ask for "bulk"
+    priority: Priority = Priority.INTERACTIVE
+    include_timings: bool = False  # Return a Server-Timing header and a "timings" breakdown
+    archive: Optional[ArchiveOptions] = None
+    chunking: Optional[ChunkingOptions] = None  # Return the markdown as heading-aware chunks for LLM ingestion
 
 class ContentCrawlRequest(BaseCrawlRequest):
     # CSS Selection
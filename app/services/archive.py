@@ -0,0 +1,279 @@
+import asyncio
+import base64
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from datetime import datetime, timezone
+from enum import Enum
+from typing import Any, Dict, List, Optional, Tuple
+
+from fastapi import HTTPException
+from starlette.concurrency import run_in_threadpool
+
+from app.core.config import settings
+
+# Plain file names: no separators, no leading dot
+ARCHIVE_NAME_PATTERN = r"^[A-Za-z0-9_-][A-Za-z0-9._-]{0,99}$"
+# Replayed archives kept parsed in memory, most recently used first out
+MAX_LOADED_ARCHIVES = 8
+# Hop-by-hop and encoding headers; recorded bodies are stored decoded
+DROPPED_RESPONSE_HEADERS = {"content-encoding", "content-length", "transfer-encoding", "connection", "keep-alive"}
+
+
+class ArchiveMode(str, Enum):
+    RECORD = "record"  # Fetch from the network and store every response
+    REPLAY = "replay"  # Serve every request from the archive, never touching the network
+
+
+class ArchiveNotFound(HTTPException):
+    def __init__(self, name: str):
+        super().__init__(status_code=404, detail=f"Archive {name!r} not found")
+
+
+def archive_path(name: str) -> str:
+    if not re.match(ARCHIVE_NAME_PATTERN, name):
+        raise ValueError(f"Invalid archive name {name!r}")
+    return os.path.join(settings.DATA_DIR, settings.ARCHIVE_DIR, name + ".har")
+
+
+def _request_key(method: str, url: str, body: Optional[bytes]) -> Tuple[str, str, Optional[str]]:
+    return method.upper(), url, hashlib.sha1(body).hexdigest() if body else None
+
+
+class HarArchive:
+    """
+    HAR 1.2 log of responses, indexed by method, URL and request body. A
+    later entry for the same request replaces the earlier one.
+    """
+
+    def __init__(self, entries: Optional[List[Dict[str, Any]]] = None):
+        self._entries: "OrderedDict[Tuple, Dict[str, Any]]" = OrderedDict()
+        for entry in entries or []:
+            self._put(entry)
+
+    def _put(self, entry: Dict[str, Any]):
+        request = entry["request"]
+        body = None
+        post_data = request.get("postData")
+        if post_data:
+            text = post_data.get("text", "")
+            body = base64.b64decode(text) if post_data.get("_encoding") == "base64" else text.encode("utf-8")
+        key = _request_key(request["method"], request["url"], body)
+        self._entries.pop(key, None)
+        self._entries[key] = entry
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __iter__(self):
+        return iter(self._entries.values())
+
+    @classmethod
+    def load(cls, path: str) -> "HarArchive":
+        with open(path, "r", encoding="utf-8") as f:
+            return cls(json.load(f)["log"]["entries"])
+
+    def dump(self, path: str):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        har = {"log": {
+            "version": "1.2",
+            "creator": {"name": settings.PROJECT_NAME, "version": settings.VERSION},
+            "entries": list(self._entries.values()),
+        }}
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(har, f)
+        os.replace(tmp_path, path)
+
+    def merge(self, other: "HarArchive"):
+        for entry in other:
+            self._put(entry)
+
+    def add(self, method: str, url: str, request_headers: Dict[str, str], body: Optional[bytes],
+            status: int, status_text: str, headers: List[Dict[str, str]], content: bytes, elapsed: float):
+        mime_type = next((h["value"] for h in headers if h["name"].lower() == "content-type"), "")
+        request: Dict[str, Any] = {
+            "method": method, "url": url, "httpVersion": "HTTP/1.1", "cookies": [], "queryString": [],
+            "headers": [{"name": k, "value": v} for k, v in request_headers.items()],
+            "headersSize": -1, "bodySize": len(body or b""),
+        }
+        if body:
+            request["postData"] = {"mimeType": request_headers.get("content-type", ""),
+                                   "text": base64.b64encode(body).decode("ascii"), "_encoding": "base64"}
+        self._put({
+            "startedDateTime": datetime.now(timezone.utc).isoformat(),
+            "time": round(elapsed * 1000, 1),
+            "request": request,
+            "response": {
+                "status": status, "statusText": status_text, "httpVersion": "HTTP/1.1", "cookies": [],
+                "headers": headers,
+                "content": {"size": len(content), "mimeType": mime_type,
+                            "text": base64.b64encode(content).decode("ascii"), "encoding": "base64"},
+                "redirectURL": next((h["value"] for h in headers if h["name"].lower() == "location"), ""),
+                "headersSize": -1, "bodySize": len(content),
+            },
+            "cache": {},
+            "timings": {"send": 0, "wait": round(elapsed * 1000, 1), "receive": 0},
+        })
+
+    def lookup(self, method: str, url: str, body: Optional[bytes]) -> Optional[Dict[str, Any]]:
+        return self._entries.get(_request_key(method, url, body))
+
+
+# Parsed archives for replay, keyed by path and checked against the file's mtime
+_loaded: "OrderedDict[str, Tuple[float, HarArchive]]" = OrderedDict()
+_loaded_lock = threading.Lock()  # Archives are loaded and saved in the threadpool
+_save_locks: Dict[str, asyncio.Lock] = {}
+
+
+def _load_cached(path: str) -> HarArchive:
+    mtime = os.stat(path).st_mtime
+    with _loaded_lock:
+        cached = _loaded.get(path)
+        if cached is not None and cached[0] == mtime:
+            _loaded.move_to_end(path)
+            return cached[1]
+    archive = HarArchive.load(path)
+    with _loaded_lock:
+        _loaded[path] = (mtime, archive)
+        while len(_loaded) > MAX_LOADED_ARCHIVES:
+            _loaded.popitem(last=False)
+    return archive
+
+
+def _forget(path: str):
+    with _loaded_lock:
+        _loaded.pop(path, None)
+
+
+def _merge_into_file(path: str, recorded: HarArchive):
+    archive = HarArchive.load(path) if os.path.exists(path) else HarArchive()
+    archive.merge(recorded)
+    archive.dump(path)
+    _forget(path)
+
+
+class ArchiveSession:
+    """
+    Network archive of one crawl session.
+
+    In record mode every browser request goes to the network and its
+    response is stored; the recorded entries are merged into the named HAR
+    file when the session closes. In replay mode every request is answered
+    from the archive and requests it does not contain fail as if offline,
+    so the page is rebuilt exactly as recorded.
+    """
+
+    def __init__(self, name: str, mode: ArchiveMode):
+        self.name = name
+        self.mode = mode
+        self.path = archive_path(name)
+        self.archive = HarArchive()
+        self.hits = 0
+        self.misses = 0
+        self.recorded = 0
+        self._pages: "weakref.WeakSet" = weakref.WeakSet()
+
+    async def open(self):
+        if self.mode == ArchiveMode.REPLAY:
+            try:
+                self.archive = await run_in_threadpool(_load_cached, self.path)
+            except FileNotFoundError:
+                raise ArchiveNotFound(self.name)
+
+    async def close(self):
+        if self.mode == ArchiveMode.RECORD and len(self.archive):
+            lock = _save_locks.setdefault(self.path, asyncio.Lock())
+            async with lock:
+                await run_in_threadpool(_merge_into_file, self.path, self.archive)
+
+    async def attach(self, page):
+        # Pages are reused across URLs of a session; route them only once
+        if page in self._pages:
+            return
+        self._pages.add(page)
+        await page.route("**/*", self._handle)
+
+    async def _handle(self, route, request):
+        body = request.post_data_buffer
+        if self.mode == ArchiveMode.REPLAY:
+            entry = self.archive.lookup(request.method, request.url, body)
+            if entry is None:
+                self.misses += 1
+                await route.abort("internetdisconnected")
+                return
+            self.hits += 1
+            response = entry["response"]
+            content = response["content"]
+            text = content.get("text", "")
+            await route.fulfill(
+                status=response["status"],
+                headers={h["name"]: h["value"] for h in response["headers"]},
+                body=base64.b64decode(text) if content.get("encoding") == "base64" else text.encode("utf-8"),
+            )
+            return
+
+        started = time.monotonic()
+        try:
+            # Redirects are recorded hop by hop, as the browser follows them
+            response = await route.fetch(max_redirects=0)
+            content = await response.body()
+        except Exception:
+            await route.abort("failed")
+            return
+        headers = [{"name": k, "value": v} for k, v in response.headers.items()
+                   if k.lower() not in DROPPED_RESPONSE_HEADERS]
+        if len(content) <= settings.ARCHIVE_MAX_ENTRY_BYTES:
+            self.archive.add(request.method, request.url, request.headers, body, response.status,
+                             response.status_text, headers, content, time.monotonic() - started)
+            self.recorded += 1
+        await route.fulfill(status=response.status, headers={h["name"]: h["value"] for h in headers},
+                            body=content)
+
+
+def require_archive(name: str):
+    if not os.path.exists(archive_path(name)):
+        raise ArchiveNotFound(name)
+
+
+def list_archives() -> List[Dict[str, Any]]:
+    directory = os.path.join(settings.DATA_DIR, settings.ARCHIVE_DIR)
+    try:
+        names = sorted(os.listdir(directory))
+    except FileNotFoundError:
+        return []
+    archives = []
+    for filename in names:
+        if not filename.endswith(".har"):
+            continue
+        stat = os.stat(os.path.join(directory, filename))
+        archives.append({"name": filename[:-4], "bytes": stat.st_size, "modified_at": stat.st_mtime})
+    return archives
+
+
+def describe_archive(name: str) -> Dict[str, Any]:
+    path = archive_path(name)
+    try:
+        archive = _load_cached(path)
+    except FileNotFoundError:
+        raise ArchiveNotFound(name)
+    pages = sorted({
+        entry["request"]["url"] for entry in archive
+        if entry["response"]["content"].get("mimeType", "").startswith("text/html")
+    })
+    return {"name": name, "entries": len(archive), "bytes": os.path.getsize(path), "html_urls": pages}
+
+
+def delete_archive(name: str) -> bool:
+    path = archive_path(name)
+    _forget(path)
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        return False
+    return True
@@ -0,0 +1,244 @@
+"""
+Remote browsers reached over the Chrome DevTools Protocol.
+
+With BROWSER_CDP_ENDPOINTS set, crawl sessions connect to one of these
+already-running browsers instead of launching their own, so API workers
+stay light and browsers can be scaled and restarted on their own. Any
+Chromium started with --remote-debugging-port will do; for local testing
+this module starts one:
+
+    python -m app.services.browser_pool --port 9222 --count 2
+
+The DevTools port gives full, unauthenticated control of the browser, so
+it listens on 127.0.0.1 unless --host says otherwise.
+"""
+import argparse
+import asyncio
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Collection, Dict, List, Optional
+from urllib.parse import urlsplit
+
+from app.core.admission import OverloadedError
+from app.core.config import settings
+
+# Chromium flags for a browser that only serves remote clients
+SERVER_BROWSER_ARGS = (
+    "--headless=new", "--no-first-run", "--no-default-browser-check", "--disable-gpu",
+    "--disable-dev-shm-usage",
+)
+LOOPBACK_HOSTS = ("127.0.0.1", "localhost", "::1")
+
+
+class BrowserEndpoint:
+    """
+    One remote browser: its CDP address, the sessions using it and its health.
+    """
+
+    def __init__(self, url: str):
+        self.url = url
+        parts = urlsplit(url)
+        # Chrome's DevTools HTTP interface lives next to the WebSocket endpoint
+        scheme = {"ws": "http", "wss": "https"}.get(parts.scheme, parts.scheme)
+        self.version_url = f"{scheme}://{parts.netloc}/json/version"
+        self.active = 0
+        self.sessions_total = 0
+        self.healthy = True  # Until the first check says otherwise
+        self.consecutive_failures = 0
+        self.last_check_at: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self.browser_version: Optional[str] = None
+
+    def browser_config_options(self) -> Dict[str, Any]:
+        """
+        Crawl4AI BrowserConfig fields connecting a session to this browser.
+        """
+        return {
+            "cdp_url": self.url,
+            # Each session gets its own context and closes it, never the shared browser
+            "create_isolated_context": True,
+            "cdp_cleanup_on_close": True,
+            "cdp_close_delay": 0,
+            # One Playwright connection per endpoint, shared by the sessions using it
+            "cache_cdp_connection": True,
+        }
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "url": self.url,
+            "healthy": self.healthy,
+            "active_sessions": self.active,
+            "sessions_total": self.sessions_total,
+            "consecutive_failures": self.consecutive_failures,
+            "last_check_at": self.last_check_at,
+            "last_error": self.last_error,
+            "browser": self.browser_version,
+        }
+
+
+class BrowserPool:
+    """
+    Load balancing and health checks across remote browsers.
+
+    A session goes to the healthy browser with the fewest sessions, taking
+    turns between equally loaded ones. Browsers are checked every
+    `check_interval` seconds through their /json/version endpoint, and a
+    browser is also taken out of rotation after `max_failures` sessions in
+    a row failed to connect to it; the next successful check brings it back.
+    """
+
+    def __init__(self, urls: List[str], check_interval: float, check_timeout: float, max_failures: int):
+        self.endpoints = [BrowserEndpoint(url) for url in urls]
+        self.check_interval = check_interval
+        self.check_timeout = check_timeout
+        self.max_failures = max(max_failures, 1)
+        self._turn = 0
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.endpoints)
+
+    def healthy_count(self) -> int:
+        return sum(1 for endpoint in self.endpoints if endpoint.healthy)
+
+    def acquire(self, exclude: Collection[str] = ()) -> BrowserEndpoint:
+        healthy = [endpoint for endpoint in self.endpoints if endpoint.healthy and endpoint.url not in exclude]
+        if not healthy:
+            raise OverloadedError("no_browsers", max(1, int(self.check_interval)))
+        self._turn += 1
+        n = len(self.endpoints)
+        endpoint = min(healthy, key=lambda e: (e.active, (self.endpoints.index(e) - self._turn) % n))
+        endpoint.active += 1
+        endpoint.sessions_total += 1
+        return endpoint
+
+    def release(self, endpoint: BrowserEndpoint):
+        endpoint.active -= 1
+
+    def report_failure(self, endpoint: BrowserEndpoint, error: BaseException):
+        endpoint.consecutive_failures += 1
+        endpoint.last_error = str(error) or type(error).__name__
+        if endpoint.consecutive_failures >= self.max_failures:
+            endpoint.healthy = False
+
+    def report_success(self, endpoint: BrowserEndpoint):
+        endpoint.consecutive_failures = 0
+
+    async def check(self, endpoint: BrowserEndpoint):
+        import aiohttp
+
+        endpoint.last_check_at = time.time()
+        timeout = aiohttp.ClientTimeout(total=self.check_timeout)
+        try:
+            async with aiohttp.ClientSession(timeout=timeout) as session:
+                async with session.get(endpoint.version_url) as response:
+                    if response.status != 200:
+                        raise RuntimeError(f"HTTP {response.status} from {endpoint.version_url}")
+                    version = await response.json(content_type=None)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            endpoint.healthy = False
+            endpoint.last_error = "timed out" if isinstance(e, asyncio.TimeoutError) else str(e) or type(e).__name__
+            return
+        endpoint.healthy = True
+        endpoint.consecutive_failures = 0
+        endpoint.last_error = None
+        endpoint.browser_version = version.get("Browser")
+
+    async def check_all(self):
+        await asyncio.gather(*(self.check(endpoint) for endpoint in self.endpoints))
+
+    async def _run(self):
+        while True:
+            await self.check_all()
+            await asyncio.sleep(self.check_interval)
+
+    def start(self):
+        if self.enabled and self.check_interval > 0 and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "healthy": self.healthy_count(),
+            "endpoints": [endpoint.snapshot() for endpoint in self.endpoints],
+        }
+
+
+browser_pool = BrowserPool(
+    urls=[url.strip() for url in settings.BROWSER_CDP_ENDPOINTS.split(",") if url.strip()],
+    check_interval=settings.BROWSER_CDP_CHECK_INTERVAL,
+    check_timeout=settings.BROWSER_CDP_CHECK_TIMEOUT,
+    max_failures=settings.BROWSER_CDP_MAX_FAILURES,
+)
+
+
+def _chromium_executable() -> str:
+    from playwright.sync_api import sync_playwright
+
+    with sync_playwright() as playwright:
+        return playwright.chromium.executable_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=9222, help="Debugging port of the first browser")
+    parser.add_argument("--count", type=int, default=1, help="Browsers to start, on consecutive ports")
+    parser.add_argument("--executable", default=None, help="Chromium binary; defaults to Playwright's")
+    parser.add_argument("--host", default="127.0.0.1",
+                        help="Address the debugging ports listen on; anything but loopback exposes "
+                             "unauthenticated control of the browsers to that network")
+    parser.add_argument("--no-sandbox", action="store_true",
+                        help="Run Chromium without its sandbox, as needed when running as root in a container")
+    args = parser.parse_args()
+
+    browser_args = [*SERVER_BROWSER_ARGS, f"--remote-debugging-address={args.host}"]
+    if args.no_sandbox:
+        browser_args.append("--no-sandbox")
+    if args.host not in LOOPBACK_HOSTS:
+        print(f"Warning: DevTools ports on {args.host} give anyone who can reach them full control "
+              "of the browsers; keep them on a private network", file=sys.stderr, flush=True)
+    executable = args.executable or _chromium_executable()
+    processes = []
+    for i in range(args.count):
+        port = args.port + i
+        profile = tempfile.mkdtemp(prefix=f"cdp-browser-{port}-")
+        processes.append(subprocess.Popen(
+            [executable, *browser_args, f"--remote-debugging-port={port}",
+             f"--user-data-dir={profile}", "about:blank"],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        ))
+    # Advertise an address clients can connect to, not the wildcard one
+    host = socket.gethostname() if args.host in ("0.0.0.0", "::") else args.host
+    if ":" in host:
+        host = f"[{host}]"
+    endpoints = ",".join(f"http://{host}:{args.port + i}" for i in range(args.count))
+    print(f"BROWSER_CDP_ENDPOINTS={endpoints}", flush=True)
+    try:
+        for process in processes:
+            process.wait()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait()
+
+
+if __name__ == "__main__":
+    main()
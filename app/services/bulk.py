@@ -0,0 +1,468 @@
+import asyncio
+import contextvars
+import csv
+import json
+import os
+import secrets
+import shutil
+import socket
+import threading
+import time
+from enum import Enum
+from functools import partial
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from fastapi import HTTPException
+from pydantic import HttpUrl, TypeAdapter, ValidationError
+from starlette.concurrency import run_in_threadpool
+
+from app.core.admission import OverloadedError, Priority
+from app.core.compression import available_encodings
+from app.core.config import settings
+from app.core.serialization import dumps
+from app.services.concurrency import adaptive_concurrency
+from app.services.crawler import CrawlSession
+from app.services.page_limits import cap_page_fields, field_limits
+from app.services.resilience import fetch_with_retries
+
+# Page fields a job can write per URL, as in /crawl/multi results
+RESULT_FIELDS = ("html", "markdown", "cleaned_html", "links")
+# Browser options of bulk sessions; there is no request body to take them from
+BULK_CRAWLER_OPTIONS = {
+    "headless": True, "viewport_width": 1280, "viewport_height": 800,
+    "extra_args": ["--disable-gpu", "--disable-dev-shm-usage", "--no-sandbox"],
+}
+JOB_FILE = "job.json"
+# Identifies the worker running a job, in job.json
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+_url_adapter = TypeAdapter(HttpUrl)
+
+
+class InputFormat(str, Enum):
+    CSV = "csv"      # A "url" column (or the first one), header optional; also plain one-URL-per-line lists
+    JSONL = "jsonl"  # One JSON string, or an object with a "url" key, per line
+
+
+class OutputCompression(str, Enum):
+    NONE = "none"
+    GZIP = "gzip"
+    ZSTD = "zstd"
+
+
+OUTPUT_FILES = {
+    OutputCompression.NONE: ("results.jsonl", "application/x-ndjson"),
+    OutputCompression.GZIP: ("results.jsonl.gz", "application/gzip"),
+    OutputCompression.ZSTD: ("results.jsonl.zst", "application/zstd"),
+}
+
+
+class JobState(str, Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+    INTERRUPTED = "interrupted"  # The service stopped while the job ran; its results are partial
+
+
+FINISHED_STATES = (JobState.DONE, JobState.FAILED, JobState.CANCELLED, JobState.INTERRUPTED)
+
+
+class JobOwnedElsewhere(HTTPException):
+    def __init__(self, job_id: str, worker: Optional[str]):
+        super().__init__(status_code=409, detail=f"Bulk job '{job_id}' is running in another worker ({worker})")
+
+
+def iter_csv_urls(path: str, column: str) -> Iterator[Tuple[int, Optional[str], Optional[str]]]:
+    """
+    Yield (line, url, error) for every non-empty row, reading lazily. The
+    first row is a header when one of its cells names `column`; otherwise
+    it is data and URLs are taken from the first column.
+    """
+    with open(path, newline="", encoding="utf-8-sig", errors="replace") as f:
+        reader = csv.reader(f)
+        index = 0
+        first = True
+        for row in reader:
+            if first:
+                first = False
+                names = [cell.strip().lower() for cell in row]
+                if column.lower() in names:
+                    index = names.index(column.lower())
+                    continue
+            if not row or not any(cell.strip() for cell in row):
+                continue
+            if index >= len(row):
+                yield reader.line_num, None, f"no {column!r} column"
+            else:
+                yield reader.line_num, row[index].strip(), None
+
+
+def iter_jsonl_urls(path: str, column: str) -> Iterator[Tuple[int, Optional[str], Optional[str]]]:
+    with open(path, encoding="utf-8-sig", errors="replace") as f:
+        for line, text in enumerate(f, 1):
+            text = text.strip()
+            if not text:
+                continue
+            try:
+                value = json.loads(text)
+            except ValueError:
+                yield line, None, "invalid JSON"
+                continue
+            if isinstance(value, dict):
+                value = value.get(column)
+            if not isinstance(value, str):
+                yield line, None, f"no {column!r} string"
+                continue
+            yield line, value.strip(), None
+
+
+def validate_url(raw: str) -> Tuple[Optional[str], Optional[str]]:
+    try:
+        return str(_url_adapter.validate_python(raw)), None
+    except ValidationError:
+        return None, "invalid URL"
+
+
+class ResultWriter:
+    """
+    Append-only JSONL results file, optionally compressed. Every entry is
+    flushed as it is written, so the file can be downloaded while the job
+    runs and always holds a readable prefix of the results.
+    """
+
+    def __init__(self, path: str, compression: OutputCompression):
+        self.path = path
+        self.compression = compression
+        self.bytes_written = 0
+        self._file = None
+        self._encoder = None
+        self._lock = asyncio.Lock()
+
+    def open(self):
+        self._file = open(self.path, "ab")
+        if self.compression != OutputCompression.NONE:
+            self._encoder = available_encodings()[self.compression.value]()
+
+    def _write(self, data: bytes):
+        if self._encoder is not None:
+            data = self._encoder.compress(data)
+        self._file.write(data)
+        self._file.flush()
+        self.bytes_written += len(data)
+
+    async def write(self, entry: Dict[str, Any]):
+        data = dumps(entry) + b"\n"
+        async with self._lock:
+            if len(data) >= settings.THREADPOOL_MIN_SIZE:
+                await run_in_threadpool(self._write, data)
+            else:
+                self._write(data)
+
+    def close(self):
+        if self._file is None:
+            return
+        if self._encoder is not None:
+            self._file.write(self._encoder.finish())
+        self._file.close()
+        self._file = None
+
+
+class BulkJob:
+    """
+    One uploaded URL file and the background crawl over it.
+
+    URLs are read from the file, validated and scheduled one at a time, so
+    memory does not grow with the size of the list: at most
+    ADAPTIVE_MAX_CONCURRENCY pages are in flight, within the adaptive
+    concurrency limits. Results are appended to the output file as each page
+    finishes, in completion order, with the input line number for reference.
+    """
+
+    def __init__(self, job_id: str, directory: str, input_format: InputFormat, column: str = "url",
+                 compression: OutputCompression = OutputCompression.GZIP,
+                 fields: Tuple[str, ...] = RESULT_FIELDS, max_field_bytes: Optional[int] = None,
+                 max_attempts: Optional[int] = None):
+        self.id = job_id
+        self.directory = directory
+        self.input_format = input_format
+        self.column = column
+        self.compression = compression
+        self.fields = fields
+        self.max_field_bytes = max_field_bytes
+        self.max_attempts = max_attempts
+        self.state = JobState.QUEUED
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.upload_bytes = 0
+        self.read = 0
+        self.invalid = 0
+        self.succeeded = 0
+        self.failed = 0
+        self.output_bytes = 0
+        self.worker: Optional[str] = WORKER_ID
+        self.task: Optional[asyncio.Task] = None
+        self._save_lock = threading.Lock()
+
+    @property
+    def input_path(self) -> str:
+        return os.path.join(self.directory, f"input.{self.input_format.value}")
+
+    @property
+    def output_path(self) -> str:
+        return os.path.join(self.directory, OUTPUT_FILES[self.compression][0])
+
+    @property
+    def output_media_type(self) -> str:
+        return OUTPUT_FILES[self.compression][1]
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "state": self.state.value,
+            "error": self.error,
+            "input_format": self.input_format.value,
+            "compression": self.compression.value,
+            "fields": list(self.fields),
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "upload_bytes": self.upload_bytes,
+            "urls_read": self.read,
+            "invalid": self.invalid,
+            "succeeded": self.succeeded,
+            "failed": self.failed,
+            "output_bytes": self.output_bytes,
+        }
+
+    def save(self):
+        # The progress saver and the job itself may save at once; the last snapshot taken wins
+        with self._save_lock:
+            options = {"column": self.column, "max_field_bytes": self.max_field_bytes,
+                       "max_attempts": self.max_attempts, "worker": self.worker, "saved_at": time.time()}
+            tmp_path = os.path.join(self.directory, JOB_FILE + ".tmp")
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({**self.status(), **options}, f)
+            os.replace(tmp_path, os.path.join(self.directory, JOB_FILE))
+
+    @classmethod
+    def load(cls, directory: str) -> "BulkJob":
+        with open(os.path.join(directory, JOB_FILE), encoding="utf-8") as f:
+            saved = json.load(f)
+        job = cls(saved["id"], directory, InputFormat(saved["input_format"]), saved["column"],
+                  OutputCompression(saved["compression"]), tuple(saved["fields"]),
+                  saved["max_field_bytes"], saved["max_attempts"])
+        job.state = JobState(saved["state"])
+        job.error = saved["error"]
+        job.created_at, job.started_at, job.finished_at = saved["created_at"], saved["started_at"], saved["finished_at"]
+        job.upload_bytes, job.read, job.invalid = saved["upload_bytes"], saved["urls_read"], saved["invalid"]
+        job.succeeded, job.failed, job.output_bytes = saved["succeeded"], saved["failed"], saved["output_bytes"]
+        job.worker = saved.get("worker")
+        stale = time.time() - saved.get("saved_at", 0) > settings.BULK_STALE_SECONDS
+        if job.state not in FINISHED_STATES and stale:
+            # Saved as queued or running by a process that stopped saving its progress
+            job.state = JobState.INTERRUPTED
+        return job
+
+    def _urls(self) -> Iterator[Tuple[int, Optional[str], Optional[str]]]:
+        if self.input_format == InputFormat.CSV:
+            return iter_csv_urls(self.input_path, self.column)
+        return iter_jsonl_urls(self.input_path, self.column)
+
+    def _entry(self, line: int, url: str, outcome, limits: Dict[str, int]) -> Dict[str, Any]:
+        entry: Dict[str, Any] = {"line": line, "url": url}
+        result = outcome.result
+        if outcome.error is not None:
+            entry.update(success=False, error=str(outcome.error))
+        else:
+            entry["success"] = getattr(result, "success", True)
+            if not entry["success"]:
+                entry["error"] = getattr(result, "error_message", None)
+            entry["status_code"] = getattr(result, "status_code", None)
+            entry["data"] = {name: getattr(result, name, None) for name in self.fields}
+            truncated = cap_page_fields(entry["data"], limits)
+            if truncated:
+                entry["truncated"] = truncated
+        if outcome.attempts != 1:
+            entry["attempts"] = outcome.attempts
+        return entry
+
+    async def _crawl_one(self, crawler, writer: ResultWriter, line: int, url: str, limits: Dict[str, int]):
+        while True:
+            outcome = await fetch_with_retries(url, partial(adaptive_concurrency.crawl, crawler, url),
+                                               self.max_attempts)
+            if not isinstance(outcome.error, OverloadedError):
+                break
+            # No browser right now: a background job waits its turn instead of failing
+            await asyncio.sleep(int(outcome.error.headers.get("Retry-After", "1")))
+        entry = self._entry(line, url, outcome, limits)
+        if entry["success"]:
+            self.succeeded += 1
+        else:
+            self.failed += 1
+        await writer.write(entry)
+        self.output_bytes = writer.bytes_written
+
+    async def _crawl(self, crawler, writer: ResultWriter):
+        limits = field_limits(self.max_field_bytes)
+        window = max(settings.ADAPTIVE_MAX_CONCURRENCY, 1)
+        pending = set()
+        try:
+            for line, raw, error in self._urls():
+                self.read += 1
+                url = None
+                if error is None:
+                    url, error = validate_url(raw)
+                if error is not None:
+                    self.invalid += 1
+                    await writer.write({"line": line, "url": raw, "success": False, "error": error})
+                    continue
+                if len(pending) >= window:
+                    done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    for task in done:
+                        task.result()
+                pending.add(asyncio.create_task(self._crawl_one(crawler, writer, line, url, limits)))
+            if pending:
+                await asyncio.gather(*pending)
+                pending = set()
+        finally:
+            for task in pending:
+                task.cancel()
+            self.output_bytes = writer.bytes_written
+
+    async def run(self, slots: asyncio.Semaphore):
+        try:
+            async with slots:
+                self.state = JobState.RUNNING
+                self.started_at = time.time()
+                await run_in_threadpool(self.save)
+                writer = ResultWriter(self.output_path, self.compression)
+                writer.open()
+                try:
+                    async with CrawlSession(dict(BULK_CRAWLER_OPTIONS), priority=Priority.BULK, size_check=True) as crawler:
+                        await self._crawl(crawler, writer)
+                finally:
+                    writer.close()
+                self.state = JobState.DONE
+        except asyncio.CancelledError:
+            self.state = JobState.CANCELLED
+        except Exception as e:
+            self.state = JobState.FAILED
+            self.error = str(e) or type(e).__name__
+        finally:
+            self.finished_at = time.time()
+            if os.path.isdir(self.directory):
+                await run_in_threadpool(self.save)
+
+
+class BulkJobs:
+    """
+    Bulk jobs of this process, with their files under `directory`. Jobs
+    beyond `max_running` wait their turn; finished jobs are deleted after
+    `retention_hours`.
+    """
+
+    def __init__(self, directory: str, max_running: int, retention_hours: float):
+        self.directory = directory
+        self.retention = retention_hours * 3600
+        self.jobs: Dict[str, BulkJob] = {}
+        self._slots = asyncio.Semaphore(max(max_running, 1))
+        self._saver: Optional[asyncio.Task] = None
+
+    def new_job(self, **options) -> BulkJob:
+        job_id = secrets.token_hex(8)
+        directory = os.path.join(self.directory, job_id)
+        os.makedirs(directory)
+        job = BulkJob(job_id, directory, **options)
+        self.jobs[job_id] = job
+        return job
+
+    def start(self, job: BulkJob):
+        # The job outlives the upload request: run it without the request's deadline or timings
+        loop = asyncio.get_running_loop()
+        job.task = loop.create_task(job.run(self._slots), context=contextvars.Context())
+        if self._saver is None or self._saver.done():
+            self._saver = loop.create_task(self._save_progress(), context=contextvars.Context())
+
+    async def _save_progress(self):
+        """
+        Rewrite job.json of this process's unfinished jobs every
+        BULK_PROGRESS_INTERVAL seconds, so other workers see current counters
+        and can tell a running job from one whose worker is gone.
+        """
+        while True:
+            await asyncio.sleep(settings.BULK_PROGRESS_INTERVAL)
+            active = [job for job in self.jobs.values() if job.state not in FINISHED_STATES]
+            if not active:
+                return
+            for job in active:
+                if job.state not in FINISHED_STATES and os.path.isdir(job.directory):
+                    await run_in_threadpool(job.save)
+
+    def get(self, job_id: str) -> Optional[BulkJob]:
+        job = self.jobs.get(job_id)
+        if job is not None:
+            return job
+        directory = os.path.join(self.directory, job_id)
+        if not job_id.isalnum() or not os.path.exists(os.path.join(directory, JOB_FILE)):
+            return None
+        return BulkJob.load(directory)
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        jobs = [job for job in map(self.get, names) if job is not None]
+        jobs.sort(key=lambda job: job.created_at, reverse=True)
+        return [job.status() for job in jobs]
+
+    async def delete(self, job_id: str) -> bool:
+        """
+        Cancel and delete a job of this process, or a finished one. Jobs
+        another worker is running are refused with 409.
+        """
+        job = self.get(job_id)
+        if job is None:
+            return False
+        if job_id not in self.jobs and job.state not in FINISHED_STATES:
+            raise JobOwnedElsewhere(job_id, job.worker)
+        if job.task is not None and not job.task.done():
+            job.task.cancel()
+            await asyncio.gather(job.task, return_exceptions=True)
+        self.jobs.pop(job_id, None)
+        await run_in_threadpool(shutil.rmtree, job.directory, True)
+        return True
+
+    def _remove(self, job_ids: List[str]):
+        for job_id in job_ids:
+            shutil.rmtree(os.path.join(self.directory, job_id), ignore_errors=True)
+
+    async def expire(self):
+        """
+        Delete finished jobs older than the retention period. The job table
+        is only changed here, on the event loop; the files are read and
+        removed in the threadpool.
+        """
+        if not self.retention:
+            return
+        cutoff = time.time() - self.retention
+        finished = [state.value for state in FINISHED_STATES]
+        expired = [
+            status["id"] for status in await run_in_threadpool(self.snapshot)
+            if status["state"] in finished and (status["finished_at"] or status["created_at"]) < cutoff
+        ]
+        for job_id in expired:
+            self.jobs.pop(job_id, None)
+        if expired:
+            await run_in_threadpool(self._remove, expired)
+
+
+bulk_jobs = BulkJobs(
+    directory=os.path.join(settings.DATA_DIR, settings.BULK_DIR),
+    max_running=settings.BULK_MAX_RUNNING_JOBS,
+    retention_hours=settings.BULK_RETENTION_HOURS,
+)
@@ -0,0 +1,265 @@
+"""
+Heading-aware markdown chunking for LLM ingestion.
+
+A page's markdown is cut into chunks that each fit a token or character
+budget. Chunks follow the document structure: a heading of the split
+level or above always starts a new chunk, paragraphs, lists and fenced
+code blocks are kept whole while they fit, and a block too large for one
+chunk is cut at the last line, sentence or word boundary within the
+budget. Chunks are described by their offsets into the markdown and are
+produced one at a time, measured in place, so the page is never copied
+whole a second time.
+"""
+import hashlib
+import re
+from enum import Enum
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from fastapi import HTTPException
+from starlette.concurrency import run_in_threadpool
+
+from app.core.config import settings
+from app.core.serialization import dumps
+
+# Estimated tokens: every run of up to four word characters and every
+# punctuation mark counts as one, which errs on the side of more tokens
+# than BPE tokenizers produce for English text
+_tokens = re.compile(r"\w{1,4}|[^\w\s]")
+_heading = re.compile(r"[ ]{0,3}(#{1,6})[ \t]+(.*?)[ \t#]*\r?$")
+_fence = re.compile(r"[ ]{0,3}(`{3,}|~{3,})")
+_blank = re.compile(r"[ \t\r]*")
+_space = re.compile(r"\s+")
+# Preferred cut points inside an oversized block, best first
+_boundaries = ("\n", ". ", "? ", "! ", "; ", ", ", " ")
+
+
+class ChunkUnit(str, Enum):
+    TOKENS = "tokens"  # Estimated LLM tokens
+    CHARS = "chars"    # Unicode characters
+
+
+class InvalidChunking(HTTPException):
+    def __init__(self, detail: str):
+        super().__init__(status_code=400, detail=detail)
+
+
+def chunk_hash(text: str) -> str:
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+
+class _Measure:
+    """
+    Sizes of spans of the markdown in one unit, without slicing it.
+    """
+
+    def __init__(self, markdown: str, unit: ChunkUnit):
+        self.markdown = markdown
+        self.unit = unit
+
+    def size(self, start: int, end: int) -> int:
+        if self.unit == ChunkUnit.CHARS:
+            return end - start
+        return sum(1 for _ in _tokens.finditer(self.markdown, start, end))
+
+    def cut(self, start: int, end: int, budget: int) -> int:
+        """
+        The furthest boundary after `start` keeping the span within `budget`.
+        Cuts fall at a line, sentence or word boundary in the second half
+        of the span when there is one.
+        """
+        if self.unit == ChunkUnit.CHARS:
+            limit = start + budget
+        else:
+            limit = end
+            for count, match in enumerate(_tokens.finditer(self.markdown, start, end), 1):
+                if count == budget:
+                    limit = match.end()
+                    if _tokens.search(self.markdown, limit, end) is None:
+                        return end
+                    break
+        if limit >= end:
+            return end
+        lowest = start + (limit - start) // 2
+        for boundary in _boundaries:
+            i = self.markdown.rfind(boundary, lowest, limit)
+            # Line breaks and punctuation stay with the text before the cut, spaces go
+            if i != -1 and i + len(boundary.rstrip(" ")) > start:
+                return i + len(boundary.rstrip(" "))
+        return limit
+
+    def back(self, start: int, end: int, amount: int) -> int:
+        """
+        Where to start a span that ends at `end` and repeats about `amount`
+        of it, at a word start after `start`.
+        """
+        if amount <= 0:
+            return end
+        if self.unit == ChunkUnit.CHARS:
+            position = max(start, end - amount)
+        else:
+            starts = [match.start() for match in _tokens.finditer(self.markdown, start, end)]
+            position = starts[-amount] if len(starts) > amount else start
+        if position > start and not self.markdown[position - 1].isspace():
+            space = _space.search(self.markdown, position, end)
+            position = space.end() if space is not None else position
+        return position
+
+
+def _blocks(markdown: str) -> Iterator[Tuple[int, int, Optional[Tuple[int, str]]]]:
+    """
+    (start, end, heading) of each block: a heading line, a fenced code
+    block, or a run of non-blank lines. `heading` is (level, title) for
+    heading lines and None otherwise.
+    """
+    position, length = 0, len(markdown)
+    start = fence = None
+    previous_end = 0
+    while position < length:
+        line_end = markdown.find("\n", position)
+        if line_end == -1:
+            line_end = length
+        if fence is not None:
+            closing = _fence.match(markdown, position, line_end)
+            if closing is not None and closing.group(1)[0] == fence[0] and len(closing.group(1)) >= len(fence):
+                yield start, line_end, None
+                start = fence = None
+        elif _blank.fullmatch(markdown, position, line_end):
+            if start is not None:
+                yield start, previous_end, None
+                start = None
+        else:
+            heading = _heading.match(markdown, position, line_end)
+            opening = _fence.match(markdown, position, line_end)
+            if heading is not None or opening is not None:
+                if start is not None:
+                    yield start, previous_end, None
+                    start = None
+            if heading is not None:
+                yield position, line_end, (len(heading.group(1)), heading.group(2))
+            elif opening is not None:
+                start, fence = position, opening.group(1)
+            elif start is None:
+                start = position
+        previous_end = line_end
+        position = line_end + 1
+    if start is not None:
+        yield start, previous_end, None
+
+
+def _spans(markdown: str, max_size: int, overlap: int, unit: ChunkUnit,
+           split_level: int) -> Iterator[Tuple[int, int, int, List[str]]]:
+    """
+    (start, end, size, headings) of each chunk, in document order.
+    """
+    measure = _Measure(markdown, unit)
+    path: List[Tuple[int, str]] = []
+    start = end = None
+    size = 0
+    headings: List[str] = []
+    body = False  # Whether the chunk holds more than headings
+    for block_start, block_end, heading in _blocks(markdown):
+        if heading is not None:
+            level, title = heading
+            if start is not None and level <= split_level:
+                yield start, end, size, headings
+                start = None
+            path = [(above, name) for above, name in path if above < level] + [(level, title)]
+        if start is None:
+            start, end, size, headings = block_start, block_start, 0, [name for _, name in path]
+            body = False
+        grown = size + measure.size(end, block_end)
+        if grown > max_size and body:
+            yield start, end, size, headings
+            headings = [name for _, name in path]
+            start = measure.back(start, end, overlap) if overlap else block_start
+            size = measure.size(start, end)
+            body = start < end
+            grown = size + measure.size(end, block_end)
+        body = body or heading is None
+        if grown <= max_size:
+            end, size = block_end, grown
+            continue
+        # The block overflows the budget even in a chunk of its own, or led
+        # only by headings: cut it, repeating `overlap` across each cut
+        while True:
+            cut = measure.cut(start, block_end, max_size)
+            if cut >= block_end:
+                break
+            yield start, cut, measure.size(start, cut), headings
+            following = measure.back(start, cut, overlap) if overlap else cut
+            if following <= start:
+                following = cut
+            space = _space.match(markdown, following, block_end)
+            start = space.end() if space is not None else following
+        end, size = block_end, measure.size(start, block_end)
+    if start is not None and end > start:
+        yield start, end, size, headings
+
+
+class Chunker:
+    """
+    Chunking options of one request, checked before the page is crawled.
+    """
+
+    def __init__(self, options):
+        self.unit = options.unit
+        default = settings.CHUNK_MAX_TOKENS if self.unit == ChunkUnit.TOKENS else settings.CHUNK_MAX_CHARS
+        self.max_size = options.max_size or default
+        self.overlap = options.overlap
+        self.split_level = options.split_heading_level
+        self.include_markdown = options.include_markdown
+        if self.overlap >= self.max_size:
+            raise InvalidChunking(f"overlap ({self.overlap}) must be smaller than max_size ({self.max_size})")
+
+    def chunks(self, markdown: str) -> Iterator[Dict[str, Any]]:
+        """
+        The markdown's chunks, one at a time. Each carries its character
+        offsets into the markdown, its size, the headings it falls under,
+        a hash of its text and the text itself.
+        """
+        spans = _spans(markdown, self.max_size, self.overlap, self.unit, self.split_level)
+        for index, (start, end, size, headings) in enumerate(spans):
+            text = markdown[start:end]
+            yield {"index": index, "start": start, "end": end, self.unit.value: size,
+                   "headings": headings, "hash": chunk_hash(text), "text": text}
+
+    def summary(self, markdown: str, chunks: int) -> Dict[str, Any]:
+        return {"unit": self.unit.value, "max_size": self.max_size, "overlap": self.overlap,
+                "markdown_length": len(markdown), "chunks": chunks}
+
+    async def add_to(self, content: Dict[str, Any], markdown: str) -> Dict[str, Any]:
+        """
+        Response content with the page's chunks in place of its markdown.
+        Large pages are chunked off the event loop.
+        """
+        if len(markdown) >= settings.THREADPOOL_MIN_SIZE:
+            chunks = await run_in_threadpool(list, self.chunks(markdown))
+        else:
+            chunks = list(self.chunks(markdown))
+        if not self.include_markdown:
+            content.pop("markdown", None)
+        content["chunks"] = chunks
+        content["chunking"] = self.summary(markdown, len(chunks))
+        return content
+
+    def ndjson(self, content: Dict[str, Any], markdown: str) -> Iterator[bytes]:
+        """
+        NDJSON lines: the response fields first, then one line per chunk as
+        it is cut, then the chunking summary. The server iterates this off
+        the event loop, and only one chunk is held at a time.
+        """
+        if not self.include_markdown:
+            content = {key: value for key, value in content.items() if key != "markdown"}
+        yield dumps(content) + b"\n"
+        count = 0
+        for chunk in self.chunks(markdown):
+            count += 1
+            yield dumps(chunk) + b"\n"
+        yield dumps({"chunking": self.summary(markdown, count)}) + b"\n"
+
+
+def open_chunker(options) -> Optional[Chunker]:
+    """
+    Chunker for a request's `chunking` options, or None when it has none.
+    """
+    return Chunker(options) if options is not None else None
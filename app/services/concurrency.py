@@ -0,0 +1,246 @@
+import asyncio
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from enum import Enum
+from typing import Deque, Dict, Optional
+from urllib.parse import urlsplit
+
+from app.core.admission import admission
+from app.core.config import settings
+
+# Status codes that mean the target wants us to slow down
+BACKOFF_STATUS_CODES = {429, 503}
+# Per-domain limiters kept in memory; idle ones are evicted beyond this
+MAX_DOMAIN_LIMITERS = 1024
+
+
+class Outcome(str, Enum):
+    OK = "ok"                  # Page crawled
+    ERROR = "error"            # Failed for a page-specific reason (404, DNS, ...)
+    CONGESTION = "congestion"  # Timeout or memory pressure: back off
+    THROTTLED = "throttled"    # The target answered 429/503: back off on that domain only
+
+
+def classify(result=None, error: Optional[BaseException] = None) -> Outcome:
+    """
+    Map a crawl result or exception to the signal it gives the limiters.
+    """
+    if error is not None:
+        if isinstance(error, asyncio.TimeoutError) or "timeout" in str(error).lower():
+            return Outcome.CONGESTION
+        return Outcome.ERROR
+    if getattr(result, "status_code", None) in BACKOFF_STATUS_CODES:
+        return Outcome.THROTTLED
+    if not getattr(result, "success", True):
+        if "timeout" in str(getattr(result, "error_message", "") or "").lower():
+            return Outcome.CONGESTION
+        return Outcome.ERROR
+    return Outcome.OK
+
+
+class AIMDLimiter:
+    """
+    Concurrency limit that grows by one per window of healthy completions
+    while it is fully used, and is multiplied by `backoff` on congestion.
+
+    Completions slower than `latency_tolerance` times the latency baseline
+    count as congestion too. Decreases happen at most once per window:
+    only requests started after the last decrease can trigger another, so
+    one burst of timeouts does not collapse the limit to the minimum. While
+    the recent error rate is above `max_error_rate` the limit holds.
+    """
+
+    def __init__(self, initial: int, min_limit: int, max_limit: int, backoff: float = 0.5,
+                 latency_tolerance: float = 2.0, max_error_rate: float = 0.25):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.limit = float(min(max(initial, min_limit), max_limit))
+        self.backoff = backoff
+        self.latency_tolerance = latency_tolerance
+        self.max_error_rate = max_error_rate
+
+        self.in_flight = 0
+        self.latency_baseline: Optional[float] = None
+        self.error_rate = 0.0
+        self.decreases = 0
+        self._last_decrease = 0.0
+        self._waiters: Deque[asyncio.Future] = deque()
+
+    @property
+    def current(self) -> int:
+        return int(self.limit)
+
+    async def acquire(self) -> float:
+        """
+        Wait for a slot. Returns the start time to pass to release().
+        """
+        if not self._waiters and self.in_flight < self.current:
+            self.in_flight += 1
+            return time.monotonic()
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            # The slot is counted by _wake before the waiter resumes
+            await waiter
+        except BaseException:
+            if waiter.done() and not waiter.cancelled():
+                self.in_flight -= 1
+                self._wake()
+            else:
+                waiter.cancel()
+                try:
+                    self._waiters.remove(waiter)
+                except ValueError:
+                    pass
+            raise
+        return time.monotonic()
+
+    def _wake(self):
+        while self._waiters and self.in_flight < self.current:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self.in_flight += 1
+                waiter.set_result(None)
+
+    def release(self, started_at: float, outcome: Optional[Outcome]):
+        self.in_flight -= 1
+        if outcome is not None:
+            self._record(started_at, time.monotonic() - started_at, outcome)
+        self._wake()
+
+    def _record(self, started_at: float, latency: float, outcome: Outcome):
+        self.error_rate = 0.95 * self.error_rate + 0.05 * (outcome == Outcome.ERROR)
+
+        slow = (
+            outcome == Outcome.OK
+            and self.latency_baseline is not None
+            and latency > self.latency_baseline * self.latency_tolerance
+        )
+        if outcome == Outcome.OK:
+            # Slow samples still move the baseline a little, so a target that
+            # is simply slower than before is eventually accepted
+            alpha = 0.02 if slow else 0.1
+            self.latency_baseline = latency if self.latency_baseline is None else (
+                (1 - alpha) * self.latency_baseline + alpha * latency
+            )
+
+        if outcome in (Outcome.CONGESTION, Outcome.THROTTLED) or slow:
+            if started_at >= self._last_decrease:
+                self.limit = max(float(self.min_limit), self.limit * self.backoff)
+                self._last_decrease = time.monotonic()
+                self.decreases += 1
+        elif outcome == Outcome.OK and self.error_rate <= self.max_error_rate and self._saturated():
+            self.limit = min(float(self.max_limit), self.limit + 1.0 / self.limit)
+
+    def _saturated(self) -> bool:
+        # Only grow a limit that is actually holding pages back (this
+        # release already left in_flight); otherwise it inflates unused
+        return bool(self._waiters) or self.in_flight + 1 >= self.current
+
+    def snapshot(self) -> Dict:
+        return {
+            "limit": self.current,
+            "in_flight": self.in_flight,
+            "waiting": len(self._waiters),
+            "latency_baseline_ms": round(self.latency_baseline * 1000, 1) if self.latency_baseline else None,
+            "error_rate": round(self.error_rate, 3),
+            "decreases": self.decreases,
+        }
+
+
+def domain_of(url: str) -> str:
+    return (urlsplit(str(url)).hostname or "").lower()
+
+
+class AdaptiveConcurrency:
+    """
+    Global page concurrency shared by all adaptive crawls, plus one limiter
+    per target domain. A page needs a slot from both; memory pressure
+    reported by admission control backs off the global limit.
+    """
+
+    def __init__(self):
+        self.global_limiter = AIMDLimiter(
+            settings.ADAPTIVE_INITIAL_CONCURRENCY, settings.ADAPTIVE_MIN_CONCURRENCY,
+            settings.ADAPTIVE_MAX_CONCURRENCY, settings.ADAPTIVE_BACKOFF,
+            settings.ADAPTIVE_LATENCY_TOLERANCE, settings.ADAPTIVE_MAX_ERROR_RATE,
+        )
+        self._domains: "OrderedDict[str, AIMDLimiter]" = OrderedDict()
+
+    def domain_limiter(self, domain: str) -> AIMDLimiter:
+        limiter = self._domains.get(domain)
+        if limiter is None:
+            limiter = AIMDLimiter(
+                settings.ADAPTIVE_DOMAIN_INITIAL_CONCURRENCY, settings.ADAPTIVE_MIN_CONCURRENCY,
+                settings.ADAPTIVE_DOMAIN_MAX_CONCURRENCY, settings.ADAPTIVE_BACKOFF,
+                settings.ADAPTIVE_LATENCY_TOLERANCE, settings.ADAPTIVE_MAX_ERROR_RATE,
+            )
+            self._domains[domain] = limiter
+            if len(self._domains) > MAX_DOMAIN_LIMITERS:
+                for name, old in list(self._domains.items()):
+                    if old.in_flight == 0 and name != domain:
+                        del self._domains[name]
+                        break
+        self._domains.move_to_end(domain)
+        return limiter
+
+    @asynccontextmanager
+    async def slot(self, url: str):
+        """
+        Hold a global and a per-domain slot while crawling `url`. Set
+        `lease["outcome"]` to the page's Outcome before leaving the block;
+        pages left without one (e.g. cancelled) release without feedback.
+        """
+        domain_limiter = self.domain_limiter(domain_of(url))
+        # Wait for the domain first so a slow domain does not sit on global slots
+        domain_started = await domain_limiter.acquire()
+        lease = {"outcome": None}
+        try:
+            global_started = await self.global_limiter.acquire()
+            try:
+                yield lease
+            finally:
+                outcome = lease["outcome"]
+                # One site rate-limiting us says nothing about overall capacity
+                global_outcome = None if outcome == Outcome.THROTTLED else outcome
+                if outcome is not None and not admission.memory_ok():
+                    global_outcome = Outcome.CONGESTION
+                self.global_limiter.release(global_started, global_outcome)
+        finally:
+            domain_limiter.release(domain_started, lease["outcome"])
+
+    async def crawl(self, crawler, url: str, **kwargs):
+        """
+        Crawl one page within the limits, feeding its outcome back. Slots
+        are held per attempt, never while waiting to retry.
+        """
+        async with self.slot(url) as lease:
+            try:
+                result = await crawler.arun(url=url, **kwargs)
+            except Exception as e:
+                lease["outcome"] = classify(error=e)
+                raise
+            lease["outcome"] = classify(result)
+            return result
+
+    def limits(self, urls) -> Dict:
+        """
+        Current limits for the summary of a crawl over `urls`.
+        """
+        domains = {domain_of(url) for url in urls}
+        return {
+            "global_limit": self.global_limiter.current,
+            "domain_limits": {
+                domain: self._domains[domain].current for domain in sorted(domains) if domain in self._domains
+            },
+        }
+
+    def snapshot(self) -> Dict:
+        return {
+            "global": self.global_limiter.snapshot(),
+            "domains": {domain: limiter.snapshot() for domain, limiter in self._domains.items()},
+        }
+
+
+adaptive_concurrency = AdaptiveConcurrency()
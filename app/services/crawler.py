@@ -0,0 +1,398 @@
+import asyncio
+import time
+import weakref
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional
+
+from crawl4ai import AsyncWebCrawler
+
+from app.core.admission import Priority, admission
+from app.core.config import settings
+from app.core.deadline import remaining_time, within_deadline
+from app.core.metrics import observe_stage, record_page, stage
+from app.services.archive import ArchiveMode, ArchiveSession
+from app.services.browser_pool import BrowserEndpoint, browser_pool
+from app.services.page_limits import download_probe
+from app.services.render_routing import RenderDecision, render_router
+
+try:
+    # HTTP-only strategy (Crawl4AI 0.6+); without it every page goes through the browser
+    from crawl4ai.async_crawler_strategy import AsyncHTTPCrawlerStrategy
+except ImportError:
+    AsyncHTTPCrawlerStrategy = None
+
+try:
+    from crawl4ai import CacheMode
+except ImportError:
+    CacheMode = None
+
+try:
+    from crawl4ai import BrowserConfig
+except ImportError:
+    BrowserConfig = None
+
+# Crawl4AI's navigation timeout when none is given (ms)
+DEFAULT_PAGE_TIMEOUT_MS = 60000
+
+# Session options that carry over to a remote browser's BrowserConfig
+REMOTE_BROWSER_OPTIONS = ("headless", "viewport_width", "viewport_height", "user_agent", "extra_args")
+
+# Keyword arguments that only make sense for a browser page
+BROWSER_ONLY_RUN_OPTIONS = ("session_id", "wait_for", "js_code", "process_iframes", "remove_overlay_elements")
+
+# Browser strategy hooks that split a page fetch into navigation, waiting and processing
+PAGE_TIMING_HOOKS = ("before_goto", "after_goto", "before_return_html")
+
+# Page URLs listed per browser context in diagnostics
+MAX_LISTED_PAGES = 20
+
+# Hook timestamps of the browser fetch running in the current task
+_page_marks: ContextVar[Optional[Dict[str, float]]] = ContextVar("page_marks", default=None)
+
+
+def _observe_page_stages(started: float, marks: Dict[str, float]):
+    finished = time.perf_counter()
+    observe_stage("browser_fetch", finished - started)
+    # Cache hits and failed navigations skip some hooks; only report what was seen
+    if "before_goto" in marks and "after_goto" in marks:
+        observe_stage("navigation", marks["after_goto"] - marks["before_goto"])
+    if "after_goto" in marks and "before_return_html" in marks:
+        observe_stage("page_wait", marks["before_return_html"] - marks["after_goto"])
+    if "before_return_html" in marks:
+        observe_stage("processing", finished - marks["before_return_html"])
+
+
+def build_crawler_options(request) -> Dict[str, Any]:
+    """
+    Browser options shared by all crawl requests, leaving out unset values.
+    """
+    crawler_options = {
+        "headless": request.headless,
+        "viewport_width": request.viewport_width,
+        "viewport_height": request.viewport_height
+    }
+    if getattr(request, "user_agent", None) is not None:
+        crawler_options["user_agent"] = request.user_agent
+    if getattr(request, "proxy_server", None) is not None:
+        crawler_options["proxy_server"] = request.proxy_server
+    return crawler_options
+
+
+def bypass_cache_options() -> Dict[str, Any]:
+    """
+    crawler.arun options making it fetch the page instead of serving a cached copy.
+    """
+    if CacheMode is not None:
+        return {"cache_mode": CacheMode.BYPASS}
+    return {"bypass_cache": True}
+
+
+def build_archive(request) -> Optional[ArchiveSession]:
+    """
+    Archive session for a request that asked to record or replay, else None.
+    """
+    options = getattr(request, "archive", None)
+    return ArchiveSession(options.name, options.mode) if options is not None else None
+
+
+# Sessions of requests in flight, for diagnostics; they go away with their request
+_live_sessions: "weakref.WeakSet[CrawlSession]" = weakref.WeakSet()
+
+
+def browser_sessions() -> List[Dict[str, Any]]:
+    """
+    Every crawl session that currently holds a crawler, oldest first.
+    """
+    sessions = [s for s in list(_live_sessions) if s._browser is not None or s._static is not None]
+    sessions.sort(key=lambda s: s._created_at)
+    return [s.describe() for s in sessions]
+
+
+# ContentCrawlRequest fields passed straight through to crawler.arun
+CONTENT_RUN_OPTIONS = (
+    "css_selector", "word_count_threshold", "excluded_tags",
+    "exclude_external_links", "exclude_social_media_links",
+    "exclude_domains", "exclude_social_media_domains", "exclude_external_images",
+    "process_iframes", "remove_overlay_elements",
+    "selectors_include", "selectors_exclude", "remove_selectors",
+)
+
+
+def build_content_options(request) -> Dict[str, Any]:
+    """
+    Content selection and filtering options for crawler.arun, leaving out unset values.
+    """
+    return {
+        name: getattr(request, name)
+        for name in CONTENT_RUN_OPTIONS
+        if getattr(request, name, None) is not None
+    }
+
+
+class CrawlSession:
+    """
+    Crawler handle for one API request.
+
+    The browser and the HTTP-only crawler are started lazily, and each URL is
+    sent to one of them according to the render routing table. Pages whose
+    prefix has not been learned yet are fetched both ways; the browser result
+    is returned and the comparison is recorded.
+
+    Launching the browser takes a slot of the session's priority class from
+    the global admission budget, held until the session closes; HTTP-only
+    fetches and sessions created with `admit=False` need no slot. Every fetch, including the wait for a slot, is
+    bounded by the request's deadline.
+
+    With remote browsers configured, the browser is a new context on one of
+    them rather than a local Chromium; sessions that use a proxy still launch
+    their own, since a proxy is a launch option.
+
+    With an `archive`, every page goes through the browser with Crawl4AI's
+    cache bypassed, and the browser's traffic is recorded into or replayed
+    from the archive.
+    """
+
+    def __init__(self, crawler_options: Dict[str, Any], route: bool = True,
+                 priority: Priority = Priority.INTERACTIVE, archive: Optional[ArchiveSession] = None,
+                 admit: bool = True, size_check: bool = False):
+        self.crawler_options = crawler_options
+        self.priority = priority
+        self.admit = admit and settings.ADMISSION_ENABLED
+        self.archive = archive
+        # Requests going through a proxy must never be fetched outside the browser
+        self.route = (
+            route
+            and archive is None
+            and settings.RENDER_ROUTING_ENABLED
+            and AsyncHTTPCrawlerStrategy is not None
+            and "proxy_server" not in crawler_options
+        )
+        # Sizes are probed with a direct HEAD, which would bypass the proxy
+        self.size_check = (
+            size_check
+            and bool(settings.MAX_DOWNLOAD_BYTES)
+            and "proxy_server" not in crawler_options
+        )
+        self._browser: Optional[AsyncWebCrawler] = None
+        self._static: Optional[AsyncWebCrawler] = None
+        self._start_lock = asyncio.Lock()
+        self._admitted_at: Optional[float] = None
+        self._created_at = time.monotonic()
+        self._endpoint: Optional[BrowserEndpoint] = None
+        _live_sessions.add(self)
+
+    async def __aenter__(self):
+        if self.archive is not None:
+            # Raises ArchiveNotFound (404) when replaying an archive that does not exist
+            await self.archive.open()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        try:
+            for crawler in (self._browser, self._static):
+                if crawler is not None:
+                    await crawler.__aexit__(None, None, None)
+        finally:
+            self._browser = self._static = None
+            if self._endpoint is not None:
+                browser_pool.release(self._endpoint)
+                self._endpoint = None
+            if self._admitted_at is not None:
+                admission.release(self.priority, self._admitted_at)
+                self._admitted_at = None
+            if self.archive is not None:
+                # Keep what was recorded even when the crawl failed part way
+                await self.archive.close()
+
+    def _page_hook(self, name: str):
+        async def hook(page, *args, **kwargs):
+            marks = _page_marks.get()
+            if marks is not None:
+                marks[name] = time.perf_counter()
+            if name == "before_goto" and self.archive is not None:
+                await self.archive.attach(page)
+            return page
+        return hook
+
+    def _install_hooks(self, crawler: AsyncWebCrawler):
+        strategy = getattr(crawler, "crawler_strategy", None)
+        if strategy is None or not hasattr(strategy, "set_hook"):
+            if self.archive is not None:
+                raise RuntimeError("Archives need a Crawl4AI version with browser hooks")
+            return
+        for name in PAGE_TIMING_HOOKS:
+            strategy.set_hook(name, self._page_hook(name))
+
+    async def browser(self) -> AsyncWebCrawler:
+        async with self._start_lock:
+            if self._browser is None:
+                if self.admit and self._admitted_at is None:
+                    # Raises OverloadedError (503) when there is no capacity
+                    with stage("queue_wait"):
+                        self._admitted_at = await admission.acquire(self.priority)
+                if browser_pool.enabled and "proxy_server" not in self.crawler_options:
+                    self._browser = await self._connect_remote()
+                else:
+                    self._browser = await self._launch(**self.crawler_options)
+        return self._browser
+
+    async def _launch(self, **options) -> AsyncWebCrawler:
+        crawler = AsyncWebCrawler(**options)
+        self._install_hooks(crawler)
+        with stage("browser_launch"):
+            await crawler.__aenter__()
+        return crawler
+
+    def _remote_config(self, endpoint: BrowserEndpoint):
+        # AsyncWebCrawler ignores loose keyword arguments; CDP settings only take effect through BrowserConfig
+        if BrowserConfig is None:
+            raise RuntimeError("Remote browsers need a Crawl4AI version with BrowserConfig")
+        options = {k: v for k, v in self.crawler_options.items() if k in REMOTE_BROWSER_OPTIONS}
+        return BrowserConfig(**options, **endpoint.browser_config_options())
+
+    async def _connect_remote(self) -> AsyncWebCrawler:
+        # A browser that refuses the connection is reported and the next one tried
+        tried = set()
+        while True:
+            # Raises OverloadedError (503) once no untried remote browser is healthy
+            endpoint = browser_pool.acquire(exclude=tried)
+            try:
+                crawler = await self._launch(config=self._remote_config(endpoint))
+            except asyncio.CancelledError:
+                browser_pool.release(endpoint)
+                raise
+            except Exception as e:
+                browser_pool.release(endpoint)
+                browser_pool.report_failure(endpoint, e)
+                tried.add(endpoint.url)
+                if len(tried) >= len(browser_pool.endpoints):
+                    raise
+                continue
+            browser_pool.report_success(endpoint)
+            self._endpoint = endpoint
+            return crawler
+
+    async def static(self) -> AsyncWebCrawler:
+        async with self._start_lock:
+            if self._static is None:
+                crawler = AsyncWebCrawler(crawler_strategy=AsyncHTTPCrawlerStrategy())
+                await crawler.__aenter__()
+                self._static = crawler
+        return self._static
+
+    def describe(self) -> Dict[str, Any]:
+        """
+        What this session holds right now: its browser's contexts and open
+        pages, and the Crawl4AI sessions keeping pages alive between URLs.
+        """
+        info: Dict[str, Any] = {
+            "priority": self.priority.value,
+            "age_s": round(time.monotonic() - self._created_at, 1),
+            "archive": self.archive.name if self.archive is not None else None,
+            "remote": self._endpoint.url if self._endpoint is not None else None,
+            "static": self._static is not None,
+            "browser": None,
+        }
+        manager = getattr(getattr(self._browser, "crawler_strategy", None), "browser_manager", None)
+        if self._browser is None or manager is None:
+            return info
+        browser = getattr(manager, "browser", None)
+        contexts = list(browser.contexts) if browser is not None else []
+        default_context = getattr(manager, "default_context", None)
+        if default_context is not None and default_context is not browser and default_context not in contexts:
+            # Persistent contexts have no Browser object around them
+            contexts.append(default_context)
+        info["browser"] = {
+            "connected": browser.is_connected() if browser is not None else None,
+            "contexts": [
+                {"pages": len(context.pages), "urls": [page.url for page in context.pages[:MAX_LISTED_PAGES]]}
+                for context in contexts
+            ],
+            "pages": sum(len(context.pages) for context in contexts),
+            "crawl_sessions": sorted(getattr(manager, "sessions", {}) or {}),
+        }
+        return info
+
+    async def _run_browser(self, url: str, **kwargs):
+        crawler = await self.browser()
+        marks: Dict[str, float] = {}
+        token = _page_marks.set(marks)
+        started = time.perf_counter()
+        try:
+            return await crawler.arun(url=url, **kwargs)
+        finally:
+            _page_marks.reset(token)
+            _observe_page_stages(started, marks)
+
+    async def _run_static(self, url: str, **kwargs):
+        static_kwargs = {k: v for k, v in kwargs.items() if k not in BROWSER_ONLY_RUN_OPTIONS}
+        crawler = await self.static()
+        with stage("static_fetch"):
+            return await crawler.arun(url=url, **static_kwargs)
+
+    async def arun(self, url: str, **kwargs):
+        if self.archive is not None:
+            # A cache hit would skip the network, and with it recording or replay
+            kwargs.update(bypass_cache_options())
+        remaining = remaining_time()
+        if remaining is not None:
+            # Let the browser give up on navigation cleanly before the deadline cancels it
+            page_timeout = kwargs.get("page_timeout", DEFAULT_PAGE_TIMEOUT_MS)
+            kwargs["page_timeout"] = max(1, int(min(page_timeout, remaining * 1000)))
+        try:
+            result = await within_deadline(self._arun(url, **kwargs))
+        except Exception as e:
+            record_page(error=e)
+            raise
+        record_page(result)
+        return result
+
+    def _probes_size(self, kwargs: Dict[str, Any]) -> bool:
+        """
+        Whether a page is worth a HEAD request before it is rendered: not when
+        it is replayed or may come from the cache, which never download it.
+        """
+        if not self.size_check:
+            return False
+        if self.archive is not None and self.archive.mode == ArchiveMode.REPLAY:
+            return False
+        if kwargs.get("bypass_cache") or CacheMode is None:
+            return True
+        return kwargs.get("cache_mode") not in (CacheMode.ENABLED, CacheMode.READ_ONLY)
+
+    async def _arun(self, url: str, **kwargs):
+        decision = render_router.decide(url) if self.route else RenderDecision.BROWSER
+        # Refuse pages that announce a body larger than we are willing to hold;
+        # static fetches are capped after download, which costs no browser memory
+        if decision != RenderDecision.STATIC and self._probes_size(kwargs):
+            with stage("size_check"):
+                await download_probe.check(url, settings.MAX_DOWNLOAD_BYTES)
+
+        if decision == RenderDecision.BROWSER:
+            return await self._run_browser(url, **kwargs)
+
+        if decision == RenderDecision.STATIC:
+            try:
+                result = await self._run_static(url, **kwargs)
+                if getattr(result, "success", False):
+                    return result
+            except Exception:
+                pass
+            # The cheap path failed for this page; render it properly instead
+            return await self._run_browser(url, **kwargs)
+
+        # Sample: fetch both ways, serve the browser result
+        browser_result, static_result = await asyncio.gather(
+            self._run_browser(url, **kwargs),
+            self._run_static(url, **kwargs),
+            return_exceptions=True
+        )
+        if isinstance(browser_result, BaseException):
+            raise browser_result
+        if getattr(browser_result, "success", False):
+            # A static fetch that raised counts as a mismatch
+            if isinstance(static_result, BaseException):
+                static_result = None
+            render_router.record(url, browser_result, static_result)
+            await render_router.flush_if_due()
+        return browser_result
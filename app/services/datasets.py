@@ -0,0 +1,407 @@
+import asyncio
+import json
+import os
+import re
+import secrets
+import shutil
+import time
+from datetime import datetime, timezone
+from enum import Enum
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from urllib.parse import quote, unquote, urlsplit
+
+from fastapi import HTTPException
+from starlette.concurrency import run_in_threadpool
+
+from app.core.config import settings
+from app.core.serialization import estimate_size
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+# Plain directory names: no separators, no leading dot
+DATASET_NAME_PATTERN = r"^[A-Za-z0-9_-][A-Za-z0-9._-]{0,99}$"
+# Extraction field types holding sub-fields; every other type, "computed" included, is stored as text
+CONTAINER_FIELD_TYPES = {"nested", "list", "nested_list"}
+# Page text columns: too large and too unique for dictionary encoding
+PAGE_TEXT_COLUMNS = ("html", "markdown", "cleaned_html")
+
+
+class DatasetPartition(str, Enum):
+    DOMAIN = "domain"  # Host of the page URL
+    DATE = "date"      # UTC day the row was written, YYYY-MM-DD
+
+
+# Names schema fields cannot take: columns every extraction row carries, and
+# the partition keys Hive-style readers add as columns
+RESERVED_COLUMNS = ("url", "crawled_at") + tuple(partition.value for partition in DatasetPartition)
+
+
+class DatasetNotFound(HTTPException):
+    def __init__(self, name: str):
+        super().__init__(status_code=404, detail=f"Dataset {name!r} not found")
+
+
+class DatasetUnavailable(HTTPException):
+    def __init__(self):
+        super().__init__(status_code=400, detail="Parquet datasets need pyarrow, which is not installed on this server")
+
+
+class DatasetColumnClash(HTTPException):
+    def __init__(self, names: Sequence[str]):
+        super().__init__(status_code=400, detail=(
+            f"Schema fields {', '.join(map(repr, names))} clash with the dataset columns every row carries "
+            f"or partition keys ({', '.join(RESERVED_COLUMNS)}); rename them to write a dataset"
+        ))
+
+
+class DatasetSchemaMismatch(HTTPException):
+    def __init__(self, name: str, differences: Sequence[str]):
+        super().__init__(status_code=409, detail=(
+            f"Dataset {name!r} already holds rows with another schema: {'; '.join(differences)}. "
+            "Write to a new dataset, or delete this one first"
+        ))
+
+
+def dataset_path(name: str) -> str:
+    if not re.match(DATASET_NAME_PATTERN, name):
+        raise ValueError(f"Invalid dataset name {name!r}")
+    return os.path.join(settings.DATA_DIR, settings.DATASET_DIR, name)
+
+
+def crawl_result_schema():
+    """
+    Columns of a /crawl/multi dataset: one row per URL. Links are kept as
+    JSON text since their keys vary between pages. Near-duplicates keep
+    the page they duplicate, so a suppressed or skipped duplicate is not
+    mistaken for an empty page.
+    """
+    return pyarrow.schema([
+        ("url", pyarrow.string()),
+        ("crawled_at", pyarrow.timestamp("ms", tz="UTC")),
+        ("success", pyarrow.bool_()),
+        ("status_code", pyarrow.int32()),
+        ("error", pyarrow.string()),
+        ("attempts", pyarrow.int32()),
+        ("html", pyarrow.large_string()),
+        ("markdown", pyarrow.large_string()),
+        ("cleaned_html", pyarrow.large_string()),
+        ("links", pyarrow.large_string()),
+        ("truncated", pyarrow.list_(pyarrow.string())),
+        ("duplicate_of", pyarrow.string()),
+        ("similarity", pyarrow.float32()),
+        ("skipped", pyarrow.bool_()),
+    ])
+
+
+def crawl_result_row(entry: Dict[str, Any]) -> Dict[str, Any]:
+    data = entry.get("data") or {}
+    links = data.get("links")
+    return {
+        "url": entry["url"],
+        "success": entry["success"],
+        "status_code": entry.get("status_code"),
+        "error": entry.get("error"),
+        "attempts": entry.get("attempts", 1),
+        "html": data.get("html"),
+        "markdown": data.get("markdown"),
+        "cleaned_html": data.get("cleaned_html"),
+        "links": json.dumps(links, ensure_ascii=False) if links is not None else None,
+        "truncated": entry.get("truncated"),
+        "duplicate_of": entry.get("duplicate_of"),
+        "similarity": entry.get("similarity"),
+        "skipped": entry.get("skipped", False),
+    }
+
+
+def _field_type(field: Dict[str, Any]):
+    field_type = field.get("type", "text")
+    if field_type in CONTAINER_FIELD_TYPES and field.get("fields"):
+        children = pyarrow.struct([(child["name"], _field_type(child)) for child in field["fields"]])
+        return children if field_type == "nested" else pyarrow.list_(children)
+    if field.get("isCollection"):
+        return pyarrow.list_(pyarrow.string())
+    return pyarrow.string()
+
+
+def extraction_schema(fields: Sequence[Dict[str, Any]]):
+    """
+    Columns of a structured extraction dataset, derived from the schema's
+    fields in their JsonCssExtractionStrategy form: text-like fields are
+    strings, collections lists of strings, "nested" fields structs and
+    "list"/"nested_list" fields lists of structs of their sub-fields.
+    Containers without sub-fields are stored as JSON text.
+    Every row also carries the page URL and when it was written, and readers
+    add the partition keys as columns, so fields with those names are
+    refused rather than silently overwritten.
+    """
+    clashes = [field["name"] for field in fields if field["name"] in RESERVED_COLUMNS]
+    if clashes:
+        raise DatasetColumnClash(clashes)
+    columns = [("url", pyarrow.string()), ("crawled_at", pyarrow.timestamp("ms", tz="UTC"))]
+    columns += [(field["name"], _field_type(field)) for field in fields]
+    return pyarrow.schema(columns)
+
+
+def _coerce(value: Any, arrow_type) -> Any:
+    """
+    Fit an extracted value to its column, so one odd page cannot fail the
+    row group: anything that is not the expected shape becomes text.
+    """
+    if value is None:
+        return None
+    if pyarrow.types.is_struct(arrow_type):
+        if not isinstance(value, dict):
+            return None
+        return {child.name: _coerce(value.get(child.name), child.type) for child in arrow_type}
+    if pyarrow.types.is_list(arrow_type):
+        if not isinstance(value, (list, tuple)):
+            value = [value]
+        return [_coerce(item, arrow_type.value_type) for item in value]
+    if pyarrow.types.is_string(arrow_type) or pyarrow.types.is_large_string(arrow_type):
+        return value if isinstance(value, str) else json.dumps(value, ensure_ascii=False, default=str)
+    return value
+
+
+def _partition_values(row: Dict[str, Any], partition_by: Sequence[DatasetPartition], now: datetime) -> Tuple[str, ...]:
+    values = []
+    for key in partition_by:
+        if key == DatasetPartition.DOMAIN:
+            values.append(urlsplit(row.get("url") or "").hostname or "unknown")
+        else:
+            values.append(now.strftime("%Y-%m-%d"))
+    return tuple(values)
+
+
+class _PartitionBuffer:
+    def __init__(self, directory: str, file_name: str):
+        self.directory = directory
+        self.path = os.path.join(directory, file_name)
+        # Dataset readers skip dot files, so a file is only seen once its footer is written
+        self.tmp_path = os.path.join(directory, "." + file_name + ".tmp")
+        self.rows: List[Dict[str, Any]] = []
+        self.bytes = 0
+        self.rows_written = 0
+        self.row_groups = 0
+        self.writer = None
+
+
+class DatasetWriter:
+    """
+    Rows of one request appended to a Parquet dataset on local disk.
+
+    The dataset is a directory of Parquet files in Hive-style partitions
+    (`domain=example.com/date=2026-01-31/part-....parquet`), so pyarrow,
+    DuckDB, Spark and pandas read it with partition pruning, and row-group
+    statistics let them skip the rest. Each writer adds its own file per
+    partition, so concurrent requests can write the same dataset. Rows are
+    buffered per partition and written as one row group once `row_group_rows`
+    rows or `row_group_bytes` of text are pending, off the event loop. When
+    all partitions together hold `max_buffer_bytes`, the largest is written
+    early, so crawls over many domains do not hold every page until close.
+    """
+
+    def __init__(self, name: str, schema, partition_by: Sequence[DatasetPartition] = (),
+                 row_group_rows: Optional[int] = None, metadata: Optional[Dict[str, str]] = None):
+        self.name = name
+        self.directory = dataset_path(name)
+        self.schema = schema.with_metadata(metadata) if metadata else schema
+        self.partition_by = list(dict.fromkeys(partition_by))
+        self.row_group_rows = max(row_group_rows or settings.DATASET_ROW_GROUP_ROWS, 1)
+        self.row_group_bytes = settings.DATASET_ROW_GROUP_BYTES
+        self.max_buffer_bytes = settings.DATASET_MAX_BUFFER_BYTES
+        self.buffered_bytes = 0
+        self.file_name = f"part-{time.strftime('%Y%m%dT%H%M%S', time.gmtime())}-{secrets.token_hex(4)}.parquet"
+        self.rows = 0
+        self._partitions: Dict[Tuple[str, ...], _PartitionBuffer] = {}
+        self._lock = asyncio.Lock()
+
+    def _partition(self, values: Tuple[str, ...]) -> _PartitionBuffer:
+        partition = self._partitions.get(values)
+        if partition is None:
+            parts = [f"{key.value}={quote(value, safe='')}" for key, value in zip(self.partition_by, values)]
+            partition = _PartitionBuffer(os.path.join(self.directory, *parts), self.file_name)
+            self._partitions[values] = partition
+        return partition
+
+    def _flush(self, partition: _PartitionBuffer):
+        if not partition.rows:
+            return
+        table = pyarrow.Table.from_pylist(partition.rows, schema=self.schema)
+        partition.rows = []
+        self.buffered_bytes -= partition.bytes
+        partition.bytes = 0
+        if partition.writer is None:
+            os.makedirs(partition.directory, exist_ok=True)
+            dictionary = [f.name for f in self.schema if f.name not in PAGE_TEXT_COLUMNS]
+            partition.writer = pyarrow.parquet.ParquetWriter(
+                partition.tmp_path, self.schema, compression=settings.DATASET_COMPRESSION,
+                use_dictionary=dictionary,
+            )
+        partition.writer.write_table(table, row_group_size=table.num_rows)
+        partition.rows_written += table.num_rows
+        partition.row_groups += 1
+
+    async def write(self, row: Dict[str, Any]):
+        now = datetime.now(timezone.utc)
+        row = {f.name: _coerce(row.get(f.name), f.type) for f in self.schema}
+        row["crawled_at"] = now
+        async with self._lock:
+            partition = self._partition(_partition_values(row, self.partition_by, now))
+            size = estimate_size(row, self.row_group_bytes)
+            partition.rows.append(row)
+            partition.bytes += size
+            self.buffered_bytes += size
+            self.rows += 1
+            if len(partition.rows) >= self.row_group_rows or partition.bytes >= self.row_group_bytes:
+                await run_in_threadpool(self._flush, partition)
+            elif self.buffered_bytes >= self.max_buffer_bytes:
+                largest = max(self._partitions.values(), key=lambda buffer: buffer.bytes)
+                await run_in_threadpool(self._flush, largest)
+
+    async def write_many(self, rows: Sequence[Dict[str, Any]]):
+        for row in rows:
+            await self.write(row)
+
+    def _close(self):
+        for partition in self._partitions.values():
+            try:
+                self._flush(partition)
+            finally:
+                if partition.writer is not None:
+                    partition.writer.close()
+                    partition.writer = None
+                    os.replace(partition.tmp_path, partition.path)
+
+    async def close(self):
+        """
+        Write what is still buffered and finish every file. Rows written
+        before a failure are kept.
+        """
+        async with self._lock:
+            await run_in_threadpool(self._close)
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "rows": self.rows,
+            "files": [
+                os.path.relpath(partition.path, self.directory)
+                for partition in self._partitions.values() if partition.rows_written
+            ],
+            "row_groups": sum(partition.row_groups for partition in self._partitions.values()),
+        }
+
+
+def _data_files(directory: str):
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for file_name in sorted(files):
+            if file_name.endswith(".parquet") and not file_name.startswith((".", "_")):
+                yield os.path.join(root, file_name)
+
+
+def _schema_differences(existing, schema) -> List[str]:
+    differences = []
+    for field in schema:
+        index = existing.get_field_index(field.name)
+        if index == -1:
+            differences.append(f"no column {field.name!r}")
+        elif not existing.field(index).type.equals(field.type):
+            differences.append(f"column {field.name!r} is {existing.field(index).type}, not {field.type}")
+    differences += [f"extra column {field.name!r}" for field in existing if schema.get_field_index(field.name) == -1]
+    return differences or ["columns are in another order"]
+
+
+def _check_schema(name: str, schema):
+    """
+    Refuse to add files a reader could not combine with the dataset's
+    existing ones. Every file is checked against the schema it is written
+    with, so the footer of the first one stands for all of them. Blocking:
+    run in the threadpool.
+    """
+    existing = next(_data_files(dataset_path(name)), None)
+    if existing is None:
+        return
+    existing_schema = pyarrow.parquet.read_schema(existing)
+    if not existing_schema.equals(schema, check_metadata=False):
+        raise DatasetSchemaMismatch(name, _schema_differences(existing_schema, schema))
+
+
+async def open_dataset(options, schema, metadata: Optional[Dict[str, str]] = None) -> Optional[DatasetWriter]:
+    """
+    Writer for a request's `dataset` options, or None when it has none.
+    `schema` may be a callable, so it is only built when a dataset is
+    requested. Raises 409 when the dataset already holds another schema.
+    """
+    if options is None:
+        return None
+    if pyarrow is None:
+        raise DatasetUnavailable()
+    if callable(schema):
+        schema = schema()
+    await run_in_threadpool(_check_schema, options.name, schema)
+    return DatasetWriter(options.name, schema, options.partition_by, options.row_group_rows, metadata)
+
+
+def list_datasets() -> List[Dict[str, Any]]:
+    directory = os.path.join(settings.DATA_DIR, settings.DATASET_DIR)
+    try:
+        names = sorted(os.listdir(directory))
+    except FileNotFoundError:
+        return []
+    datasets = []
+    for name in names:
+        files = list(_data_files(os.path.join(directory, name)))
+        datasets.append({
+            "name": name,
+            "files": len(files),
+            "bytes": sum(os.path.getsize(path) for path in files),
+            "modified_at": max((os.path.getmtime(path) for path in files), default=None),
+        })
+    return datasets
+
+
+def describe_dataset(name: str) -> Dict[str, Any]:
+    """
+    Schema, partitions and per-file row counts, read from the file footers
+    only.
+    """
+    if pyarrow is None:
+        raise DatasetUnavailable()
+    directory = dataset_path(name)
+    if not os.path.isdir(directory):
+        raise DatasetNotFound(name)
+    files = []
+    partitions = set()
+    schema = None
+    for path in _data_files(directory):
+        metadata = pyarrow.parquet.read_metadata(path)
+        relative = os.path.relpath(path, directory)
+        partition = tuple(
+            unquote(part) for part in os.path.dirname(relative).split(os.sep) if "=" in part
+        )
+        partitions.add(partition)
+        files.append({"path": relative, "rows": metadata.num_rows, "row_groups": metadata.num_row_groups,
+                      "bytes": os.path.getsize(path)})
+        schema = metadata.schema.to_arrow_schema()
+    return {
+        "name": name,
+        "path": directory,
+        "rows": sum(f["rows"] for f in files),
+        "bytes": sum(f["bytes"] for f in files),
+        "schema": [{"name": f.name, "type": str(f.type)} for f in schema] if schema is not None else [],
+        "partitions": ["/".join(partition) for partition in sorted(partitions) if partition],
+        "files": files,
+    }
+
+
+def delete_dataset(name: str) -> bool:
+    directory = dataset_path(name)
+    if not os.path.isdir(directory):
+        return False
+    shutil.rmtree(directory)
+    return True
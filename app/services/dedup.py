@@ -0,0 +1,368 @@
+"""
+Near-duplicate detection for crawled pages.
+
+Pages are compared by the Jaccard similarity of their word shingles,
+estimated from MinHash signatures and looked up through locality
+sensitive hashing, so checking a page costs the same whether the index
+holds ten pages or a hundred thousand. From the duplicates it finds, the
+index learns which query parameters and path segments do not change a
+site's content (tracking parameters, print views) and can skip such URLs
+before they are rendered at all.
+"""
+import random
+import re
+import struct
+import time
+import zlib
+from collections import OrderedDict
+from enum import Enum
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+from starlette.concurrency import run_in_threadpool
+
+from app.core.config import settings
+
+try:
+    import numpy
+except ImportError:  # Signatures are computed in pure Python instead, with identical values
+    numpy = None
+
+# Permutations are h -> (a * h + b) mod P over 32-bit shingle hashes; with a
+# and b below 2**32 every intermediate value fits in an unsigned 64-bit int
+MERSENNE_PRIME = (1 << 61) - 1
+# Fixed so signatures stay comparable across processes and restarts
+PERMUTATION_SEED = 1
+# Shingles hashed per numpy block, bounding the permutation matrix to a few MB
+SHINGLE_BLOCK = 4096
+
+_words = re.compile(r"\w+")
+
+
+class DedupMode(str, Enum):
+    FLAG = "flag"          # Mark duplicates with "duplicate_of" and keep their data
+    SUPPRESS = "suppress"  # Mark duplicates and drop their page data from the results
+
+
+def shingle_hashes(text: str, size: int) -> List[int]:
+    """
+    32-bit hashes of the distinct runs of `size` words in the text,
+    lowercased, so markup and whitespace differences do not matter.
+    """
+    words = _words.findall(text.lower())
+    if len(words) < size:
+        return [zlib.crc32(" ".join(words).encode("utf-8"))] if words else []
+    return list({zlib.crc32(" ".join(words[i:i + size]).encode("utf-8")) for i in range(len(words) - size + 1)})
+
+
+class MinHasher:
+    """
+    MinHash signatures with `num_perm` 64-bit values, packed as bytes.
+    """
+
+    def __init__(self, num_perm: int, seed: int = PERMUTATION_SEED):
+        rng = random.Random(seed)
+        self.num_perm = num_perm
+        self.a = [rng.randrange(1, 1 << 32) for _ in range(num_perm)]
+        self.b = [rng.randrange(0, 1 << 32) for _ in range(num_perm)]
+        if numpy is not None:
+            self._a = numpy.array(self.a, dtype=numpy.uint64)[:, None]
+            self._b = numpy.array(self.b, dtype=numpy.uint64)[:, None]
+
+    def signature(self, hashes: List[int]) -> bytes:
+        if not hashes:
+            return b""
+        if numpy is None:
+            mins = [min((a * h + b) % MERSENNE_PRIME for h in hashes) for a, b in zip(self.a, self.b)]
+            return struct.pack(f"<{self.num_perm}Q", *mins)
+        mins = numpy.full(self.num_perm, numpy.iinfo(numpy.uint64).max, dtype=numpy.uint64)
+        values = numpy.array(hashes, dtype=numpy.uint64)
+        for start in range(0, len(values), SHINGLE_BLOCK):
+            block = values[None, start:start + SHINGLE_BLOCK]
+            numpy.minimum(mins, ((self._a * block + self._b) % MERSENNE_PRIME).min(axis=1), out=mins)
+        return mins.astype("<u8").tobytes()
+
+
+def similarity(first: bytes, second: bytes) -> float:
+    """
+    Estimated Jaccard similarity: the share of signature values that agree.
+    """
+    if not first or len(first) != len(second):
+        return 0.0
+    if numpy is not None:
+        return float((numpy.frombuffer(first, dtype="<u8") == numpy.frombuffer(second, dtype="<u8")).mean())
+    count = len(first) // 8
+    pairs = zip(struct.unpack(f"<{count}Q", first), struct.unpack(f"<{count}Q", second))
+    return sum(x == y for x, y in pairs) / count
+
+
+def _query_pairs(query: str) -> List[Tuple[str, str]]:
+    return parse_qsl(query, keep_blank_values=True)
+
+
+def _segments(path: str) -> List[str]:
+    return [segment for segment in path.split("/") if segment]
+
+
+class UrlPatterns:
+    """
+    Query parameters and path segments learned, per host, not to change
+    the page.
+
+    When a page turns out to duplicate another one of the same host, the
+    parameters it adds or changes, or the one path segment it adds, get a
+    hit. Every URL checked that carries them counts as a trial. A parameter
+    or segment with at least `min_hits` hits and a hit rate of at least
+    `min_precision` is learned, and URLs that only differ from an already
+    indexed page by learned ones are duplicates before they are crawled.
+    """
+
+    def __init__(self, min_hits: int, min_precision: float):
+        self.min_hits = min_hits
+        self.min_precision = min_precision
+        # (host, kind, name) -> [hits, trials]; kind is "param" or "segment"
+        self.counts: Dict[Tuple[str, str, str], List[int]] = {}
+
+    def _learned(self, host: str, kind: str, name: str) -> bool:
+        hits, trials = self.counts.get((host, kind, name), (0, 0))
+        return hits >= self.min_hits and hits >= self.min_precision * trials
+
+    def observe(self, url: str, original: Optional[str]):
+        """
+        Count a checked URL, with the page it duplicates if any.
+        """
+        parts = urlsplit(url)
+        host = parts.hostname or ""
+        params = dict(_query_pairs(parts.query))
+        segments = _segments(parts.path)
+        hit_params, hit_segment = set(), None
+        if original is not None:
+            base = urlsplit(original)
+            if (base.hostname or "") == host:
+                base_params = dict(_query_pairs(base.query))
+                hit_params = {name for name, value in params.items() if base_params.get(name) != value}
+                base_segments = _segments(base.path)
+                if len(segments) == len(base_segments) + 1:
+                    for i, segment in enumerate(segments):
+                        if segments[:i] + segments[i + 1:] == base_segments:
+                            hit_segment = segment
+                            break
+        for name in params:
+            counts = self.counts.setdefault((host, "param", name), [0, 0])
+            counts[0] += name in hit_params
+            counts[1] += 1
+        if hit_segment is not None:
+            self.counts.setdefault((host, "segment", hit_segment), [0, 0])[0] += 1
+        for segment in set(segments):
+            counts = self.counts.get((host, "segment", segment))
+            if counts is not None:
+                counts[1] += 1
+
+    def canonical(self, url: str) -> str:
+        """
+        The URL without learned parameters and segments, query sorted.
+        """
+        parts = urlsplit(url)
+        host = parts.hostname or ""
+        path = "/".join(s for s in _segments(parts.path) if not self._learned(host, "segment", s))
+        query = urlencode(sorted(
+            (name, value) for name, value in _query_pairs(parts.query) if not self._learned(host, "param", name)
+        ))
+        return f"{host}/{path}?{query}"
+
+    def learned(self) -> List[Dict[str, Any]]:
+        return [
+            {"host": host, "kind": kind, "name": name, "hits": hits, "trials": trials}
+            for (host, kind, name), (hits, trials) in self.counts.items()
+            if self._learned(host, kind, name)
+        ]
+
+
+class NearDuplicateIndex:
+    """
+    MinHash LSH index of crawled pages.
+
+    A signature is cut into `bands` bands; pages sharing any band become
+    candidates and are confirmed when their estimated similarity reaches
+    the threshold. With 16 bands of 8 values, pages 90% similar are found
+    with 99.99% probability while pages 50% similar become candidates
+    only 6% of the time. The oldest pages are evicted beyond `max_pages`.
+    """
+
+    def __init__(self, name: Optional[str] = None):
+        self.name = name
+        self.hasher = MinHasher(settings.DEDUP_NUM_PERM)
+        self.bands = max(1, min(settings.DEDUP_BANDS, settings.DEDUP_NUM_PERM))
+        self.rows = settings.DEDUP_NUM_PERM // self.bands
+        self.max_pages = settings.DEDUP_MAX_PAGES
+        self.patterns = UrlPatterns(settings.DEDUP_PATTERN_MIN_HITS, settings.DEDUP_PATTERN_MIN_PRECISION)
+        self.pages: "OrderedDict[str, bytes]" = OrderedDict()
+        # Canonical form of indexed URLs -> the indexed URL, and back
+        self.canonical_urls: Dict[str, str] = {}
+        self._canonical_keys: Dict[str, List[str]] = {}
+        self._buckets: List[Dict[bytes, set]] = [{} for _ in range(self.bands)]
+        self.duplicates_total = 0
+        self.skipped_total = 0
+        self.last_used_at = time.time()
+
+    def _band_keys(self, signature: bytes) -> List[bytes]:
+        width = self.rows * 8
+        return [signature[i * width:(i + 1) * width] for i in range(self.bands)]
+
+    def signature(self, text: str) -> bytes:
+        return self.hasher.signature(shingle_hashes(text, settings.DEDUP_SHINGLE_WORDS))
+
+    def query(self, signature: bytes, threshold: float) -> Optional[Tuple[str, float]]:
+        """
+        The most similar indexed page at or above `threshold`, if any.
+        """
+        if not signature:
+            return None
+        candidates = set()
+        for bucket, key in zip(self._buckets, self._band_keys(signature)):
+            candidates.update(bucket.get(key, ()))
+        best = None
+        for url in candidates:
+            score = similarity(signature, self.pages[url])
+            if score >= threshold and (best is None or score > best[1]):
+                best = (url, score)
+        return best
+
+    def add(self, url: str, signature: bytes):
+        if not signature or url in self.pages:
+            return
+        self.pages[url] = signature
+        self.alias(url, url)
+        for bucket, key in zip(self._buckets, self._band_keys(signature)):
+            bucket.setdefault(key, set()).add(url)
+        while len(self.pages) > self.max_pages:
+            self._evict()
+
+    def alias(self, url: str, original: str):
+        """
+        Remember that `url`, in its canonical form under the patterns learned
+        so far, stands for the indexed page `original`.
+        """
+        key = self.patterns.canonical(url)
+        if key not in self.canonical_urls and original in self.pages:
+            self.canonical_urls[key] = original
+            self._canonical_keys.setdefault(original, []).append(key)
+
+    def _evict(self):
+        url, signature = self.pages.popitem(last=False)
+        for bucket, key in zip(self._buckets, self._band_keys(signature)):
+            urls = bucket.get(key)
+            if urls is not None:
+                urls.discard(url)
+                if not urls:
+                    del bucket[key]
+        for key in self._canonical_keys.pop(url, ()):
+            del self.canonical_urls[key]
+
+    def known_duplicate(self, url: str) -> Optional[str]:
+        """
+        An indexed page this URL only differs from by learned parameters or
+        segments, if any.
+        """
+        original = self.canonical_urls.get(self.patterns.canonical(url))
+        return original if original is not None and original != url else None
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "pages": len(self.pages),
+            "duplicates": self.duplicates_total,
+            "skipped": self.skipped_total,
+            "last_used_at": self.last_used_at,
+            "learned_patterns": self.patterns.learned(),
+        }
+
+
+class DedupSession:
+    """
+    Near-duplicate checks of one request, against its own index or a
+    shared named one.
+    """
+
+    def __init__(self, index: NearDuplicateIndex, mode: DedupMode, threshold: float, skip_learned: bool):
+        self.index = index
+        self.mode = mode
+        self.threshold = threshold
+        self.skip_learned = skip_learned
+        self.duplicates = 0
+        self.skipped = 0
+        index.last_used_at = time.time()
+
+    def skip(self, url: str) -> Optional[str]:
+        """
+        The page a URL is known to duplicate, when it need not be crawled.
+        """
+        if not self.skip_learned:
+            return None
+        original = self.index.known_duplicate(url)
+        if original is not None:
+            self.skipped += 1
+            self.index.skipped_total += 1
+        return original
+
+    def skipped_entry(self, url: str, original: str) -> Dict[str, Any]:
+        return {"url": url, "success": True, "skipped": True, "duplicate_of": original}
+
+    async def check(self, entry: Dict[str, Any], markdown: str):
+        """
+        Flag a crawled entry that duplicates an indexed page, or index it.
+        """
+        if len(markdown) >= settings.THREADPOOL_MIN_SIZE:
+            signature = await run_in_threadpool(self.index.signature, markdown)
+        else:
+            signature = self.index.signature(markdown)
+        match = self.index.query(signature, self.threshold)
+        self.index.patterns.observe(entry["url"], match[0] if match is not None else None)
+        if match is None:
+            self.index.add(entry["url"], signature)
+            return
+        self.duplicates += 1
+        self.index.duplicates_total += 1
+        # Patterns may have been learned since the original was indexed
+        self.index.alias(match[0], match[0])
+        self.index.alias(entry["url"], match[0])
+        entry["duplicate_of"], entry["similarity"] = match[0], round(match[1], 3)
+        if self.mode == DedupMode.SUPPRESS:
+            entry.pop("data", None)
+
+    def summary(self) -> Dict[str, Any]:
+        return {"duplicates": self.duplicates, "skipped": self.skipped, "indexed_pages": len(self.index.pages)}
+
+
+class DedupIndexes:
+    """
+    Named indexes shared by requests in this process, least recently used
+    dropped beyond `max_indexes`.
+    """
+
+    def __init__(self, max_indexes: int):
+        self.max_indexes = max_indexes
+        self.indexes: "OrderedDict[str, NearDuplicateIndex]" = OrderedDict()
+
+    def session(self, options) -> DedupSession:
+        if options.index is None:
+            index = NearDuplicateIndex()
+        else:
+            index = self.indexes.pop(options.index, None) or NearDuplicateIndex(options.index)
+            self.indexes[options.index] = index
+            while len(self.indexes) > self.max_indexes:
+                self.indexes.popitem(last=False)
+        threshold = options.threshold if options.threshold is not None else settings.DEDUP_THRESHOLD
+        return DedupSession(index, options.mode, threshold, options.skip_learned_patterns)
+
+    def get(self, name: str) -> Optional[NearDuplicateIndex]:
+        return self.indexes.get(name)
+
+    def delete(self, name: str) -> bool:
+        return self.indexes.pop(name, None) is not None
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        return [index.snapshot() for index in self.indexes.values()]
+
+
+dedup_indexes = DedupIndexes(max_indexes=settings.DEDUP_MAX_INDEXES)
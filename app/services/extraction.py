@@ -0,0 +1,349 @@
+import re
+from enum import Enum
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Optional
+
+from crawl4ai.extraction_strategy import JsonCssExtractionStrategy
+from starlette.concurrency import run_in_threadpool
+
+from app.core.config import settings
+from app.core.metrics import stage
+
+try:
+    from cssselect import HTMLTranslator, SelectorError
+    from cssselect.xpath import ExpressionError
+    from lxml import etree
+except ImportError:  # The crawl4ai engine is always available
+    etree = None
+
+
+class ExtractionEngine(str, Enum):
+    AUTO = "auto"          # lxml when the schema supports it, crawl4ai otherwise
+    LXML = "lxml"          # Compiled XPath over an lxml tree
+    CRAWL4AI = "crawl4ai"  # JsonCssExtractionStrategy (BeautifulSoup)
+
+
+class UnsupportedSchemaError(ValueError):
+    """
+    The schema uses something the lxml engine does not reproduce exactly.
+    """
+
+
+# Field types and pipeline steps the lxml engine reproduces exactly. "html"
+# would need BeautifulSoup's serializer, "computed" runs user callables and
+# "source" uses BeautifulSoup sibling search, so those go to crawl4ai.
+SINGLE_STEPS = {"text", "attribute", "regex"}
+CONTAINER_TYPES = {"nested", "list", "nested_list"}
+
+# BeautifulSoup gives strings inside these tags their own string class, and
+# get_text() only returns strings of the class the queried tag holds
+STRING_CONTAINER_TAGS = {"script", "style", "template", "rt", "rp"}
+
+# Attributes BeautifulSoup splits into lists on whitespace, per tag
+MULTI_VALUED_ATTRIBUTES = {
+    "*": {"class", "accesskey", "dropzone"},
+    "a": {"rel", "rev"},
+    "link": {"rel", "rev"},
+    "td": {"headers"},
+    "th": {"headers"},
+    "form": {"accept-charset"},
+    "object": {"archive"},
+    "area": {"rel"},
+    "icon": {"sizes"},
+    "iframe": {"sandbox"},
+    "output": {"for"},
+}
+
+_MISSING = object()
+
+
+@lru_cache(maxsize=1024)
+def _compile_selector(selector: str):
+    """
+    Compile a CSS selector into an XPath matching anywhere in the document,
+    which is how BeautifulSoup's select() evaluates selectors.
+    """
+    try:
+        xpath = HTMLTranslator().css_to_xpath(selector, prefix="descendant-or-self::")
+        return etree.XPath(xpath)
+    except (SelectorError, ExpressionError, etree.XPathError) as e:
+        raise UnsupportedSchemaError(f"Unsupported selector {selector!r}: {e}")
+
+
+class LxmlExtractor:
+    """
+    Fast equivalent of JsonCssExtractionStrategy.extract on an lxml tree.
+
+    Instead of re-running every field selector under every base element,
+    each selector is evaluated once per page and its matches are bucketed
+    to the context elements (base elements, or nested elements) that
+    contain them. All fields of one schema level are then filled in one
+    pass over the contexts. Text, attribute, default, transform and
+    empty-item rules follow JsonCssExtractionStrategy so results are
+    identical.
+    """
+
+    def __init__(self, schema: Dict[str, Any]):
+        if etree is None:
+            raise UnsupportedSchemaError("lxml and cssselect are not installed")
+        self.schema = schema
+        _compile_selector(schema["baseSelector"])
+        for field in schema.get("baseFields", []):
+            self._check_single(field)
+        self._check_fields(schema["fields"])
+
+    # Schema validation
+
+    def _check_single(self, field: Dict[str, Any]):
+        if "source" in field:
+            raise UnsupportedSchemaError("'source' fields are not supported")
+        steps = field["type"] if isinstance(field["type"], list) else [field["type"]]
+        for step in steps:
+            if step not in SINGLE_STEPS:
+                raise UnsupportedSchemaError(f"Field type {step!r} is not supported")
+            if step == "regex" and not field.get("pattern"):
+                raise UnsupportedSchemaError("'regex' fields need a pattern")
+        if "selector" in field:
+            _compile_selector(field["selector"])
+
+    def _check_fields(self, fields: List[Dict[str, Any]]):
+        for field in fields:
+            if isinstance(field["type"], str) and field["type"] in CONTAINER_TYPES:
+                if "source" in field:
+                    raise UnsupportedSchemaError("'source' fields are not supported")
+                _compile_selector(field["selector"])
+                if field["type"] == "list":
+                    for sub_field in field["fields"]:
+                        self._check_single(sub_field)
+                else:
+                    self._check_fields(field["fields"])
+            else:
+                self._check_single(field)
+
+    # Extraction
+
+    def extract(self, html: str) -> List[Dict[str, Any]]:
+        if not html or not html.strip():
+            return []
+        parser = etree.HTMLParser(recover=True)
+        parser.feed(html)
+        root = parser.close()
+        if root is None:
+            return []
+        self._matches: Dict[str, list] = {}
+        self._root = root
+
+        base_elements = self._global_matches(self.schema["baseSelector"])
+        items = [{} for _ in base_elements]
+        # baseFields are not guarded in crawl4ai either: an error aborts the extraction
+        for field in self.schema.get("baseFields", []):
+            for item, value in zip(items, self._single_values(base_elements, field)):
+                if isinstance(value, Exception):
+                    raise value
+                if value is not None:
+                    item[field["name"]] = value
+        for item, field_data in zip(items, self._extract_items(base_elements, self.schema["fields"])):
+            item.update(field_data)
+        del self._matches, self._root
+        return [item for item in items if item]
+
+    def _global_matches(self, selector: str) -> list:
+        matches = self._matches.get(selector)
+        if matches is None:
+            matches = _compile_selector(selector)(self._root)
+            self._matches[selector] = matches
+        return matches
+
+    def _select_within(self, selector: str, contexts: list) -> List[list]:
+        """
+        Matches of `selector` strictly inside each context, in document order.
+        """
+        positions: Dict[Any, List[int]] = {}
+        for i, context in enumerate(contexts):
+            positions.setdefault(context, []).append(i)
+        buckets = [[] for _ in contexts]
+        for match in self._global_matches(selector):
+            for ancestor in match.iterancestors():
+                for i in positions.get(ancestor, ()):
+                    buckets[i].append(match)
+        return buckets
+
+    def _extract_items(self, contexts: list, fields: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        items = [{} for _ in contexts]
+        for field in fields:
+            for item, value in zip(items, self._field_values(contexts, field)):
+                if value is not None:
+                    item[field["name"]] = value
+        return items
+
+    def _field_values(self, contexts: list, field: Dict[str, Any]) -> list:
+        field_type = field["type"]
+        default = field.get("default")
+
+        if field_type == "nested":
+            firsts = [bucket[0] if bucket else None for bucket in self._select_within(field["selector"], contexts)]
+            sub_items = iter(self._extract_items([el for el in firsts if el is not None], field["fields"]))
+            return [next(sub_items) if el is not None else {} for el in firsts]
+
+        if field_type in ("list", "nested_list"):
+            buckets = self._select_within(field["selector"], contexts)
+            flat = [el for bucket in buckets for el in bucket]
+            if field_type == "nested_list":
+                sub_items = self._extract_items(flat, field["fields"])
+            else:
+                sub_items = self._list_items(flat, field["fields"])
+            values, offset = [], 0
+            for bucket in buckets:
+                chunk = sub_items[offset:offset + len(bucket)]
+                offset += len(bucket)
+                values.append(default if any(isinstance(v, Exception) for v in chunk) else chunk)
+            return values
+
+        return [default if isinstance(v, Exception) else v for v in self._single_values(contexts, field)]
+
+    def _list_items(self, elements: list, fields: List[Dict[str, Any]]) -> list:
+        """
+        Items of a "list" field; an error in any sub-field fails the whole item.
+        """
+        items: List[Any] = [{} for _ in elements]
+        for field in fields:
+            for i, value in enumerate(self._single_values(elements, field)):
+                if isinstance(items[i], Exception):
+                    continue
+                if isinstance(value, Exception):
+                    items[i] = value
+                elif value is not None:
+                    items[i][field["name"]] = value
+        return items
+
+    def _single_values(self, contexts: list, field: Dict[str, Any]) -> list:
+        """
+        Value of a plain field for each context, or the exception it raised.
+        """
+        default = field.get("default")
+        if "selector" in field:
+            selected = [bucket[0] if bucket else _MISSING
+                        for bucket in self._select_within(field["selector"], contexts)]
+        else:
+            selected = contexts
+        steps = field["type"] if isinstance(field["type"], list) else [field["type"]]
+
+        values = []
+        for element in selected:
+            if element is _MISSING:
+                values.append(default)
+                continue
+            try:
+                value = element
+                for step in steps:
+                    if step == "text":
+                        value = _element_text(value)
+                    elif step == "attribute":
+                        value = _element_attribute(value, field["attribute"])
+                    elif step == "regex":
+                        if not isinstance(value, str):
+                            value = _element_text(value)
+                        match = re.search(field["pattern"], value)
+                        value = match.group(field.get("group", 1)) if match else None
+                    if value is None:
+                        break
+                if "transform" in field:
+                    value = _apply_transform(value, field["transform"])
+                values.append(value if value is not None else default)
+            except Exception as e:
+                values.append(e)
+        return values
+
+
+def _string_container(element) -> Optional[str]:
+    # Innermost enclosing tag that gives its strings a special class
+    for el in element.iterancestors():
+        if el.tag in STRING_CONTAINER_TAGS:
+            return el.tag
+    return None
+
+
+def _element_text(element) -> str:
+    """
+    BeautifulSoup get_text(strip=True): every string of the kind the element
+    holds, stripped, empty ones dropped, joined without separator.
+    """
+    tag = element.tag
+    target = tag if tag in STRING_CONTAINER_TAGS else None
+    parts = []
+    # Iterative walk: (node, container of its own text)
+    stack = [(element, target if target else _string_container(element))]
+    first = True
+    while stack:
+        node, container = stack.pop()
+        if isinstance(node, str):
+            if container == target:
+                stripped = node.strip()
+                if stripped:
+                    parts.append(stripped)
+            continue
+        if not first and node.tag in STRING_CONTAINER_TAGS:
+            container = node.tag
+        first = False
+        children = list(node)
+        # Push in reverse so text comes out in document order
+        for child in reversed(children):
+            if child.tail:
+                stack.append((child.tail, container))
+            if isinstance(child.tag, str):
+                stack.append((child, container))
+        if node.text:
+            stack.append((node.text, container))
+    return "".join(parts)
+
+
+def _element_attribute(element, attribute: str):
+    value = element.get(attribute)
+    if value is None:
+        return None
+    multi = MULTI_VALUED_ATTRIBUTES["*"] | MULTI_VALUED_ATTRIBUTES.get(element.tag, set())
+    if attribute in multi:
+        return value.split()
+    return value
+
+
+def _apply_transform(value, transform: str):
+    if transform == "lowercase":
+        return value.lower()
+    elif transform == "uppercase":
+        return value.upper()
+    elif transform == "strip":
+        return value.strip()
+    return value
+
+
+def get_extractor(schema: Dict[str, Any], engine: Optional[ExtractionEngine] = None) -> Callable[[str, str], List[Dict[str, Any]]]:
+    """
+    Return a function (url, html) -> items for the requested engine.
+    AUTO uses lxml unless the schema needs something only crawl4ai does.
+    """
+    engine = ExtractionEngine(engine or settings.EXTRACTION_ENGINE)
+    if engine != ExtractionEngine.CRAWL4AI:
+        try:
+            extractor = LxmlExtractor(schema)
+            return lambda url, html: extractor.extract(html)
+        except UnsupportedSchemaError:
+            if engine == ExtractionEngine.LXML:
+                raise
+    strategy = JsonCssExtractionStrategy(schema=schema)
+    return strategy.extract
+
+
+def extract_items(schema: Dict[str, Any], url: str, html: str,
+                  engine: Optional[ExtractionEngine] = None) -> List[Dict[str, Any]]:
+    """
+    Apply a CSS extraction schema to an already fetched page.
+    """
+    return get_extractor(schema, engine)(url, html)
+
+
+async def extract_items_async(schema: Dict[str, Any], url: str, html: str,
+                              engine: Optional[ExtractionEngine] = None) -> List[Dict[str, Any]]:
+    # HTML parsing is CPU-bound; keep it off the event loop
+    with stage("extraction"):
+        return await run_in_threadpool(extract_items, schema, url, html, engine)
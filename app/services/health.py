@@ -0,0 +1,176 @@
+import asyncio
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.core.admission import admission
+from app.core.config import settings
+from app.services.browser_pool import browser_pool
+from app.services.crawler import CrawlSession, bypass_cache_options
+
+# Rendered from memory, so the canary checks the browser and nothing on the network.
+# The script makes Crawl4AI load the page in the browser instead of parsing it directly.
+CANARY_URL = 'raw:<html><body><p id="canary">static</p></body></html>'
+CANARY_SCRIPT = "document.getElementById('canary').textContent = 'rendered';"
+CANARY_MARKER = "rendered"
+CANARY_BROWSER_OPTIONS = {"headless": True, "viewport_width": 800, "viewport_height": 600}
+
+
+class HealthMonitor:
+    """
+    Liveness and readiness of this process.
+
+    A canary renders a tiny in-memory page in a freshly started browser
+    every `interval` seconds, the same way a crawl request does, so a
+    process whose browsers no longer start or render is noticed before a
+    client is. Readiness also fails while requests queue for a browser
+    slot, so a load balancer shifts traffic while latency is still fine;
+    liveness only fails once the canary has been failing for
+    `live_failing_seconds`, after which a restart is the likely cure.
+    """
+
+    def __init__(self, interval: float, timeout: float, failure_threshold: int,
+                 min_free_slots: int, max_queued: int, live_failing_seconds: float):
+        self.interval = interval
+        self.timeout = timeout
+        self.failure_threshold = max(failure_threshold, 1)
+        self.min_free_slots = min_free_slots
+        self.max_queued = max_queued
+        self.live_failing_seconds = live_failing_seconds
+        self.last_success_at: Optional[float] = None
+        self.last_failure_at: Optional[float] = None
+        self.failing_since: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self.last_latency: Optional[float] = None
+        self.consecutive_failures = 0
+        self.checks_total = 0
+        self.failures_total = 0
+        self.skipped_total = 0
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def canary_enabled(self) -> bool:
+        return self.interval > 0
+
+    async def _render_canary(self):
+        # The canary takes no admission slot: it must not queue behind the load it checks
+        async with CrawlSession(dict(CANARY_BROWSER_OPTIONS), route=False, admit=False) as session:
+            crawler = await session.browser()
+            result = await crawler.arun(url=CANARY_URL, js_code=CANARY_SCRIPT, **bypass_cache_options())
+        if not getattr(result, "success", False):
+            raise RuntimeError(getattr(result, "error_message", None) or "canary page failed")
+        if CANARY_MARKER not in (getattr(result, "html", None) or ""):
+            raise RuntimeError("canary script did not run")
+
+    async def check(self) -> bool:
+        """
+        Run the canary once and record the outcome.
+        """
+        started = time.monotonic()
+        self.checks_total += 1
+        try:
+            await asyncio.wait_for(self._render_canary(), self.timeout)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            now = time.time()
+            self.failures_total += 1
+            self.consecutive_failures += 1
+            self.last_failure_at = now
+            if self.failing_since is None:
+                self.failing_since = now
+            self.last_error = "timed out" if isinstance(e, asyncio.TimeoutError) else str(e) or type(e).__name__
+            return False
+        self.last_latency = time.monotonic() - started
+        self.last_success_at = time.time()
+        self.consecutive_failures = 0
+        self.failing_since = None
+        self.last_error = None
+        return True
+
+    async def _run(self):
+        while True:
+            # A new browser needs memory the service does not have right now; the
+            # admission check already reports that, so keep the last outcome
+            if admission.memory_ok():
+                await self.check()
+            else:
+                self.skipped_total += 1
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        if self.canary_enabled and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def canary(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.canary_enabled,
+            "ok": self.consecutive_failures == 0 and self.last_success_at is not None,
+            "last_success_at": self.last_success_at,
+            "last_failure_at": self.last_failure_at,
+            "last_latency_ms": round(self.last_latency * 1000, 1) if self.last_latency is not None else None,
+            "consecutive_failures": self.consecutive_failures,
+            "last_error": self.last_error,
+            "checks_total": self.checks_total,
+            "failures_total": self.failures_total,
+            "skipped_total": self.skipped_total,
+        }
+
+    def capacity(self) -> Dict[str, Any]:
+        if not settings.ADMISSION_ENABLED:
+            return {"admission": False}
+        return {
+            "admission": True,
+            "active": admission.active,
+            "max_active": admission.max_active,
+            "free_slots": max(admission.max_active - admission.active, 0),
+            "queued": sum(len(cls.waiters) for cls in admission.classes.values()),
+            "memory_ok": admission.memory_ok(),
+        }
+
+    def readiness(self) -> Tuple[bool, Dict[str, Any]]:
+        reasons: List[str] = []
+        if self.canary_enabled:
+            if self.last_success_at is None and self.consecutive_failures == 0:
+                reasons.append("canary_pending")
+            elif self.consecutive_failures >= self.failure_threshold or self.last_success_at is None:
+                reasons.append("canary_failing")
+        if browser_pool.enabled and not browser_pool.healthy_count():
+            reasons.append("no_browsers")
+        capacity = self.capacity()
+        if capacity["admission"]:
+            if capacity["free_slots"] < self.min_free_slots:
+                reasons.append("no_free_slots")
+            if capacity["queued"] > self.max_queued:
+                reasons.append("queueing")
+            if not capacity["memory_ok"]:
+                reasons.append("memory")
+        return not reasons, {"reasons": reasons, "capacity": capacity, "canary": self.canary()}
+
+    def liveness(self) -> Tuple[bool, Dict[str, Any]]:
+        reasons: List[str] = []
+        if (
+            self.live_failing_seconds
+            and self.failing_since is not None
+            and time.time() - self.failing_since > self.live_failing_seconds
+        ):
+            reasons.append("canary_failing")
+        return not reasons, {"reasons": reasons, "canary": self.canary()}
+
+
+health_monitor = HealthMonitor(
+    interval=settings.HEALTH_CANARY_INTERVAL,
+    timeout=settings.HEALTH_CANARY_TIMEOUT,
+    failure_threshold=settings.HEALTH_CANARY_FAILURES,
+    min_free_slots=settings.HEALTH_READY_MIN_FREE_SLOTS,
+    max_queued=settings.HEALTH_READY_MAX_QUEUED,
+    live_failing_seconds=settings.HEALTH_LIVE_MAX_FAILING_SECONDS,
+)
@@ -0,0 +1,637 @@
+"""
+Change detection for URLs crawled on a schedule.
+
+A monitor is a named list of URLs. Each URL is checked on its own
+schedule, and only pages whose normalized markdown (or, with an
+extraction schema, whose extracted items) differ from the last check are
+appended to the monitor's change feed. The interval between checks
+follows how often the page was seen to change, so pages that rarely
+change are crawled rarely.
+"""
+import asyncio
+import contextvars
+import hashlib
+import json
+import math
+import os
+import re
+import secrets
+import shutil
+import time
+from enum import Enum
+from functools import partial
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from fastapi import HTTPException
+from starlette.concurrency import run_in_threadpool
+
+from app.core.admission import OverloadedError, Priority
+from app.core.config import settings
+from app.core.serialization import dumps
+from app.services.concurrency import adaptive_concurrency
+from app.services.crawler import CrawlSession, bypass_cache_options
+from app.services.extraction import ExtractionEngine, extract_items_async
+from app.services.page_limits import cap_page_fields, field_limits
+from app.services.resilience import fetch_with_retries
+
+# Plain directory names: no separators, no leading dot
+MONITOR_NAME_PATTERN = r"^[A-Za-z0-9_-][A-Za-z0-9._-]{0,99}$"
+MONITOR_FILE = "monitor.json"
+CHANGES_FILE = "changes.jsonl"
+# Browser options of monitor checks; there is no request body to take them from
+MONITOR_CRAWLER_OPTIONS = {
+    "headless": True, "viewport_width": 1280, "viewport_height": 800,
+    "extra_args": ["--disable-gpu", "--disable-dev-shm-usage", "--no-sandbox"],
+}
+
+_whitespace = re.compile(r"[ \t\r\f\v]+")
+
+
+class ChangeKind(str, Enum):
+    NEW = "new"          # First successful check of the URL
+    CHANGED = "changed"  # Content differs from the previous check
+
+
+class CheckOutcome(str, Enum):
+    CHANGED = "changed"            # Content differs (or first check); a change was emitted
+    UNCHANGED = "unchanged"        # Crawled, same fingerprint
+    NOT_MODIFIED = "not_modified"  # The server answered 304 to a conditional HEAD; nothing was rendered
+    FAILED = "failed"              # The crawl failed; the schedule is kept
+
+
+def _saved_version(path: str) -> Optional[int]:
+    try:
+        return os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+class MonitorNotFound(HTTPException):
+    def __init__(self, name: str):
+        super().__init__(status_code=404, detail=f"Monitor {name!r} not found")
+
+
+def normalize_markdown(markdown: str, ignore: Iterable["re.Pattern"] = ()) -> str:
+    """
+    Markdown reduced to what a reader would call the content: `ignore`
+    patterns (timestamps, counters, session tokens) removed, runs of spaces
+    collapsed and blank lines dropped, so layout noise is not a change.
+    """
+    for pattern in ignore:
+        markdown = pattern.sub("", markdown)
+    lines = (_whitespace.sub(" ", line).strip() for line in markdown.splitlines())
+    return "\n".join(line for line in lines if line)
+
+
+def fingerprint(text: str) -> str:
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def change_rate(checks: float, changes: float, observed_seconds: float) -> float:
+    """
+    Changes per second, estimated from how many checks saw a change.
+
+    A check only tells whether the page changed at least once since the
+    last one, so the plain ratio undercounts pages that change faster than
+    they are checked. This is Cho and Garcia-Molina's estimator for Poisson
+    changes observed at regular intervals, which corrects for that and
+    stays finite when every check saw a change.
+    """
+    if checks <= 0 or observed_seconds <= 0:
+        return 0.0
+    mean_interval = observed_seconds / checks
+    return -math.log((checks - changes + 0.5) / (checks + 0.5)) / mean_interval
+
+
+def _header(headers: Optional[Dict[str, str]], name: str) -> Optional[str]:
+    for key, value in (headers or {}).items():
+        if key.lower() == name:
+            return value
+    return None
+
+
+class WatchedUrl:
+    """
+    Schedule and last fingerprint of one URL. `checks`, `changes` and
+    `observed_seconds` decay by MONITOR_HISTORY_DECAY per check, so the
+    estimate follows pages whose update pattern shifts.
+    """
+
+    def __init__(self, url: str, interval: float):
+        self.url = url
+        self.interval = interval
+        self.next_check_at = 0.0  # Due right away
+        self.last_checked_at: Optional[float] = None
+        self.last_changed_at: Optional[float] = None
+        self.fingerprint: Optional[str] = None
+        self.etag: Optional[str] = None
+        self.last_modified: Optional[str] = None
+        self.checks = 0.0
+        self.changes = 0.0
+        self.observed_seconds = 0.0
+        self.checks_total = 0
+        self.changes_total = 0
+        self.failures = 0
+        self.last_error: Optional[str] = None
+
+    def record(self, now: float, changed: bool, min_interval: float, max_interval: float):
+        if self.last_checked_at is not None:
+            decay = settings.MONITOR_HISTORY_DECAY
+            self.checks = self.checks * decay + 1
+            self.changes = self.changes * decay + changed
+            self.observed_seconds = self.observed_seconds * decay + (now - self.last_checked_at)
+            rate = change_rate(self.checks, self.changes, self.observed_seconds)
+            target = settings.MONITOR_CHANGE_FRACTION / rate if rate > 0 else math.inf
+            # Back off gradually from pages that look static; come back at once when they change
+            self.interval = min(target, self.interval * settings.MONITOR_MAX_GROWTH)
+        self.interval = min(max(self.interval, min_interval), max_interval)
+        self.last_checked_at = now
+        self.checks_total += 1
+        if changed:
+            self.last_changed_at = now
+            self.changes_total += 1
+        self.failures = 0
+        self.last_error = None
+        self.next_check_at = now + self.interval
+
+    def record_failure(self, now: float, error: str):
+        self.failures += 1
+        self.last_error = error
+        self.next_check_at = now + self.interval
+
+    def snapshot(self) -> Dict[str, Any]:
+        rate = change_rate(self.checks, self.changes, self.observed_seconds)
+        return {
+            "url": self.url,
+            "interval_s": round(self.interval, 1),
+            "next_check_at": self.next_check_at,
+            "last_checked_at": self.last_checked_at,
+            "last_changed_at": self.last_changed_at,
+            "estimated_change_interval_s": round(1 / rate, 1) if rate > 0 else None,
+            "checks": self.checks_total,
+            "changes": self.changes_total,
+            "failures": self.failures,
+            "last_error": self.last_error,
+        }
+
+    def to_dict(self) -> Dict[str, Any]:
+        return dict(vars(self))
+
+    @classmethod
+    def from_dict(cls, saved: Dict[str, Any]) -> "WatchedUrl":
+        state = cls(saved["url"], saved["interval"])
+        for name, value in saved.items():
+            setattr(state, name, value)
+        return state
+
+
+class Monitor:
+    """
+    A named set of watched URLs, its options and its change feed, stored
+    under DATA_DIR/MONITOR_DIR/<name>.
+    """
+
+    def __init__(self, name: str, directory: str, min_interval: float, max_interval: float,
+                 initial_interval: float, schema: Optional[Dict[str, Any]] = None,
+                 engine: Optional[ExtractionEngine] = None, ignore_patterns: Optional[List[str]] = None,
+                 emit_initial: bool = True):
+        self.name = name
+        self.directory = directory
+        self.urls: Dict[str, WatchedUrl] = {}
+        self.last_seq = 0
+        self.created_at = time.time()
+        self.saved_version: Optional[int] = None  # monitor.json as this process last wrote or read it
+        self.configure(min_interval, max_interval, initial_interval, schema, engine, ignore_patterns, emit_initial)
+        self._lock = asyncio.Lock()
+        self._feed_lock = asyncio.Lock()
+
+    def configure(self, min_interval: float, max_interval: float, initial_interval: float,
+                  schema: Optional[Dict[str, Any]], engine: Optional[ExtractionEngine],
+                  ignore_patterns: Optional[List[str]], emit_initial: bool):
+        ignore_patterns = list(ignore_patterns or [])
+        if self.urls and (schema, engine, ignore_patterns) != (self.schema, self.engine, self.ignore_patterns):
+            # Fingerprints taken another way would all look changed: start over from the next check
+            for state in self.urls.values():
+                state.fingerprint = None
+        self.min_interval = min_interval
+        self.max_interval = max(max_interval, min_interval)
+        self.initial_interval = min(max(initial_interval, self.min_interval), self.max_interval)
+        self.schema = schema
+        self.engine = engine
+        self.ignore_patterns = ignore_patterns
+        self._ignore = [re.compile(pattern) for pattern in self.ignore_patterns]
+        self.emit_initial = emit_initial
+
+    def set_urls(self, urls: Iterable[str]):
+        """
+        Replace the URL list, keeping the history of URLs already watched.
+        """
+        self.urls = {url: self.urls.get(url) or WatchedUrl(url, self.initial_interval) for url in urls}
+
+    @property
+    def path(self) -> str:
+        return os.path.join(self.directory, MONITOR_FILE)
+
+    @property
+    def changes_path(self) -> str:
+        return os.path.join(self.directory, CHANGES_FILE)
+
+    def due(self, now: float, limit: int) -> List[WatchedUrl]:
+        due = [state for state in self.urls.values() if state.next_check_at <= now]
+        due.sort(key=lambda state: state.next_check_at)
+        return due[:limit]
+
+    def next_check_at(self) -> Optional[float]:
+        return min((state.next_check_at for state in self.urls.values()), default=None)
+
+    async def content(self, url: str, result) -> Tuple[str, Dict[str, Any]]:
+        """
+        Fingerprint of what the monitor compares on this page, and the
+        payload a change entry carries.
+        """
+        if self.schema is not None:
+            items = await extract_items_async(self.schema, url, getattr(result, "html", None) or "", self.engine)
+            canonical = json.dumps(items, sort_keys=True, ensure_ascii=False, default=str)
+            return fingerprint(canonical), {"data": items}
+        markdown = str(getattr(result, "markdown", None) or "")
+        normalized = normalize_markdown(markdown, self._ignore)
+        return fingerprint(normalized), {"markdown": markdown}
+
+    def _append(self, data: bytes):
+        with open(self.changes_path, "ab") as f:
+            f.write(data)
+
+    async def emit(self, entry: Dict[str, Any]):
+        async with self._feed_lock:
+            self.last_seq += 1
+            data = dumps({"seq": self.last_seq, **entry}) + b"\n"
+            await run_in_threadpool(self._append, data)
+
+    def trim_changes(self):
+        """
+        Keep the change feed under MONITOR_MAX_CHANGES_BYTES by dropping its
+        oldest half once it grows past the limit.
+        """
+        try:
+            size = os.path.getsize(self.changes_path)
+        except FileNotFoundError:
+            return
+        if size <= settings.MONITOR_MAX_CHANGES_BYTES:
+            return
+        tmp_path = os.path.join(self.directory, f".{CHANGES_FILE}.{secrets.token_hex(4)}.tmp")
+        with open(self.changes_path, "rb") as src, open(tmp_path, "wb") as dst:
+            src.seek(size // 2)
+            src.readline()  # Skip to the start of the next whole entry
+            shutil.copyfileobj(src, dst)
+        os.replace(tmp_path, self.changes_path)
+
+    def read_changes(self, after: int, limit: int) -> List[Dict[str, Any]]:
+        changes = []
+        try:
+            f = open(self.changes_path, "rb")
+        except FileNotFoundError:
+            return changes
+        with f:
+            for line in f:
+                # Entries are written with "seq" first: skip old ones without parsing the page
+                seq = int(line[7:line.index(b",")])
+                if seq <= after:
+                    continue
+                changes.append(json.loads(line))
+                if len(changes) >= limit:
+                    break
+        return changes
+
+    def options(self) -> Dict[str, Any]:
+        return {
+            "min_interval": self.min_interval,
+            "max_interval": self.max_interval,
+            "initial_interval": self.initial_interval,
+            "schema": self.schema,
+            "engine": self.engine.value if self.engine is not None else None,
+            "ignore_patterns": self.ignore_patterns,
+            "emit_initial": self.emit_initial,
+        }
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "urls": len(self.urls),
+            "created_at": self.created_at,
+            "next_check_at": self.next_check_at(),
+            "last_seq": self.last_seq,
+            "checks": sum(state.checks_total for state in self.urls.values()),
+            "changes": sum(state.changes_total for state in self.urls.values()),
+            **self.options(),
+        }
+
+    def save(self):
+        os.makedirs(self.directory, exist_ok=True)
+        saved = {
+            "name": self.name,
+            "created_at": self.created_at,
+            "last_seq": self.last_seq,
+            **self.options(),
+            "urls": [state.to_dict() for state in self.urls.values()],
+        }
+        # A name of its own per save, so an overlapping save cannot replace the file half-written
+        tmp_path = os.path.join(self.directory, f".{MONITOR_FILE}.{secrets.token_hex(4)}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(saved, f)
+        os.replace(tmp_path, self.path)
+        self.saved_version = _saved_version(self.path)
+
+    def _restore(self, saved: Dict[str, Any], version: Optional[int]):
+        engine = ExtractionEngine(saved["engine"]) if saved["engine"] else None
+        self.urls = {}
+        self.configure(saved["min_interval"], saved["max_interval"], saved["initial_interval"],
+                       saved["schema"], engine, saved["ignore_patterns"], saved["emit_initial"])
+        self.created_at = saved["created_at"]
+        self.last_seq = saved["last_seq"]
+        self.urls = {entry["url"]: WatchedUrl.from_dict(entry) for entry in saved["urls"]}
+        self.saved_version = version
+
+    def refresh(self) -> bool:
+        """
+        Re-read the monitor if another worker saved it since this process
+        last wrote or read it, so schedules and change sequence numbers
+        carry on from there. Returns False once the monitor was deleted.
+        """
+        version = _saved_version(self.path)
+        if version is None:
+            return False
+        if version != self.saved_version:
+            with open(self.path, encoding="utf-8") as f:
+                self._restore(json.load(f), version)
+        return True
+
+    @classmethod
+    def load(cls, directory: str) -> "Monitor":
+        path = os.path.join(directory, MONITOR_FILE)
+        version = _saved_version(path)
+        with open(path, encoding="utf-8") as f:
+            saved = json.load(f)
+        engine = ExtractionEngine(saved["engine"]) if saved["engine"] else None
+        monitor = cls(saved["name"], directory, saved["min_interval"], saved["max_interval"],
+                      saved["initial_interval"], saved["schema"], engine, saved["ignore_patterns"],
+                      saved["emit_initial"])
+        monitor._restore(saved, version)
+        return monitor
+
+
+class MonitorScheduler:
+    """
+    Runs the checks of every monitor as they fall due.
+
+    Every `tick` seconds, up to `max_urls_per_round` due URLs per monitor
+    are checked in one bulk-priority crawl session, within the adaptive
+    concurrency limits. A URL that answered with an ETag or Last-Modified
+    is first asked with a conditional HEAD; a 304 counts as unchanged
+    without rendering anything.
+    """
+
+    def __init__(self, directory: str, tick: float, max_urls_per_round: int):
+        self.directory = directory
+        self.tick = tick
+        self.max_urls_per_round = max(max_urls_per_round, 1)
+        self.monitors: Dict[str, Monitor] = {}
+        self.outcomes_total = {outcome: 0 for outcome in CheckOutcome}
+        self.last_round_at: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def _scan(self, known: Iterable[str]) -> Tuple[Dict[str, Monitor], set]:
+        """
+        Monitors on disk that are not in `known`, loaded, and the names of
+        all monitors on disk. Blocking: run in the threadpool.
+        """
+        try:
+            names = sorted(os.listdir(self.directory))
+        except FileNotFoundError:
+            return {}, set()
+        known = set(known)
+        loaded, present = {}, set()
+        for name in names:
+            directory = os.path.join(self.directory, name)
+            if not os.path.exists(os.path.join(directory, MONITOR_FILE)):
+                continue
+            present.add(name)
+            if name not in known:
+                try:
+                    loaded[name] = Monitor.load(directory)
+                except (OSError, ValueError, KeyError):
+                    # Deleted meanwhile, or not a monitor this version can read
+                    present.discard(name)
+        return loaded, present
+
+    async def _sync(self):
+        """
+        Pick up monitors other workers created and drop those they deleted.
+        The registry is only changed here, on the event loop.
+        """
+        loaded, present = await run_in_threadpool(self._scan, list(self.monitors))
+        for name, monitor in loaded.items():
+            self.monitors.setdefault(name, monitor)
+        for name, monitor in list(self.monitors.items()):
+            # A monitor not saved yet is still being created by this process
+            if name not in present and monitor.saved_version is not None:
+                self.monitors.pop(name)
+
+    async def get(self, name: str) -> Monitor:
+        monitor = self.monitors.get(name)
+        if monitor is None:
+            # Possibly created by another worker
+            await self._sync()
+            monitor = self.monitors.get(name)
+        if monitor is None:
+            raise MonitorNotFound(name)
+        return monitor
+
+    async def put(self, name: str, urls: List[str], **options) -> Monitor:
+        """
+        Create a monitor or update its URLs and options in place. The
+        monitor is changed under its lock, so never in the middle of a
+        check, and only the save runs in the threadpool.
+        """
+        if not re.match(MONITOR_NAME_PATTERN, name):
+            raise ValueError(f"Invalid monitor name {name!r}")
+        if name not in self.monitors:
+            await self._sync()
+        monitor = self.monitors.get(name)
+        created = monitor is None
+        if created:
+            monitor = self.monitors[name] = Monitor(name, os.path.join(self.directory, name), **options)
+        async with monitor._lock:
+            if not created:
+                # Start from what another worker may have saved since
+                await run_in_threadpool(monitor.refresh)
+                monitor.configure(**options)
+            monitor.set_urls(dict.fromkeys(urls))
+            try:
+                await run_in_threadpool(monitor.save)
+            except BaseException:
+                if created and self.monitors.get(name) is monitor:
+                    self.monitors.pop(name)
+                raise
+        return monitor
+
+    async def delete(self, name: str):
+        monitor = await self.get(name)
+        async with monitor._lock:
+            self.monitors.pop(name, None)
+            await run_in_threadpool(shutil.rmtree, monitor.directory, True)
+
+    async def snapshot(self) -> List[Dict[str, Any]]:
+        await self._sync()
+        return [monitor.status() for monitor in self.monitors.values()]
+
+    def scheduler_status(self) -> Dict[str, Any]:
+        return {
+            "running": self._task is not None,
+            "tick_s": self.tick,
+            "last_round_at": self.last_round_at,
+            "last_error": self.last_error,
+            "outcomes": {outcome.value: count for outcome, count in self.outcomes_total.items()},
+        }
+
+    async def _not_modified(self, http, state: WatchedUrl) -> bool:
+        import aiohttp
+
+        headers = {}
+        if state.etag:
+            headers["If-None-Match"] = state.etag
+        if state.last_modified:
+            headers["If-Modified-Since"] = state.last_modified
+        if not headers:
+            return False
+        try:
+            async with http.head(state.url, headers=headers, allow_redirects=True) as response:
+                return response.status == 304
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            # Let the crawl decide
+            return False
+
+    async def _check_url(self, monitor: Monitor, state: WatchedUrl, crawler, http,
+                         limits: Dict[str, int]) -> Optional[CheckOutcome]:
+        if await self._not_modified(http, state):
+            state.record(time.time(), False, monitor.min_interval, monitor.max_interval)
+            return CheckOutcome.NOT_MODIFIED
+        # A cached copy would hide every change after the first check
+        outcome = await fetch_with_retries(
+            state.url, partial(adaptive_concurrency.crawl, crawler, state.url, **bypass_cache_options())
+        )
+        if isinstance(outcome.error, OverloadedError):
+            # No browser for now: the URL stays due for the next round
+            return None
+        result = outcome.result
+        if outcome.error is not None or not getattr(result, "success", True):
+            error = str(outcome.error) if outcome.error is not None else getattr(result, "error_message", None)
+            state.record_failure(time.time(), error or "crawl failed")
+            return CheckOutcome.FAILED
+
+        content_fingerprint, payload = await monitor.content(state.url, result)
+        headers = getattr(result, "response_headers", None)
+        state.etag = _header(headers, "etag")
+        state.last_modified = _header(headers, "last-modified")
+        previous = state.fingerprint
+        changed = previous is not None and content_fingerprint != previous
+        state.fingerprint = content_fingerprint
+        now = time.time()
+        state.record(now, changed, monitor.min_interval, monitor.max_interval)
+        if not changed and (previous is not None or not monitor.emit_initial):
+            return CheckOutcome.UNCHANGED
+
+        entry = {
+            "url": state.url,
+            "kind": (ChangeKind.CHANGED if changed else ChangeKind.NEW).value,
+            "checked_at": now,
+            "fingerprint": content_fingerprint,
+            "previous_fingerprint": previous,
+            "status_code": getattr(result, "status_code", None),
+            **payload,
+        }
+        truncated = cap_page_fields(entry, limits)
+        if truncated:
+            entry["truncated"] = truncated
+        await monitor.emit(entry)
+        return CheckOutcome.CHANGED
+
+    async def check(self, monitor: Monitor, force: bool = False) -> Dict[str, int]:
+        """
+        Check the monitor's due URLs (all of them with `force`), at most
+        `max_urls_per_round`, and save the new schedule.
+        """
+        import aiohttp
+
+        counts = {outcome.value: 0 for outcome in CheckOutcome}
+        async with monitor._lock:
+            # Another worker may have checked, changed or deleted the monitor since
+            if not await run_in_threadpool(monitor.refresh):
+                if self.monitors.get(monitor.name) is monitor:
+                    self.monitors.pop(monitor.name)
+                raise MonitorNotFound(monitor.name)
+            now = math.inf if force else time.time()
+            due = monitor.due(now, self.max_urls_per_round)
+            if not due:
+                return counts
+            limits = field_limits(None)
+            window = max(settings.ADAPTIVE_MAX_CONCURRENCY, 1)
+            timeout = aiohttp.ClientTimeout(total=settings.MONITOR_CONDITIONAL_TIMEOUT)
+            try:
+                async with aiohttp.ClientSession(timeout=timeout) as http, \
+                        CrawlSession(dict(MONITOR_CRAWLER_OPTIONS), priority=Priority.BULK) as crawler:
+                    for i in range(0, len(due), window):
+                        outcomes = await asyncio.gather(*(
+                            self._check_url(monitor, state, crawler, http, limits) for state in due[i:i + window]
+                        ))
+                        for outcome in outcomes:
+                            if outcome is not None:
+                                counts[outcome.value] += 1
+                                self.outcomes_total[outcome] += 1
+            finally:
+                if monitor.name in self.monitors:
+                    await run_in_threadpool(monitor.save)
+                    await run_in_threadpool(monitor.trim_changes)
+        return counts
+
+    async def check_due(self):
+        await self._sync()
+        self.last_round_at = time.time()
+        for monitor in list(self.monitors.values()):
+            try:
+                await self.check(monitor)
+            except MonitorNotFound:
+                # Deleted by another worker
+                pass
+            except OverloadedError:
+                # No capacity for a session right now; the URLs stay due
+                pass
+            except Exception as e:
+                # One broken monitor must not stop the others
+                self.last_error = f"{monitor.name}: {str(e) or type(e).__name__}"
+
+    async def _run(self):
+        while True:
+            await self.check_due()
+            await asyncio.sleep(self.tick)
+
+    def start(self):
+        if settings.MONITOR_SCHEDULER_ENABLED and self._task is None:
+            # Checks are background work: keep them out of any request's deadline and timings
+            self._task = asyncio.get_running_loop().create_task(self._run(), context=contextvars.Context())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+monitor_scheduler = MonitorScheduler(
+    directory=os.path.join(settings.DATA_DIR, settings.MONITOR_DIR),
+    tick=settings.MONITOR_TICK_SECONDS,
+    max_urls_per_round=settings.MONITOR_MAX_URLS_PER_ROUND,
+)
@@ -0,0 +1,116 @@
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from app.core.config import settings
+
+TRUNCATION_MARKER = "\n\n[... truncated: {field} exceeded {limit} bytes ...]"
+
+
+class PageTooLargeError(Exception):
+    """
+    Raised before a download starts when the server advertises a body
+    larger than MAX_DOWNLOAD_BYTES.
+    """
+
+
+def field_limits(max_field_bytes: Optional[int] = None) -> Dict[str, int]:
+    """
+    Byte caps per result field. A request may lower the server caps, never raise them.
+    """
+    limits = {
+        "html": settings.MAX_HTML_BYTES,
+        "cleaned_html": settings.MAX_CLEANED_HTML_BYTES,
+        "markdown": settings.MAX_MARKDOWN_BYTES,
+    }
+    if max_field_bytes is not None:
+        limits = {name: min(limit, max_field_bytes) if limit else max_field_bytes
+                  for name, limit in limits.items()}
+    return limits
+
+
+def truncate_to_bytes(value: str, limit: int) -> Tuple[str, bool]:
+    """
+    Cut a string to at most `limit` UTF-8 bytes without encoding the whole
+    page: a string never has more characters than bytes, and never more
+    than four bytes per character.
+    """
+    if not limit or not value or len(value) * 4 <= limit:
+        return value, False
+    head = value[:limit]
+    encoded = head.encode("utf-8")
+    if len(encoded) <= limit and len(head) == len(value):
+        return value, False
+    return encoded[:limit].decode("utf-8", errors="ignore"), True
+
+
+def cap_page_fields(data: Dict[str, Any], limits: Dict[str, int]) -> List[str]:
+    """
+    Truncate oversized text fields of a result in place, ending them with a
+    marker that counts towards the limit. Returns the names of the
+    truncated fields.
+    """
+    truncated = []
+    for name, limit in limits.items():
+        value = data.get(name)
+        if not isinstance(value, str):
+            continue
+        value, was_truncated = truncate_to_bytes(value, limit)
+        if was_truncated:
+            marker = TRUNCATION_MARKER.format(field=name, limit=limit)
+            room = limit - len(marker.encode("utf-8"))
+            # A limit too small to hold the marker cuts the text without one
+            data[name] = truncate_to_bytes(value, room)[0] + marker if room > 0 else value
+            truncated.append(name)
+    return truncated
+
+
+def iter_text_chunks(text: str, chunk_chars: int) -> Iterator[bytes]:
+    """
+    Encode a large text body slice by slice instead of all at once.
+    """
+    for start in range(0, len(text), chunk_chars):
+        yield text[start:start + chunk_chars].encode("utf-8")
+
+
+class DownloadProbe:
+    """
+    HEAD requests asking servers for a page's size before it is
+    downloaded, over one connection pool shared by every crawl.
+    """
+
+    def __init__(self):
+        self._session = None
+
+    def _client(self):
+        import aiohttp
+
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                timeout=aiohttp.ClientTimeout(total=settings.DOWNLOAD_PROBE_TIMEOUT)
+            )
+        return self._session
+
+    async def check(self, url: str, limit: int):
+        """
+        Abort early if the server advertises more than `limit` bytes. Servers
+        that don't answer HEAD or don't send Content-Length are let through
+        and capped after download.
+        """
+        if not limit or not url.startswith(("http://", "https://")):
+            return
+        try:
+            async with self._client().head(url, allow_redirects=True) as response:
+                length = response.headers.get("Content-Length")
+        except Exception:
+            return
+        if length and length.isdigit() and int(length) > limit:
+            raise PageTooLargeError(
+                f"Page at {url} is {int(length)} bytes, above the {limit} byte download limit"
+            )
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+
+download_probe = DownloadProbe()
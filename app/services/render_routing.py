@@ -0,0 +1,234 @@
+import json
+import os
+import random
+import threading
+import time
+from enum import Enum
+from typing import Any, Dict, List, Optional
+from urllib.parse import urlsplit
+
+from starlette.concurrency import run_in_threadpool
+
+from app.core.config import settings
+
+
+class RenderMode(str, Enum):
+    AUTO = "auto"        # Learn from sampled pages
+    STATIC = "static"    # HTTP-only fetch, no browser
+    BROWSER = "browser"  # Full browser render
+
+
+class RenderDecision(str, Enum):
+    STATIC = "static"    # Use the HTTP-only path
+    BROWSER = "browser"  # Use the browser path
+    SAMPLE = "sample"    # Run both paths and record whether they agree
+
+
+def routing_key(url: str) -> str:
+    """
+    Key a URL by host plus its first path segment, e.g. "example.com/blog".
+    """
+    parts = urlsplit(url)
+    host = (parts.hostname or "").lower()
+    segment = parts.path.strip("/").split("/", 1)[0]
+    return f"{host}/{segment}" if segment else host
+
+
+def _text_length(result) -> int:
+    markdown = getattr(result, "markdown", None) or ""
+    return len(str(markdown).strip())
+
+
+def _link_count(result) -> int:
+    links = getattr(result, "links", None) or {}
+    if isinstance(links, dict):
+        return sum(len(v or []) for v in links.values())
+    return len(links)
+
+
+def results_match(browser_result, static_result, text_ratio: float) -> bool:
+    """
+    Decide whether an HTTP-only result is as good as the browser-rendered one.
+    The static page must carry most of the browser's text and links.
+    """
+    if not getattr(static_result, "success", False):
+        return False
+    browser_text = _text_length(browser_result)
+    if browser_text and _text_length(static_result) < browser_text * text_ratio:
+        return False
+    browser_links = _link_count(browser_result)
+    if browser_links and _link_count(static_result) < browser_links * text_ratio:
+        return False
+    return True
+
+
+class RenderRouter:
+    """
+    Per domain / path-prefix table of whether pages need a browser.
+
+    Each prefix keeps a window of recent sample outcomes (True when the
+    HTTP-only result matched the browser result). Once enough samples agree
+    the prefix is routed to the static path; a small share of static traffic
+    keeps being re-verified so a site that starts relying on JS is picked up.
+    Operators can pin any prefix with an override.
+
+    Samples only mark the table dirty; it is written to disk at most every
+    `save_interval` seconds, in the threadpool, and on shutdown.
+    """
+
+    def __init__(self, path: str, min_samples: int, window: int,
+                 match_ratio: float, text_ratio: float, resample_rate: float,
+                 save_interval: float = 0.0):
+        self.path = path
+        self.min_samples = min_samples
+        self.window = window
+        self.match_ratio = match_ratio
+        self.text_ratio = text_ratio
+        self.resample_rate = resample_rate
+        self.save_interval = save_interval
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()  # Serializes writers, which run outside `_lock`
+        self._dirty = False
+        self._saved_at = time.monotonic()
+        self._learned: Dict[str, Dict[str, Any]] = {}
+        self._overrides: Dict[str, RenderMode] = {}
+        self._load()
+
+    # Persistence
+
+    def _load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        self._learned = data.get("learned", {})
+        self._overrides = {k: RenderMode(v) for k, v in data.get("overrides", {}).items()}
+
+    def flush(self):
+        """
+        Write the table if it changed since the last write. Blocking: call
+        it in the threadpool from async code.
+        """
+        with self._save_lock:
+            with self._lock:
+                if not self._dirty:
+                    return
+                self._dirty = False
+                data = json.dumps({
+                    "learned": self._learned,
+                    "overrides": {k: v.value for k, v in self._overrides.items()},
+                }, sort_keys=True)
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(data)
+            os.replace(tmp_path, self.path)
+
+    async def flush_if_due(self):
+        """
+        Write pending samples once `save_interval` has passed since the last write.
+        """
+        now = time.monotonic()
+        if not self._dirty or now - self._saved_at < self.save_interval:
+            return
+        self._saved_at = now
+        await run_in_threadpool(self.flush)
+
+    # Routing
+
+    def _override_for(self, url: str) -> Optional[RenderMode]:
+        # Longest matching prefix wins, so "example.com/app" beats "example.com"
+        parts = urlsplit(url)
+        full = f"{(parts.hostname or '').lower()}{parts.path}".rstrip("/")
+        best = None
+        for pattern, mode in self._overrides.items():
+            if full != pattern and not full.startswith(pattern + "/"):
+                continue
+            if best is None or len(pattern) > len(best[0]):
+                best = (pattern, mode)
+        return best[1] if best else None
+
+    def _learned_mode(self, entry: Optional[Dict[str, Any]]) -> RenderMode:
+        if not entry or len(entry["samples"]) < self.min_samples:
+            return RenderMode.AUTO
+        matches = sum(1 for s in entry["samples"] if s)
+        if matches / len(entry["samples"]) >= self.match_ratio:
+            return RenderMode.STATIC
+        return RenderMode.BROWSER
+
+    def decide(self, url: str) -> RenderDecision:
+        with self._lock:
+            override = self._override_for(url)
+            if override == RenderMode.STATIC:
+                return RenderDecision.STATIC
+            if override == RenderMode.BROWSER:
+                return RenderDecision.BROWSER
+            mode = self._learned_mode(self._learned.get(routing_key(url)))
+        if mode == RenderMode.AUTO:
+            return RenderDecision.SAMPLE
+        if mode == RenderMode.STATIC:
+            return RenderDecision.SAMPLE if random.random() < self.resample_rate else RenderDecision.STATIC
+        return RenderDecision.BROWSER
+
+    def record(self, url: str, browser_result, static_result):
+        """
+        Record one sampled page where both fetch paths ran.
+        """
+        matched = results_match(browser_result, static_result, self.text_ratio)
+        key = routing_key(url)
+        with self._lock:
+            entry = self._learned.setdefault(key, {"samples": []})
+            entry["samples"] = (entry["samples"] + [matched])[-self.window:]
+            entry["updated_at"] = time.time()
+            self._dirty = True
+        return matched
+
+    # Inspection and overrides
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            keys = sorted(set(self._learned) | set(self._overrides))
+            table = []
+            for key in keys:
+                entry = self._learned.get(key)
+                samples = entry["samples"] if entry else []
+                table.append({
+                    "pattern": key,
+                    "override": self._overrides[key].value if key in self._overrides else None,
+                    "learned_mode": self._learned_mode(entry).value,
+                    "samples": len(samples),
+                    "matches": sum(1 for s in samples if s),
+                    "updated_at": entry.get("updated_at") if entry else None,
+                })
+            return table
+
+    def set_override(self, pattern: str, mode: RenderMode):
+        pattern = pattern.strip().lower().rstrip("/")
+        with self._lock:
+            if mode == RenderMode.AUTO:
+                self._overrides.pop(pattern, None)
+            else:
+                self._overrides[pattern] = mode
+            self._dirty = True
+
+    def forget(self, pattern: str) -> bool:
+        pattern = pattern.strip().lower().rstrip("/")
+        with self._lock:
+            removed = self._learned.pop(pattern, None) is not None
+            removed = self._overrides.pop(pattern, None) is not None or removed
+            self._dirty = self._dirty or removed
+        return removed
+
+
+render_router = RenderRouter(
+    path=os.path.join(settings.DATA_DIR, settings.RENDER_ROUTING_FILE),
+    min_samples=settings.RENDER_ROUTING_MIN_SAMPLES,
+    window=settings.RENDER_ROUTING_WINDOW,
+    match_ratio=settings.RENDER_ROUTING_MATCH_RATIO,
+    text_ratio=settings.RENDER_ROUTING_TEXT_RATIO,
+    resample_rate=settings.RENDER_ROUTING_RESAMPLE_RATE,
+    save_interval=settings.RENDER_ROUTING_SAVE_INTERVAL,
+)
@@ -0,0 +1,278 @@
+import asyncio
+import random
+import time
+from enum import Enum
+from typing import Any, Awaitable, Callable, Dict, NamedTuple, Optional
+
+from fastapi import HTTPException
+
+from app.core.config import settings
+from app.core.deadline import DeadlineExceeded, remaining_time
+from app.services.concurrency import domain_of
+from app.services.page_limits import PageTooLargeError
+
+# Status codes worth retrying: the server or something in between was briefly unable to answer
+RETRYABLE_STATUS_CODES = {408, 425, 429, 500, 502, 503, 504}
+# Browser / network errors that are usually gone on the next attempt
+TRANSIENT_ERROR_MARKERS = (
+    "timeout", "timed out", "net::err_connection_reset", "net::err_connection_closed",
+    "net::err_connection_refused", "net::err_connection_aborted", "net::err_empty_response",
+    "net::err_network_changed", "net::err_http2_protocol_error", "net::err_timed_out",
+)
+# Errors that say the whole domain is unusable right now, but will not fix themselves on a retry
+DOMAIN_ERROR_MARKERS = (
+    "net::err_name_not_resolved", "net::err_address_unreachable", "net::err_cert_",
+    "net::err_ssl_", "net::err_tunnel_connection_failed",
+)
+# Healthy breakers are dropped once this many domains are tracked
+MAX_TRACKED_DOMAINS = 10000
+# Seconds before the request deadline within which a timeout is put down to the
+# deadline: CrawlSession caps page_timeout at the time the request has left
+DEADLINE_TIMEOUT_MARGIN = 1.0
+
+
+class FailureKind(str, Enum):
+    NONE = "none"            # Success, or an answer that says nothing bad about the domain
+    TRANSIENT = "transient"  # Retry, and count against the domain's breaker
+    DOMAIN = "domain"        # Do not retry, but count against the domain's breaker
+    PAGE = "page"            # Page-specific (404, ...): neither, and the domain answered
+    LOCAL = "local"          # Our own refusal, deadline or overload: says nothing about the domain
+
+
+def _deadline_spent() -> bool:
+    try:
+        remaining = remaining_time()
+    except DeadlineExceeded:
+        return True
+    return remaining is not None and remaining <= DEADLINE_TIMEOUT_MARGIN
+
+
+def classify_failure(result: Any = None, error: Optional[BaseException] = None) -> FailureKind:
+    if error is not None:
+        # Our own refusals and deadlines are not the target's fault
+        if isinstance(error, (HTTPException, PageTooLargeError, CircuitOpenError)):
+            return FailureKind.LOCAL
+        if isinstance(error, asyncio.TimeoutError):
+            return FailureKind.LOCAL if _deadline_spent() else FailureKind.TRANSIENT
+        message = str(error).lower()
+    else:
+        if getattr(result, "status_code", None) in RETRYABLE_STATUS_CODES:
+            return FailureKind.TRANSIENT
+        if getattr(result, "success", True):
+            return FailureKind.NONE
+        message = str(getattr(result, "error_message", "") or "").lower()
+
+    if any(marker in message for marker in TRANSIENT_ERROR_MARKERS):
+        # A navigation timeout cut short by the client's deadline says nothing about the site
+        if ("timeout" in message or "timed out" in message) and _deadline_spent():
+            return FailureKind.LOCAL
+        return FailureKind.TRANSIENT
+    if any(marker in message for marker in DOMAIN_ERROR_MARKERS):
+        return FailureKind.DOMAIN
+    return FailureKind.PAGE
+
+
+class CircuitOpenError(Exception):
+    def __init__(self, domain: str, retry_in: float):
+        super().__init__(f"Circuit open for {domain}, retry in {max(0, round(retry_in))}s")
+        self.domain = domain
+        self.retry_in = retry_in
+
+
+class BreakerState(str, Enum):
+    CLOSED = "closed"        # Requests flow
+    OPEN = "open"            # Fast-fail until the cooldown ends
+    HALF_OPEN = "half_open"  # One probe request decides between closed and open
+
+
+class CircuitBreaker:
+    """
+    Trips after `failure_threshold` consecutive domain failures, fast-fails
+    for a cooldown, then lets a single probe through. A failed probe
+    reopens the breaker with twice the cooldown (up to `max_cooldown`).
+    """
+
+    def __init__(self, failure_threshold: int, cooldown: float, max_cooldown: float):
+        self.failure_threshold = failure_threshold
+        self.base_cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.state = BreakerState.CLOSED
+        self.cooldown = cooldown
+        self.consecutive_failures = 0
+        self.open_until = 0.0
+        self.trips = 0
+        self.fast_failed = 0
+        self.last_error: Optional[str] = None
+        self.updated_at = time.time()
+        self._probe_in_flight = False
+
+    def before_call(self, domain: str):
+        """
+        Raise CircuitOpenError unless a request may go to the domain now.
+        """
+        if self.state == BreakerState.CLOSED:
+            return
+        now = time.monotonic()
+        if self.state == BreakerState.OPEN and now >= self.open_until:
+            self._set_state(BreakerState.HALF_OPEN)
+        if self.state == BreakerState.HALF_OPEN and not self._probe_in_flight:
+            self._probe_in_flight = True
+            return
+        self.fast_failed += 1
+        raise CircuitOpenError(domain, self.open_until - now)
+
+    def record(self, kind: FailureKind, message: Optional[str] = None):
+        self._probe_in_flight = False
+        if kind == FailureKind.LOCAL:
+            return
+        if kind in (FailureKind.NONE, FailureKind.PAGE):
+            # The domain answered; whatever went wrong was about the page
+            self.consecutive_failures = 0
+            if self.state != BreakerState.CLOSED:
+                self.cooldown = self.base_cooldown
+                self._set_state(BreakerState.CLOSED)
+            return
+        self.consecutive_failures += 1
+        self.last_error = message
+        if self.state == BreakerState.HALF_OPEN:
+            self.cooldown = min(self.cooldown * 2, self.max_cooldown)
+            self._open()
+        elif self.state == BreakerState.CLOSED and self.consecutive_failures >= self.failure_threshold:
+            self._open()
+
+    def release_probe(self):
+        # A probe that was cancelled or refused on our side tells us nothing; let the next request try
+        self._probe_in_flight = False
+
+    def _open(self):
+        self.open_until = time.monotonic() + self.cooldown
+        self.trips += 1
+        self._set_state(BreakerState.OPEN)
+
+    def _set_state(self, state: BreakerState):
+        self.state = state
+        self.updated_at = time.time()
+
+    def snapshot(self) -> Dict:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "retry_in_s": round(max(0.0, self.open_until - time.monotonic()), 1) if self.state == BreakerState.OPEN else None,
+            "cooldown_s": self.cooldown,
+            "trips": self.trips,
+            "fast_failed": self.fast_failed,
+            "last_error": self.last_error,
+            "updated_at": self.updated_at,
+        }
+
+
+class CircuitBreakers:
+    """
+    One breaker per target domain, created on first use.
+    """
+
+    def __init__(self):
+        self._breakers: Dict[str, CircuitBreaker] = {}
+
+    def get(self, domain: str) -> CircuitBreaker:
+        breaker = self._breakers.get(domain)
+        if breaker is None:
+            breaker = CircuitBreaker(settings.BREAKER_FAILURE_THRESHOLD, settings.BREAKER_COOLDOWN,
+                                     settings.BREAKER_MAX_COOLDOWN)
+            self._breakers[domain] = breaker
+            if len(self._breakers) > MAX_TRACKED_DOMAINS:
+                self._prune()
+        return breaker
+
+    def _prune(self):
+        for domain, breaker in list(self._breakers.items()):
+            if breaker.state == BreakerState.CLOSED and not breaker.consecutive_failures:
+                del self._breakers[domain]
+
+    def snapshot(self) -> Dict[str, Dict]:
+        # Healthy closed breakers are noise; only list domains with a history
+        return {
+            domain: breaker.snapshot() for domain, breaker in sorted(self._breakers.items())
+            if breaker.state != BreakerState.CLOSED or breaker.consecutive_failures or breaker.trips
+        }
+
+    def reset(self, domain: str) -> bool:
+        return self._breakers.pop(domain, None) is not None
+
+
+circuit_breakers = CircuitBreakers()
+
+
+class FetchOutcome(NamedTuple):
+    result: Any
+    error: Optional[BaseException]
+    attempts: int
+
+
+def backoff_delay(attempt: int, result: Any = None) -> float:
+    """
+    Full-jitter exponential backoff before retry number `attempt` (1-based),
+    stretched to the server's Retry-After when it asks for a longer pause.
+    """
+    delay = random.uniform(0, min(settings.RETRY_MAX_DELAY, settings.RETRY_BASE_DELAY * 2 ** (attempt - 1)))
+    headers = getattr(result, "response_headers", None) or {}
+    retry_after = next((v for k, v in headers.items() if k.lower() == "retry-after"), None)
+    try:
+        if retry_after is not None and float(retry_after) <= settings.RETRY_MAX_DELAY:
+            delay = max(delay, float(retry_after))
+    except ValueError:
+        pass
+    return delay
+
+
+async def fetch_with_retries(url: str, attempt: Callable[[], Awaitable[Any]],
+                             max_attempts: Optional[int] = None) -> FetchOutcome:
+    """
+    Run `attempt` (one crawl of `url`) through the domain's circuit breaker,
+    retrying transient failures with backoff while attempts and the request
+    deadline allow. Never raises for crawl failures: the last result or
+    error is returned with the number of attempts made.
+    """
+    max_attempts = max(1, max_attempts or settings.RETRY_MAX_ATTEMPTS)
+    domain = domain_of(url)
+    breaker = circuit_breakers.get(domain)
+    result = error = None
+    attempts = 0
+
+    while attempts < max_attempts:
+        try:
+            breaker.before_call(domain)
+        except CircuitOpenError as e:
+            if attempts == 0:
+                return FetchOutcome(None, e, 0)
+            # Report the real failure of the previous attempt
+            break
+
+        attempts += 1
+        result = error = None
+        try:
+            result = await attempt()
+        except asyncio.CancelledError:
+            breaker.release_probe()
+            raise
+        except Exception as e:
+            error = e
+        kind = classify_failure(result, error)
+        if kind == FailureKind.LOCAL:
+            # Neither a failure nor a sign of recovery; the breaker's count stays as it was
+            breaker.release_probe()
+        else:
+            breaker.record(kind, str(error) if error else getattr(result, "error_message", None))
+
+        if kind != FailureKind.TRANSIENT or attempts == max_attempts:
+            break
+        delay = backoff_delay(attempts, result)
+        try:
+            remaining = remaining_time()
+        except DeadlineExceeded:
+            break
+        if remaining is not None and remaining <= delay:
+            break
+        await asyncio.sleep(delay)
+
+    return FetchOutcome(result, error, attempts)
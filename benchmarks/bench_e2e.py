@@ -0,0 +1,381 @@
+"""
+End-to-end load benchmark of the crawl endpoints against a local fixture site.
+
+    python -m benchmarks.bench_e2e --concurrency 1,4 --requests 40 --output run.json
+    python -m benchmarks.bench_e2e --compare baseline.json --output run.json
+
+Starts benchmarks.fixture_site and the service (uvicorn app.main:app) on
+free local ports, then drives every scenario below at each concurrency
+level and prints a JSON report: throughput, latency percentiles, status
+codes, and the peak RSS and browser process count of the service's process
+tree (sampled with psutil; null without it). No network access is needed
+once Playwright's browser is installed.
+
+Pass --base-url to load an already running service instead; it must be
+able to reach the fixture site (--fixture-host / --fixture-port), and its
+process tree is only sampled when --service-pid is given.
+
+With --compare, scenarios that lost more than --tolerance of their
+throughput or gained more than --tolerance on p95 latency against the
+baseline report are listed under "regressions" and the exit status is 1.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+import aiohttp
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+from app.core.config import settings
+
+API = settings.API_V1_STR + "/crawl"
+BROWSER_PROCESS_MARKERS = ("chrome", "chromium", "headless_shell")
+# Warm-up requests use pages the measured requests never ask for
+WARMUP_FIRST_PAGE = 100_000
+
+EXTRACTION_SCHEMA = {
+    "name": "products",
+    "base_selector": "div.product",
+    "fields": [
+        {"name": "title", "selector": "h2.title", "type": "text"},
+        {"name": "price", "selector": "span.price", "type": "text"},
+        {"name": "link", "selector": "a.link", "type": "attribute", "attribute": "href"},
+    ],
+}
+
+
+def _scenarios(site: str, huge_kb: int, slow_delay: float, multi_urls: int) -> Dict[str, Dict[str, Any]]:
+    """
+    Scenario name -> endpoint and a function building the body of request i.
+    Request i uses page i, so pages differ across requests and runs agree.
+    """
+    return {
+        "basic_static": {"path": f"{API}/basic/", "body": lambda i: {"url": f"{site}/static/{i}"}},
+        "basic_js": {"path": f"{API}/basic/", "body": lambda i: {"url": f"{site}/js/{i}"}},
+        "basic_huge": {"path": f"{API}/basic/", "body": lambda i: {"url": f"{site}/huge/{i}?kb={huge_kb}"}},
+        "basic_slow": {"path": f"{API}/basic/", "body": lambda i: {"url": f"{site}/slow/{i}?delay={slow_delay}"}},
+        "content_static": {
+            "path": f"{API}/content/",
+            "body": lambda i: {"url": f"{site}/static/{i}", "css_selector": "article"},
+        },
+        "extraction_listing": {
+            "path": f"{API}/extraction/structured",
+            "body": lambda i: {"url": f"{site}/list/{i % 50 + 1}", "schema": EXTRACTION_SCHEMA},
+        },
+        "cached_static": {
+            # Only a few distinct pages, so most requests are cache hits after the first round
+            "path": f"{API}/cached",
+            "body": lambda i: {"url": f"{site}/static/{i % 5}", "cache_mode": "enabled"},
+        },
+        "multi_listing": {
+            "path": f"{API}/multi",
+            "body": lambda i: {
+                "urls": [f"{site}/list/{(i * multi_urls + k) % 50 + 1}" for k in range(multi_urls)],
+                "mode": "adaptive",
+            },
+        },
+        "multi_mixed": {
+            "path": f"{API}/multi",
+            "body": lambda i: {
+                "urls": [f"{site}/{kind}/{i * multi_urls + k}" for k, kind in
+                         zip(range(multi_urls), ["static", "js"] * multi_urls)],
+                "mode": "parallel",
+                "max_concurrent": 4,
+            },
+        },
+    }
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _percentile(sorted_values: List[float], q: float) -> Optional[float]:
+    if not sorted_values:
+        return None
+    k = min(len(sorted_values) - 1, max(0, round(q * (len(sorted_values) - 1))))
+    return sorted_values[k]
+
+
+class ProcessSampler:
+    """
+    Track peak RSS and browser process count of a process and its children.
+    """
+
+    def __init__(self, pid: Optional[int], interval: float = 0.25):
+        self.process = psutil.Process(pid) if psutil is not None and pid else None
+        self.interval = interval
+        self.peak_rss = 0
+        self.peak_browsers = 0
+        self._task: Optional[asyncio.Task] = None
+
+    def sample(self):
+        if self.process is None:
+            return
+        try:
+            processes = [self.process] + self.process.children(recursive=True)
+        except psutil.NoSuchProcess:
+            return
+        rss = browsers = 0
+        for process in processes:
+            try:
+                rss += process.memory_info().rss
+                name = process.name().lower()
+            except (psutil.NoSuchProcess, psutil.AccessDenied):
+                continue
+            browsers += any(marker in name for marker in BROWSER_PROCESS_MARKERS)
+        self.peak_rss = max(self.peak_rss, rss)
+        self.peak_browsers = max(self.peak_browsers, browsers)
+
+    async def _run(self):
+        while True:
+            self.sample()
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        self.peak_rss = self.peak_browsers = 0
+        if self.process is not None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> Dict[str, Optional[float]]:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self.sample()
+        if self.process is None:
+            return {"peak_rss_mb": None, "peak_browser_processes": None}
+        return {"peak_rss_mb": round(self.peak_rss / 2 ** 20, 1), "peak_browser_processes": self.peak_browsers}
+
+
+async def run_scenario(session: aiohttp.ClientSession, base_url: str, scenario: Dict[str, Any],
+                       requests: int, concurrency: int, sampler: ProcessSampler,
+                       timeout: float, first: int = 0) -> Dict[str, Any]:
+    latencies: List[float] = []
+    statuses: Dict[str, int] = {}
+    received = 0
+    next_index = 0
+    body: Callable[[int], Dict] = scenario["body"]
+
+    async def worker():
+        nonlocal next_index, received
+        while next_index < requests:
+            i = first + next_index
+            next_index += 1
+            start = time.perf_counter()
+            try:
+                async with session.post(base_url + scenario["path"], json=body(i),
+                                        timeout=aiohttp.ClientTimeout(total=timeout)) as response:
+                    payload = await response.read()
+                    status = str(response.status)
+                received += len(payload)
+            except asyncio.TimeoutError:
+                status = "timeout"
+            except aiohttp.ClientError as e:
+                status = type(e).__name__
+            latencies.append(time.perf_counter() - start)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    sampler.start()
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    processes = await sampler.stop()
+
+    latencies.sort()
+    ok = statuses.get("200", 0)
+    return {
+        "endpoint": scenario["path"],
+        "concurrency": concurrency,
+        "requests": requests,
+        "ok": ok,
+        "errors": requests - ok,
+        "status_codes": dict(sorted(statuses.items())),
+        "duration_s": round(elapsed, 3),
+        "throughput_rps": round(ok / elapsed, 3) if elapsed else None,
+        "latency_ms": {
+            "mean": round(sum(latencies) / len(latencies) * 1000, 1) if latencies else None,
+            **{f"p{int(q * 100)}": round(_percentile(latencies, q) * 1000, 1) if latencies else None
+               for q in (0.5, 0.9, 0.95, 0.99)},
+            "max": round(latencies[-1] * 1000, 1) if latencies else None,
+        },
+        "received_mb": round(received / 2 ** 20, 2),
+        **processes,
+    }
+
+
+def compare(report: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[Dict[str, Any]]:
+    regressions = []
+    for key, current in report["scenarios"].items():
+        previous = baseline.get("scenarios", {}).get(key)
+        if not previous:
+            continue
+        checks = [
+            ("throughput_rps", previous.get("throughput_rps"), current.get("throughput_rps"), -1),
+            ("p95_ms", previous.get("latency_ms", {}).get("p95"), current.get("latency_ms", {}).get("p95"), 1),
+        ]
+        for metric, before, after, direction in checks:
+            if not before or after is None:
+                continue
+            change = (after - before) / before
+            if change * direction > tolerance:
+                regressions.append({"scenario": key, "metric": metric, "baseline": before,
+                                    "current": after, "change": round(change, 3)})
+    return regressions
+
+
+async def _wait_until_up(url: str, process: Optional[subprocess.Popen], timeout: float):
+    deadline = time.monotonic() + timeout
+    async with aiohttp.ClientSession() as session:
+        while time.monotonic() < deadline:
+            if process is not None and process.poll() is not None:
+                raise RuntimeError(f"{url} exited with status {process.returncode} before answering")
+            try:
+                async with session.get(url, timeout=aiohttp.ClientTimeout(total=2)) as response:
+                    if response.status < 500:
+                        return
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up within {timeout}s")
+
+
+def _start(args: List[str], env: Dict[str, str]) -> subprocess.Popen:
+    return subprocess.Popen([sys.executable, "-m", *args], env=env, stdout=subprocess.DEVNULL)
+
+
+def _stop(process: Optional[subprocess.Popen]):
+    if process is None or process.poll() is not None:
+        return
+    process.terminate()
+    try:
+        process.wait(timeout=15)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+def _git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip() or None
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run(args) -> Dict[str, Any]:
+    fixture_port = args.fixture_port or _free_port()
+    site = f"http://{args.fixture_host}:{fixture_port}"
+    scenarios = _scenarios(site, args.huge_kb, args.slow_delay, args.multi_urls)
+    selected = args.scenarios.split(",") if args.scenarios else list(scenarios)
+    unknown = [name for name in selected if name not in scenarios]
+    if unknown:
+        raise SystemExit(f"Unknown scenarios: {', '.join(unknown)} (choose from {', '.join(scenarios)})")
+
+    fixture = service = None
+    data_dir = tempfile.TemporaryDirectory(prefix="bench-e2e-")
+    try:
+        fixture = _start(["benchmarks.fixture_site", "--host", args.fixture_host, "--port", str(fixture_port)],
+                         dict(os.environ))
+        await _wait_until_up(f"{site}/static/0", fixture, 30)
+
+        if args.base_url:
+            base_url, pid = args.base_url.rstrip("/"), args.service_pid
+        else:
+            port = _free_port()
+            env = dict(os.environ)
+            # Measure the crawl path, not per-client limits; every run learns render routing from scratch
+            env.setdefault("QUOTAS_ENABLED", "false")
+            env.setdefault("DATA_DIR", data_dir.name)
+            service = _start(["uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(port),
+                              "--log-level", "warning"], env)
+            base_url, pid = f"http://127.0.0.1:{port}", service.pid
+        await _wait_until_up(base_url + "/", service, 60)
+
+        sampler = ProcessSampler(pid)
+        report: Dict[str, Any] = {
+            "revision": _git_revision(),
+            "service_version": settings.VERSION,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "started_at": time.time(),
+            "options": {
+                "requests": args.requests, "concurrency": args.concurrency, "warmup": args.warmup,
+                "huge_kb": args.huge_kb, "slow_delay": args.slow_delay, "multi_urls": args.multi_urls,
+            },
+            "scenarios": {},
+        }
+        levels = [int(level) for level in args.concurrency.split(",")]
+        connector = aiohttp.TCPConnector(limit=0)
+        async with aiohttp.ClientSession(connector=connector) as session:
+            for name in selected:
+                if args.warmup:
+                    # Launch the browser and warm caches so the first level is not penalised
+                    await run_scenario(session, base_url, scenarios[name], args.warmup, 1,
+                                       ProcessSampler(None), args.timeout, first=WARMUP_FIRST_PAGE)
+                for level in levels:
+                    result = await run_scenario(session, base_url, scenarios[name], args.requests,
+                                                level, sampler, args.timeout)
+                    report["scenarios"][f"{name}@c{level}"] = result
+                    print(f"{name}@c{level}: {result['throughput_rps']} rps, "
+                          f"p95 {result['latency_ms']['p95']} ms, {result['errors']} errors", file=sys.stderr)
+        return report
+    finally:
+        _stop(service)
+        _stop(fixture)
+        data_dir.cleanup()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", help="Comma-separated scenario names (default: all)")
+    parser.add_argument("--concurrency", default="1,4", help="Comma-separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=20, help="Requests per scenario and level")
+    parser.add_argument("--warmup", type=int, default=2, help="Unmeasured requests before each scenario")
+    parser.add_argument("--timeout", type=float, default=180.0, help="Per-request client timeout (s)")
+    parser.add_argument("--huge-kb", type=int, default=4096)
+    parser.add_argument("--slow-delay", type=float, default=2.0)
+    parser.add_argument("--multi-urls", type=int, default=8)
+    parser.add_argument("--base-url", help="Benchmark a running service instead of starting one")
+    parser.add_argument("--service-pid", type=int, help="PID of the --base-url service, to sample its memory")
+    parser.add_argument("--fixture-host", default="127.0.0.1")
+    parser.add_argument("--fixture-port", type=int, default=0, help="Default: a free port")
+    parser.add_argument("--output", help="Also write the JSON report to this file")
+    parser.add_argument("--compare", help="Baseline report to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative change vs the baseline")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    regressions = []
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        report["regressions"] = regressions
+
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""
+Compare CSS extraction engines on a generated product-listing page.
+
+    python -m benchmarks.bench_extraction --products 2000
+
+Every schema below is first run through both engines and the outputs must
+be identical (the script exits non-zero otherwise), so this doubles as the
+parity check for the lxml engine. The schemas cover text, attribute,
+multi-valued attributes, regex, transforms, defaults, missing fields,
+nested, list and nested_list fields, scripts and comments inside items,
+and base elements nested inside each other.
+"""
+import argparse
+import json
+import random
+import sys
+import time
+
+from app.services.extraction import ExtractionEngine, LxmlExtractor, extract_items
+
+
+def build_page(products: int) -> str:
+    rng = random.Random(0)
+    words = ["alpha", "beta", "gamma", "delta", "&amp;", "ünïcode", "x<y", "  spaced  "]
+    cards = []
+    for i in range(products):
+        name = " ".join(rng.choices(words, k=3))
+        price = f"${rng.randint(1, 999)}.{rng.randint(0, 99):02d}" if i % 7 else "call us"
+        tags = "".join(f'<li class="tag t{j}">{rng.choice(words)}</li>' for j in range(rng.randint(0, 4)))
+        reviews = "".join(
+            f'<div class="review"><span class="stars" data-stars="{rng.randint(1, 5)}">★</span>'
+            f'<p class="body">{rng.choice(words)} <!-- hidden --> {rng.choice(words)}</p></div>'
+            for _ in range(rng.randint(0, 3))
+        )
+        extra = ""
+        if i % 5 == 0:
+            extra += f'<script>var sku = "S{i}";</script>'
+        if i % 11 == 0:
+            # A card nested inside a card: both are base elements
+            extra += f'<div class="product mini" data-id="m{i}"><h2 class="title">Mini {i}</h2></div>'
+        if i % 13 == 0:
+            extra += '<div class="seller"></div>'
+        elif i % 3:
+            extra += f'<div class="seller"><a class="name" href="/s/{i % 17}" rel="nofollow noopener">Seller {i % 17}</a></div>'
+        cards.append(
+            f'<div class="product {"sale" if i % 4 == 0 else ""}" data-id="p{i}">'
+            f'<h2 class="title"> <b>{name}</b> #{i}</h2>'
+            f'<span class="price">{price}</span>'
+            f'<a class="link" href="/product/{i}">details</a>'
+            f'<ul class="tags">{tags}</ul>{reviews}{extra}</div>'
+        )
+    return (
+        "<!DOCTYPE html><html><head><title>Catalog</title>"
+        "<style>.product { color: red }</style></head><body>"
+        f'<main id="catalog">{"".join(cards)}</main></body></html>'
+    )
+
+
+SCHEMAS = {
+    "flat": {
+        "name": "flat",
+        "baseSelector": "div.product",
+        "fields": [
+            {"name": "title", "selector": "h2.title", "type": "text"},
+            {"name": "price", "selector": ".price", "type": "text", "default": "n/a"},
+            {"name": "url", "selector": "a.link", "type": "attribute", "attribute": "href"},
+        ],
+    },
+    "pipeline": {
+        "name": "pipeline",
+        "baseSelector": "#catalog > div.product",
+        "baseFields": [
+            {"name": "id", "type": "attribute", "attribute": "data-id"},
+            {"name": "classes", "type": "attribute", "attribute": "class"},
+        ],
+        "fields": [
+            {"name": "amount", "selector": ".price", "type": "regex", "pattern": r"\$(\d+)\.(\d+)", "group": 2},
+            {"name": "title_upper", "selector": "h2", "type": "text", "transform": "uppercase"},
+            {"name": "title_words", "selector": "h2 b", "type": ["text", "regex"], "pattern": r"(\w+)"},
+            {"name": "script", "selector": "script", "type": "text", "default": ""},
+            {"name": "missing", "selector": ".does-not-exist", "type": "text"},
+            {"name": "rel", "selector": ".seller a", "type": "attribute", "attribute": "rel"},
+        ],
+    },
+    "nested": {
+        "name": "nested",
+        "baseSelector": "div.product",
+        "fields": [
+            {"name": "seller", "selector": ".seller", "type": "nested", "fields": [
+                {"name": "name", "selector": ".name", "type": "text", "transform": "lowercase"},
+                {"name": "href", "selector": "a", "type": "attribute", "attribute": "href"},
+            ]},
+            {"name": "tags", "selector": "li.tag", "type": "list", "fields": [
+                {"name": "label", "type": "text"},
+                {"name": "class", "type": "attribute", "attribute": "class"},
+            ]},
+            {"name": "reviews", "selector": ".review", "type": "nested_list", "fields": [
+                {"name": "stars", "selector": ".stars", "type": "attribute", "attribute": "data-stars"},
+                {"name": "body", "selector": "p.body", "type": "text"},
+                {"name": "meta", "selector": "p", "type": "nested", "fields": [
+                    {"name": "len", "type": "regex", "pattern": r"(\w+)"},
+                ]},
+            ]},
+        ],
+    },
+}
+
+
+def timed(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--products", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    html = build_page(args.products)
+    url = "https://example.com/catalog"
+    report = {"page_bytes": len(html.encode("utf-8")), "schemas": {}}
+    failed = False
+
+    for name, schema in SCHEMAS.items():
+        LxmlExtractor(schema)  # Raises if the schema would fall back to crawl4ai
+        reference = extract_items(schema, url, html, ExtractionEngine.CRAWL4AI)
+        fast = extract_items(schema, url, html, ExtractionEngine.LXML)
+        identical = reference == fast
+        failed |= not identical
+
+        crawl4ai_s = timed(lambda: extract_items(schema, url, html, ExtractionEngine.CRAWL4AI), args.repeat)
+        lxml_s = timed(lambda: extract_items(schema, url, html, ExtractionEngine.LXML), args.repeat)
+        report["schemas"][name] = {
+            "items": len(reference),
+            "identical": identical,
+            "crawl4ai_ms": round(crawl4ai_s * 1000, 2),
+            "lxml_ms": round(lxml_s * 1000, 2),
+            "speedup": round(crawl4ai_s / lxml_s, 2),
+            "lxml_pages_per_s": round(1 / lxml_s, 1),
+        }
+
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+    if failed:
+        sys.exit("lxml engine output differs from crawl4ai")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""
+Compare response encoding for a /crawl/multi-sized body.
+
+    python -m benchmarks.bench_serialization --pages 50 --page-kb 200
+
+"baseline" is FastAPI's default path (jsonable_encoder + stdlib json),
+"fast" is app.core.serialization.dumps. The event-loop section measures the
+longest stall seen by a 1 ms ticker while the body is encoded in one call
+vs through json_response (cooperative, per-item encoding for large bodies).
+"""
+import argparse
+import asyncio
+import json
+import random
+import string
+import time
+
+from fastapi.encoders import jsonable_encoder
+
+from app.core.serialization import dumps, json_response, orjson
+
+
+def build_body(pages: int, page_kb: int):
+    rng = random.Random(0)
+    words = ["".join(rng.choices(string.ascii_lowercase, k=rng.randint(2, 9))) for _ in range(2000)]
+
+    def text(kb):
+        out, size = [], 0
+        while size < kb * 1024:
+            word = rng.choice(words)
+            out.append(word)
+            size += len(word) + 1
+        return " ".join(out)
+
+    results = []
+    for i in range(pages):
+        results.append({
+            "url": f"https://example.com/page/{i}",
+            "success": True,
+            "data": {
+                "html": f"<html><body><p>{text(page_kb)}</p></body></html>",
+                "markdown": text(page_kb // 2),
+                "cleaned_html": f"<p>{text(page_kb // 2)}</p>",
+                "links": {"internal": [{"href": f"/page/{j}", "text": "next"} for j in range(50)], "external": []}
+            }
+        })
+    return {
+        "status": "success",
+        "mode": "parallel",
+        "summary": {"total_urls": pages, "successful": pages, "failed": 0},
+        "results": results
+    }
+
+
+def baseline(body):
+    return json.dumps(jsonable_encoder(body), ensure_ascii=False, allow_nan=False,
+                      indent=None, separators=(",", ":")).encode("utf-8")
+
+
+def timed(fn, body, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(body)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+async def max_loop_stall(encode):
+    stall = 0.0
+    done = asyncio.Event()
+
+    async def ticker():
+        nonlocal stall
+        last = time.perf_counter()
+        while not done.is_set():
+            await asyncio.sleep(0.001)
+            now = time.perf_counter()
+            stall = max(stall, now - last - 0.001)
+            last = now
+
+    task = asyncio.create_task(ticker())
+    await asyncio.sleep(0.01)
+    await encode()
+    done.set()
+    await task
+    return stall
+
+
+async def loop_stalls(body):
+    async def inline():
+        dumps(body)
+
+    async def cooperative():
+        await json_response(body)
+
+    return await max_loop_stall(inline), await max_loop_stall(cooperative)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=50)
+    parser.add_argument("--page-kb", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    body = build_body(args.pages, args.page_kb)
+    size = len(dumps(body))
+    baseline_s = timed(baseline, body, args.repeat)
+    fast_s = timed(dumps, body, args.repeat)
+    inline_stall, cooperative_stall = asyncio.run(loop_stalls(body))
+
+    print(json.dumps({
+        "encoder": "orjson" if orjson is not None else "json",
+        "body_bytes": size,
+        "baseline_ms": round(baseline_s * 1000, 2),
+        "fast_ms": round(fast_s * 1000, 2),
+        "cooperative_ms": round(timed(lambda b: asyncio.run(json_response(b)), body, args.repeat) * 1000, 2),
+        "speedup": round(baseline_s / fast_s, 2),
+        "baseline_mb_per_s": round(size / baseline_s / 1e6, 1),
+        "fast_mb_per_s": round(size / fast_s / 1e6, 1),
+        "max_loop_stall_inline_ms": round(inline_stall * 1000, 2),
+        "max_loop_stall_cooperative_ms": round(cooperative_stall * 1000, 2),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""
+Local fixture site for the end-to-end benchmarks. Pages are generated
+deterministically from their path, so runs are comparable without network
+access.
+
+    python -m benchmarks.fixture_site --port 8900
+
+    /static/{n}          server-rendered article with headings, text and links
+    /js/{n}              empty shell whose article is rendered by JavaScript
+    /huge/{n}?kb=4096    very large article, sent in chunks
+    /slow/{n}?delay=2    article sent after a delay (seconds)
+    /list/{page}         paginated product listing with a "next" link
+"""
+import argparse
+import asyncio
+import json
+import random
+
+from aiohttp import web
+
+WORDS = (
+    "crawl render browser latency queue budget page markdown schema extract "
+    "listing product price review stream chunk cache route domain header token"
+).split()
+LIST_PAGES = 50
+PRODUCTS_PER_PAGE = 40
+
+
+def _sentence(rng: random.Random, words: int = 14) -> str:
+    return " ".join(rng.choices(WORDS, k=words)).capitalize() + "."
+
+
+def _article(n: int, paragraphs: int) -> str:
+    rng = random.Random(n)
+    parts = [f"<h1>Article {n}</h1>"]
+    for i in range(paragraphs):
+        if i % 8 == 0:
+            parts.append(f"<h2>Section {i // 8 + 1}</h2>")
+        parts.append(f"<p>{' '.join(_sentence(rng) for _ in range(4))}</p>")
+    links = "".join(f'<li><a href="/static/{(n + k) % 1000}">Related {k}</a></li>' for k in range(1, 6))
+    return f"<article>{''.join(parts)}</article><ul class=\"related\">{links}</ul>"
+
+
+def _page(title: str, body: str, head: str = "") -> str:
+    return (
+        f"<!DOCTYPE html><html><head><meta charset=\"utf-8\"><title>{title}</title>{head}</head>"
+        f"<body><nav><a href=\"/list/1\">Catalog</a></nav><main>{body}</main>"
+        f"<footer>Fixture site</footer></body></html>"
+    )
+
+
+async def static_page(request: web.Request) -> web.Response:
+    n = int(request.match_info["n"])
+    return web.Response(text=_page(f"Static {n}", _article(n, 24)), content_type="text/html")
+
+
+async def js_page(request: web.Request) -> web.Response:
+    n = int(request.match_info["n"])
+    # The markup only exists once the script has run, so an HTTP-only fetch sees an empty page
+    script = (
+        "<script>document.addEventListener('DOMContentLoaded', function () {"
+        f"setTimeout(function () {{ document.getElementById('app').innerHTML = {json.dumps(_article(n, 24))}; }}, 50);"
+        "});</script>"
+    )
+    return web.Response(text=_page(f"Rendered {n}", '<div id="app"></div>', script), content_type="text/html")
+
+
+async def huge_page(request: web.Request) -> web.StreamResponse:
+    n = int(request.match_info["n"])
+    target = int(request.query.get("kb", "4096")) * 1024
+    chunk = _article(n, 64).encode("utf-8")
+    response = web.StreamResponse(headers={"Content-Type": "text/html; charset=utf-8"})
+    response.content_length = None
+    await response.prepare(request)
+    await response.write(f"<!DOCTYPE html><html><head><title>Huge {n}</title></head><body><main>".encode())
+    sent = 0
+    while sent < target:
+        await response.write(chunk)
+        sent += len(chunk)
+    await response.write(b"</main></body></html>")
+    await response.write_eof()
+    return response
+
+
+async def slow_page(request: web.Request) -> web.Response:
+    n = int(request.match_info["n"])
+    await asyncio.sleep(float(request.query.get("delay", "2")))
+    return web.Response(text=_page(f"Slow {n}", _article(n, 12)), content_type="text/html")
+
+
+async def list_page(request: web.Request) -> web.Response:
+    page = int(request.match_info["page"])
+    if not 1 <= page <= LIST_PAGES:
+        raise web.HTTPNotFound()
+    rng = random.Random(10_000 + page)
+    cards = []
+    for i in range(PRODUCTS_PER_PAGE):
+        pid = (page - 1) * PRODUCTS_PER_PAGE + i
+        tags = "".join(f'<li class="tag">{rng.choice(WORDS)}</li>' for _ in range(rng.randint(1, 3)))
+        cards.append(
+            f'<div class="product" data-id="{pid}">'
+            f'<h2 class="title">{" ".join(rng.choices(WORDS, k=3)).title()}</h2>'
+            f'<span class="price">${rng.randint(1, 500)}.{rng.randint(0, 99):02d}</span>'
+            f'<a class="link" href="/static/{pid % 1000}">details</a><ul class="tags">{tags}</ul></div>'
+        )
+    pager = f'<a class="next" href="/list/{page + 1}">Next</a>' if page < LIST_PAGES else ""
+    body = f'<section id="catalog">{"".join(cards)}</section>{pager}'
+    return web.Response(text=_page(f"Catalog page {page}", body), content_type="text/html")
+
+
+def build_app() -> web.Application:
+    app = web.Application()
+    app.router.add_get("/static/{n:\\d+}", static_page)
+    app.router.add_get("/js/{n:\\d+}", js_page)
+    app.router.add_get("/huge/{n:\\d+}", huge_page)
+    app.router.add_get("/slow/{n:\\d+}", slow_page)
+    app.router.add_get("/list/{page:\\d+}", list_page)
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    args = parser.parse_args()
+    web.run_app(build_app(), host=args.host, port=args.port, access_log=None, print=None)
+
+
+if __name__ == "__main__":
+    main()